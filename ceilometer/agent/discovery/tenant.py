@@ -33,3 +33,7 @@ class TenantDiscovery(plugin.DiscoveryBase):
     def discover(self, manager, param=None):
         tenants = manager.keystone.tenants.list()
         return tenants or []
+
+    @staticmethod
+    def resource_identity(resource):
+        return resource.id
@@ -23,6 +23,8 @@ import fnmatch
 import itertools
 import random
 
+import eventlet
+from eventlet import timeout
 from keystoneclient import exceptions as ks_exceptions
 from oslo_config import cfg
 from oslo_context import context
@@ -66,6 +68,19 @@ POLLING_OPTS = [
                     'config files. For each sub-group of the agent '
                     'pool with the same partitioning_group_prefix a disjoint '
                     'subset of pollsters should be loaded.'),
+    cfg.IntOpt('pollster_workers',
+               default=1,
+               min=1,
+               help='Maximum number of pollsters run concurrently by each '
+                    'polling task. Pollsters are run in green threads, so '
+                    'a slow pollster no longer delays the other pollsters '
+                    'of the same interval. 1 polls sequentially.'),
+    cfg.IntOpt('pollster_timeout',
+               default=0,
+               min=0,
+               help='Number of seconds a single pollster is allowed to run '
+                    'in a polling cycle before it is abandoned. Samples '
+                    'not yet sent are dropped. 0 means no timeout.'),
 ]
 
 cfg.CONF.register_opts(OPTS)
@@ -94,16 +109,17 @@ class Resources(object):
         self.agent_manager = agent_manager
         self._resources = []
         self._discovery = []
-        self.blacklist = []
+        self.blacklist = set()
         self.last_dup = []
 
     def setup(self, source):
         self._resources = source.resources
         self._discovery = source.discovery
 
-    def get(self, discovery_cache=None):
+    def get(self, discovery_cache=None, identities=None):
         source_discovery = (self.agent_manager.discover(self._discovery,
-                                                        discovery_cache)
+                                                        discovery_cache,
+                                                        identities)
                             if self._discovery else [])
         static_resources = []
         if self._resources:
@@ -139,6 +155,9 @@ class PollingTask(object):
 
         self._batch = cfg.CONF.batch_polled_samples
         self._telemetry_secret = cfg.CONF.publisher.telemetry_secret
+        self._timeout = cfg.CONF.polling.pollster_timeout
+        workers = cfg.CONF.polling.pollster_workers
+        self._pool = eventlet.GreenPool(workers) if workers > 1 else None
 
     def add(self, pollster, source):
         self.pollster_matches[source.name].add(pollster)
@@ -149,28 +168,29 @@ class PollingTask(object):
         """Polling sample and notify."""
         cache = {}
         discovery_cache = {}
+        identities = {}
         poll_history = {}
         for source_name in self.pollster_matches:
             for pollster in self.pollster_matches[source_name]:
                 key = Resources.key(source_name, pollster)
                 candidate_res = list(
-                    self.resources[key].get(discovery_cache))
+                    self.resources[key].get(discovery_cache, identities))
                 if not candidate_res and pollster.obj.default_discovery:
                     candidate_res = self.manager.discover(
-                        [pollster.obj.default_discovery], discovery_cache)
+                        [pollster.obj.default_discovery], discovery_cache,
+                        identities)
 
-                # Remove duplicated resources and black resources. Using
-                # set() requires well defined __hash__ for each resource.
-                # Since __eq__ is defined, 'not in' is safe here.
+                # Remove duplicated resources and black resources, both
+                # being tracked by resource identity.
                 polling_resources = []
                 black_res = self.resources[key].blacklist
-                history = poll_history.get(pollster.name, [])
+                history = poll_history.setdefault(pollster.name, set())
                 for x in candidate_res:
-                    if x not in history:
-                        history.append(x)
-                        if x not in black_res:
+                    identity = self._identity(identities, x)
+                    if identity not in history:
+                        history.add(identity)
+                        if identity not in black_res:
                             polling_resources.append(x)
-                poll_history[pollster.name] = history
 
                 # If no resources, skip for this pollster
                 if not polling_resources:
@@ -183,38 +203,80 @@ class PollingTask(object):
                 LOG.info(_LI("Polling pollster %(poll)s in the context of "
                              "%(src)s"),
                          dict(poll=pollster.name, src=source_name))
-                try:
-                    samples = pollster.obj.get_samples(
-                        manager=self.manager,
-                        cache=cache,
-                        resources=polling_resources
-                    )
-                    sample_batch = []
-
-                    for sample in samples:
-                        sample_dict = (
-                            publisher_utils.meter_message_from_counter(
-                                sample, self._telemetry_secret
-                            ))
-                        if self._batch:
-                            sample_batch.append(sample_dict)
-                        else:
-                            self._send_notification([sample_dict])
-
-                    if sample_batch:
-                        self._send_notification(sample_batch)
-
-                except plugin_base.PollsterPermanentError as err:
-                    LOG.error(_(
-                        'Prevent pollster %(name)s for '
-                        'polling source %(source)s anymore!')
-                        % ({'name': pollster.name, 'source': source_name}))
-                    self.resources[key].blacklist.extend(err.fail_res_list)
-                except Exception as err:
-                    LOG.warning(_(
-                        'Continue after error from %(name)s: %(error)s')
-                        % ({'name': pollster.name, 'error': err}),
-                        exc_info=True)
+                # NOTE: discovery always runs in the calling thread, so
+                # discovery_cache is never shared with the pollster threads.
+                # The sample cache is shared, pollsters only ever add
+                # entries to it.
+                if self._pool is None:
+                    self._poll_pollster(source_name, pollster, key, cache,
+                                        identities, polling_resources)
+                else:
+                    self._pool.spawn_n(self._poll_pollster, source_name,
+                                       pollster, key, cache, identities,
+                                       polling_resources)
+        if self._pool is not None:
+            self._pool.waitall()
+
+    @staticmethod
+    def _identity(identities, resource):
+        """Return the identity given to a resource by its discoverer."""
+        identity = identities.get(id(resource))
+        if identity is None:
+            identity = plugin_base.DiscoveryBase.resource_identity(resource)
+        return identity
+
+    def _poll_pollster(self, source_name, pollster, key, cache, identities,
+                       resources):
+        """Poll the resources of a single pollster and notify the samples.
+
+        The pollster is abandoned if it runs for longer than the
+        pollster_timeout option.
+        """
+        poll_timeout = (timeout.Timeout(self._timeout) if self._timeout
+                        else None)
+        try:
+            samples = pollster.obj.get_samples(
+                manager=self.manager,
+                cache=cache,
+                resources=resources
+            )
+            sample_batch = []
+
+            for sample in samples:
+                sample_dict = (
+                    publisher_utils.meter_message_from_counter(
+                        sample, self._telemetry_secret
+                    ))
+                if self._batch:
+                    sample_batch.append(sample_dict)
+                else:
+                    self._send_notification([sample_dict])
+
+            if sample_batch:
+                self._send_notification(sample_batch)
+
+        except timeout.Timeout as t:
+            if t is not poll_timeout:
+                raise
+            LOG.warning(_LW('Pollster %(name)s of polling source %(source)s '
+                            'timed out after %(timeout)s seconds'),
+                        {'name': pollster.name, 'source': source_name,
+                         'timeout': self._timeout})
+        except plugin_base.PollsterPermanentError as err:
+            LOG.error(_(
+                'Prevent pollster %(name)s for '
+                'polling source %(source)s anymore!')
+                % ({'name': pollster.name, 'source': source_name}))
+            self.resources[key].blacklist.update(
+                self._identity(identities, r) for r in err.fail_res_list)
+        except Exception as err:
+            LOG.warning(_(
+                'Continue after error from %(name)s: %(error)s')
+                % ({'name': pollster.name, 'error': err}),
+                exc_info=True)
+        finally:
+            if poll_timeout is not None:
+                poll_timeout.cancel()
 
     def _send_notification(self, samples):
         self.manager.notifier.sample(
@@ -431,7 +493,14 @@ class AgentManager(service_base.BaseService):
                 return d.obj
         return None
 
-    def discover(self, discovery=None, discovery_cache=None):
+    def discover(self, discovery=None, discovery_cache=None, identities=None):
+        """Discover resources from a list of discovery URLs.
+
+        When given, the identities dict is filled with the identity of each
+        discovered resource, as returned by its discoverer, keyed by the
+        id() of the resource. Discovered resources are kept alive by the
+        discovery cache for the duration of a polling cycle.
+        """
         resources = []
         discovery = discovery or []
         for url in discovery:
@@ -459,6 +528,10 @@ class AgentManager(service_base.BaseService):
                         self.construct_group_id(discoverer.group_id),
                         discovered)
                     resources.extend(partitioned)
+                    if identities is not None:
+                        for resource in partitioned:
+                            identities[id(resource)] = (
+                                discoverer.resource_identity(resource))
                     if discovery_cache is not None:
                         discovery_cache[url] = partitioned
                 except ks_exceptions.ClientException as e:
@@ -24,6 +24,7 @@ import oslo_messaging
 import six
 from stevedore import extension
 
+from ceilometer.i18n import _LE
 from ceilometer import messaging
 
 LOG = log.getLogger(__name__)
@@ -115,6 +116,26 @@ class NotificationBase(PluginBase):
         with self.manager.publisher(context) as p:
             p(list(self.process_notification(notification)))
 
+    def process_notifications(self, priority, notifications):
+        """Convert and publish a batch of notifications at once.
+
+        :param priority: priority of the notifications
+        :param notifications: list of notifications as given by a batch
+                              listener
+        """
+        samples = []
+        for n in notifications:
+            notification = messaging.convert_to_old_notification_format(
+                priority, n['ctxt'], n['publisher_id'], n['event_type'],
+                n['payload'], n['metadata'])
+            try:
+                samples.extend(self.process_notification(notification))
+            except Exception:
+                LOG.exception(_LE('Fail to process notification %s'),
+                              n['event_type'])
+        with self.manager.publisher(context.get_admin_context()) as p:
+            p(samples)
+
 
 class NonMetricNotificationBase(object):
     """Use to mark non-measurement meters
@@ -250,6 +271,26 @@ class DiscoveryBase(object):
         :param param: an optional parameter to guide the discovery
         """
 
+    @staticmethod
+    def resource_identity(resource):
+        """Return a stable and hashable identity of a discovered resource.
+
+        The polling task uses it to skip the resources already polled by a
+        pollster during a cycle and to remember the resources a pollster
+        gave up on. Hashable resources are their own identity, others fall
+        back to their string form, as used for workload partitioning.
+
+        This method can be overridden when the resources carry a cheaper or
+        more stable identifier, such as an id attribute.
+
+        :param resource: a resource returned by `discover`
+        """
+        try:
+            hash(resource)
+        except TypeError:
+            return str(resource)
+        return resource
+
     @property
     def group_id(self):
         """Return group id of this discovery.
@@ -13,7 +13,11 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
+import itertools
+import select
 import socket
+import threading
 
 import msgpack
 from oslo_config import cfg
@@ -22,10 +26,11 @@ import oslo_messaging
 from oslo_service import service as os_service
 from oslo_utils import netutils
 from oslo_utils import units
+from six import moves
 
 from ceilometer import dispatcher
 from ceilometer import messaging
-from ceilometer.i18n import _, _LE
+from ceilometer.i18n import _, _LE, _LI, _LW
 from ceilometer import utils
 
 OPTS = [
@@ -37,6 +42,47 @@ OPTS = [
                default=4952,
                min=1, max=65535,
                help='Port to which the UDP socket is bound.'),
+    cfg.BoolOpt('udp_reuse_port',
+                default=False,
+                help='Bind the UDP sockets with SO_REUSEPORT, so that the '
+                'kernel spreads the datagrams over the sockets of all the '
+                'collector workers. Requires Linux 3.9 or later.'),
+    cfg.IntOpt('udp_sockets',
+               default=1,
+               min=1,
+               help='Number of UDP sockets opened by each collector worker, '
+               'each one read by its own green thread. Only used when '
+               'udp_reuse_port is enabled. The datagrams are only decoded '
+               'in parallel by several collector workers, see the '
+               'workers option.'),
+    cfg.IntOpt('udp_rcvbuf',
+               default=0,
+               min=0,
+               help='Size in bytes of the kernel receive buffer of the UDP '
+               'sockets. 0 keeps the system default, values above '
+               'net.core.rmem_max are capped by the kernel.'),
+    cfg.IntOpt('udp_batch_size',
+               default=1,
+               min=1,
+               help='Maximum number of queued UDP datagrams read at once '
+               'from a socket. Their samples are handed to the dispatchers '
+               'in a single call.'),
+    cfg.IntOpt('udp_decode_workers',
+               default=0,
+               min=0,
+               help='Number of green threads decoding and dispatching the '
+               'received UDP datagrams, so that the sockets are read while '
+               'the dispatchers wait for the storage. They share the '
+               'process with the receiving threads and do not decode in '
+               'parallel, only udp_reuse_port with several collector '
+               'workers does. 0 decodes the datagrams in the receiving '
+               'thread.'),
+    cfg.IntOpt('udp_queue_size',
+               default=1000,
+               min=1,
+               help='Maximum number of datagram batches waiting for a decode '
+               'worker. Datagrams received while the queue is full are '
+               'dropped.'),
     cfg.BoolOpt('requeue_sample_on_dispatcher_error',
                 default=False,
                 help='Requeue the sample on the collector sample queue '
@@ -50,7 +96,28 @@ OPTS = [
                 default=False,
                 help='Enable the RPC functionality of collector. This '
                 'functionality is now deprecated in favour of notifier '
-                'publisher and queues.')
+                'publisher and queues.'),
+    cfg.IntOpt('batch_size',
+               default=1,
+               min=1,
+               help='Number of samples or events received from the message '
+               'queues that are buffered and handed to the dispatchers in a '
+               'single call. 1 disables the buffering.'),
+    cfg.FloatOpt('batch_timeout',
+                 default=1.0,
+                 help='Maximum number of seconds a sample or event stays in '
+                 'the buffer before being dispatched, even if batch_size is '
+                 'not reached.'),
+    cfg.IntOpt('batch_max_buffered',
+               default=10000,
+               min=1,
+               help='Maximum number of samples and events buffered or being '
+               'dispatched. The message listeners are blocked once it is '
+               'reached.'),
+    cfg.IntOpt('batch_workers',
+               default=1,
+               min=1,
+               help='Number of workers dispatching the buffered batches.'),
 ]
 
 cfg.CONF.register_opts(OPTS, group="collector")
@@ -76,6 +143,9 @@ class CollectorService(os_service.Service):
         self.rpc_server = None
         self.sample_listener = None
         self.event_listener = None
+        self.dispatcher_buffer = None
+        self._udp_counters = collections.Counter()
+        self._udp_counters_lock = threading.Lock()
         super(CollectorService, self).start()
 
         if cfg.CONF.collector.udp_address:
@@ -83,6 +153,16 @@ class CollectorService(os_service.Service):
 
         transport = messaging.get_transport(optional=True)
         if transport:
+            endpoint_dispatcher = self.dispatcher_manager
+            if cfg.CONF.collector.batch_size > 1:
+                self.dispatcher_buffer = DispatcherBuffer(
+                    self.dispatcher_manager,
+                    cfg.CONF.collector.batch_size,
+                    cfg.CONF.collector.batch_timeout,
+                    cfg.CONF.collector.batch_max_buffered,
+                    cfg.CONF.collector.batch_workers)
+                endpoint_dispatcher = self.dispatcher_buffer
+
             if cfg.CONF.collector.enable_rpc:
                 LOG.warning('RPC collector is deprecated in favour of queues. '
                             'Please switch to notifier publisher.')
@@ -93,7 +173,7 @@ class CollectorService(os_service.Service):
                 topic=cfg.CONF.publisher_notifier.metering_topic)
             self.sample_listener = messaging.get_notification_listener(
                 transport, [sample_target],
-                [SampleEndpoint(self.dispatcher_manager)],
+                [SampleEndpoint(endpoint_dispatcher)],
                 allow_requeue=(cfg.CONF.collector.
                                requeue_sample_on_dispatcher_error))
 
@@ -102,7 +182,7 @@ class CollectorService(os_service.Service):
                     topic=cfg.CONF.publisher_notifier.event_topic)
                 self.event_listener = messaging.get_notification_listener(
                     transport, [event_target],
-                    [EventEndpoint(self.dispatcher_manager)],
+                    [EventEndpoint(endpoint_dispatcher)],
                     allow_requeue=(cfg.CONF.collector.
                                    requeue_event_on_dispatcher_error))
                 self.event_listener.start()
@@ -116,39 +196,139 @@ class CollectorService(os_service.Service):
                 self.tg.add_timer(604800, lambda: None)
 
     def start_udp(self):
+        conf = cfg.CONF.collector
+        sockets = [self._udp_socket()
+                   for _ in range(conf.udp_sockets
+                                  if conf.udp_reuse_port else 1)]
+
+        self.udp_run = True
+        process = self._udp_process
+        if conf.udp_decode_workers:
+            self._udp_queue = moves.queue.Queue(conf.udp_queue_size)
+            process = self._udp_enqueue
+            for _ in range(conf.udp_decode_workers):
+                self._udp_thread(self._udp_decode_worker)
+        for udp in sockets[1:]:
+            self._udp_thread(self._udp_receive, udp, process)
+        self._udp_receive(sockets[0], process)
+
+    @staticmethod
+    def _udp_thread(target, *args):
+        # NOTE: these are green threads once the collector is monkey
+        # patched, they stop with the udp_run flag rather than with self.tg.
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+
+    @staticmethod
+    def _udp_socket():
+        conf = cfg.CONF.collector
         address_family = socket.AF_INET
-        if netutils.is_valid_ipv6(cfg.CONF.collector.udp_address):
+        if netutils.is_valid_ipv6(conf.udp_address):
             address_family = socket.AF_INET6
         udp = socket.socket(address_family, socket.SOCK_DGRAM)
         udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        udp.bind((cfg.CONF.collector.udp_address,
-                  cfg.CONF.collector.udp_port))
+        if conf.udp_reuse_port:
+            if hasattr(socket, 'SO_REUSEPORT'):
+                udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            else:
+                LOG.warning(_LW('UDP: SO_REUSEPORT is not supported on this '
+                                'platform, udp_reuse_port is ignored.'))
+        if conf.udp_rcvbuf:
+            udp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                           conf.udp_rcvbuf)
+        udp.bind((conf.udp_address, conf.udp_port))
+        return udp
 
-        self.udp_run = True
+    def _udp_receive(self, udp, process):
+        batch_size = cfg.CONF.collector.udp_batch_size
         while self.udp_run:
-            # NOTE(jd) Arbitrary limit of 64K because that ought to be
+            # NOTE: Arbitrary limit of 64K because that ought to be
             # enough for anybody.
-            data, source = udp.recvfrom(64 * units.Ki)
+            datagrams = [udp.recvfrom(64 * units.Ki)]
+            # Python has no recvmmsg(), drain what is already queued on
+            # the socket instead of going back to sleep for each datagram.
+            while (len(datagrams) < batch_size and
+                   select.select([udp], [], [], 0)[0]):
+                datagrams.append(udp.recvfrom(64 * units.Ki))
+            self._udp_count('received', len(datagrams))
+            process(datagrams)
+
+    def _udp_enqueue(self, datagrams):
+        try:
+            self._udp_queue.put_nowait(datagrams)
+        except moves.queue.Full:
+            self._udp_count('dropped', len(datagrams))
+
+    def _udp_decode_worker(self):
+        while True:
+            try:
+                datagrams = self._udp_queue.get(timeout=1)
+            except moves.queue.Empty:
+                if not self.udp_run:
+                    return
+                continue
+            self._udp_process(datagrams)
+
+    def _udp_process(self, datagrams):
+        decoded = []
+        for data, source in datagrams:
             try:
-                sample = msgpack.loads(data, encoding='utf-8')
+                # NOTE: a datagram holds either a single metering message or,
+                # when sent by a batching publisher, an array of them, which
+                # is handed to the dispatchers in one call.
+                decoded.append(msgpack.loads(data, encoding='utf-8'))
             except Exception:
                 LOG.warn(_("UDP: Cannot decode data sent by %s"), source)
-            else:
-                try:
-                    LOG.debug("UDP: Storing %s", sample)
-                    self.dispatcher_manager.map_method('record_metering_data',
-                                                       sample)
-                except Exception:
-                    LOG.exception(_("UDP: Unable to store meter"))
+                self._udp_count('failed')
+        if not decoded:
+            return
+        self._udp_count('decoded', len(decoded))
+
+        if len(decoded) == 1:
+            sample = decoded[0]
+        else:
+            sample = list(itertools.chain.from_iterable(
+                s if isinstance(s, list) else [s] for s in decoded))
+        try:
+            LOG.debug("UDP: Storing %s", sample)
+            self.dispatcher_manager.map_method('record_metering_data',
+                                               sample)
+        except Exception:
+            LOG.exception(_("UDP: Unable to store meter"))
+            self._udp_count('failed', len(decoded))
+
+    def _udp_count(self, counter, value=1):
+        with self._udp_counters_lock:
+            self._udp_counters[counter] += value
+
+    def udp_stats(self):
+        """Return the counters of the UDP datagrams handled by the service.
+
+        received: datagrams read from the sockets
+        decoded: datagrams successfully decoded
+        dropped: datagrams dropped because the decode queue was full
+        failed: datagrams which could not be decoded or stored
+        """
+        with self._udp_counters_lock:
+            return dict((counter, self._udp_counters[counter])
+                        for counter in ('received', 'decoded', 'dropped',
+                                        'failed'))
 
     def stop(self):
         self.udp_run = False
+        if cfg.CONF.collector.udp_address:
+            LOG.info(_LI('UDP: datagrams received: %(received)d, decoded: '
+                         '%(decoded)d, dropped: %(dropped)d, failed: '
+                         '%(failed)d'), self.udp_stats())
         if cfg.CONF.collector.enable_rpc and self.rpc_server:
             self.rpc_server.stop()
         if self.sample_listener:
             utils.kill_listeners([self.sample_listener])
         if self.event_listener:
             utils.kill_listeners([self.event_listener])
+        if self.dispatcher_buffer:
+            self.dispatcher_buffer.stop()
         super(CollectorService, self).stop()
 
     def record_metering_data(self, context, data):
@@ -160,6 +340,108 @@ class CollectorService(os_service.Service):
         self.dispatcher_manager.map_method('record_metering_data', data=data)
 
 
+class _Batch(object):
+    def __init__(self):
+        self.items = []
+        self.done = threading.Event()
+        self.error = None
+
+
+class DispatcherBuffer(object):
+    """Buffer the data sent to the dispatchers to dispatch it in batches.
+
+    It is meant to be used in place of the dispatcher manager by the
+    collector endpoints. The data of each dispatcher method is accumulated
+    until batch_size items are buffered or the oldest one waited for
+    batch_timeout seconds, and the batch is then handed to the dispatchers
+    in one call by a pool of workers.
+
+    Callers are blocked until their batch has been dispatched and get the
+    dispatch error back, so that the source messages can still be requeued.
+    They are also blocked before buffering anything while max_buffered
+    items are waiting to be dispatched.
+    """
+
+    def __init__(self, dispatcher_manager, batch_size, batch_timeout,
+                 max_buffered, workers):
+        self.dispatcher_manager = dispatcher_manager
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.max_buffered = max_buffered
+        self._buffered = 0
+        self._batches = {}
+        self._ready = []
+        self._running = True
+        self._cond = threading.Condition()
+        self._workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._dispatch_batches)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def map_method(self, method, data):
+        items = data if isinstance(data, list) else [data]
+        with self._cond:
+            # NOTE: always accept data when nothing is buffered, whatever
+            # its size, otherwise it would never be dispatched
+            while (self._running and self._buffered and
+                   self._buffered + len(items) > self.max_buffered):
+                self._cond.wait()
+            if not self._running:
+                raise RuntimeError('dispatcher buffer is stopped')
+            batch = self._batches.get(method)
+            if batch is None:
+                batch = self._batches[method] = _Batch()
+            batch.items.extend(items)
+            self._buffered += len(items)
+            if len(batch.items) >= self.batch_size:
+                self._seal(method)
+
+        if not batch.done.wait(self.batch_timeout):
+            with self._cond:
+                if self._batches.get(method) is batch:
+                    self._seal(method)
+            batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+
+    def _seal(self, method):
+        # must be called with self._cond held
+        self._ready.append((method, self._batches.pop(method)))
+        self._cond.notify_all()
+
+    def _dispatch_batches(self):
+        while True:
+            with self._cond:
+                while self._running and not self._ready:
+                    self._cond.wait()
+                if not self._ready:
+                    return
+                method, batch = self._ready.pop(0)
+            try:
+                self.dispatcher_manager.map_method(method, batch.items)
+            except Exception as err:
+                LOG.exception(_LE("Dispatcher failed to handle a batch of "
+                                  "%d items"), len(batch.items))
+                batch.error = err
+            finally:
+                with self._cond:
+                    self._buffered -= len(batch.items)
+                    self._cond.notify_all()
+                batch.done.set()
+
+    def stop(self):
+        """Dispatch the buffered data and stop the workers."""
+        with self._cond:
+            for method in list(self._batches):
+                self._seal(method)
+            self._running = False
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+
 class CollectorEndpoint(object):
     def __init__(self, dispatcher_manager, requeue_on_error):
         self.dispatcher_manager = dispatcher_manager
@@ -55,6 +55,10 @@ class InstanceDiscovery(plugin_base.DiscoveryBase):
         self.last_run = timeutils.utcnow(True).isoformat()
         return self.instances.values()
 
+    @staticmethod
+    def resource_identity(resource):
+        return resource.id
+
     @property
     def group_id(self):
         if cfg.CONF.compute.workload_partitioning:
@@ -13,8 +13,10 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
 import fnmatch
 import os
+import re
 
 from jsonpath_rw_ext import parser
 from oslo_config import cfg
@@ -25,6 +27,8 @@ import yaml
 
 from ceilometer.event.storage import models
 from ceilometer.i18n import _, _LI
+from ceilometer import jsonpath_utils
+from ceilometer import utils
 
 OPTS = [
     cfg.StrOpt('definitions_cfg_file',
@@ -39,7 +43,11 @@ OPTS = [
                     default=[],
                     help='Store the raw notification for select priority '
                     'levels (info and/or error). By default, raw details are '
-                    'not captured.')
+                    'not captured.'),
+    cfg.IntOpt('definitions_cache_size',
+               default=1024,
+               help='Number of event types for which the matching event '
+               'definition is cached. 0 disables the cache.'),
 ]
 
 cfg.CONF.register_opts(OPTS, group='event')
@@ -114,28 +122,24 @@ class TraitDefinition(object):
                 _("Parse error in JSONPath specification "
                   "'%(jsonpath)s' for %(trait)s: %(err)s")
                 % dict(jsonpath=fields, trait=name, err=e), self.cfg)
+        # NOTE: the match paths are only needed by the trait plugins
+        self._find = jsonpath_utils.compile_path(
+            self.fields, with_paths=self.plugin is not None)
         self.trait_type = models.Trait.get_type_by_name(type_name)
         if self.trait_type is None:
             raise EventDefinitionException(
                 _("Invalid trait type '%(type)s' for trait %(trait)s")
                 % dict(type=type_name, trait=name), self.cfg)
 
-    def _get_path(self, match):
-        if match.context is not None:
-            for path_element in self._get_path(match.context):
-                yield path_element
-            yield str(match.path)
-
     def to_trait(self, notification_body):
-        values = [match for match in self.fields.find(notification_body)
-                  if match.value is not None]
-
         if self.plugin is not None:
-            value_map = [('.'.join(self._get_path(match)), match.value) for
-                         match in values]
+            value_map = [(path, value) for path, value
+                         in self._find(notification_body)
+                         if value is not None]
             value = self.plugin.trait_value(value_map)
         else:
-            value = values[0].value if values else None
+            value = next((value for value in self._find(notification_body)
+                          if value is not None), None)
 
         if value is None:
             return None
@@ -190,6 +194,12 @@ class EventDefinition(object):
         if self._excluded_types and not self._included_types:
             self._included_types.append('*')
 
+        self.exact_types = [t for t in self._included_types
+                            if not self._is_wildcard(t)]
+        self.has_wildcard = len(self.exact_types) < len(self._included_types)
+        self._included_regex = self._compile(self._included_types)
+        self._excluded_regex = self._compile(self._excluded_types)
+
         for trait_name in self.DEFAULT_TRAITS:
             self.traits[trait_name] = TraitDefinition(
                 trait_name,
@@ -201,17 +211,25 @@ class EventDefinition(object):
                 traits[trait_name],
                 trait_plugin_mgr)
 
+    @staticmethod
+    def _is_wildcard(pattern):
+        return any(c in pattern for c in '*?[')
+
+    @staticmethod
+    def _compile(patterns):
+        """Compile a list of shell wildcard patterns into a single regex."""
+        if not patterns:
+            return None
+        return re.compile('|'.join('(?:%s)' % fnmatch.translate(p)
+                                   for p in patterns))
+
     def included_type(self, event_type):
-        for t in self._included_types:
-            if fnmatch.fnmatch(event_type, t):
-                return True
-        return False
+        return bool(self._included_regex and
+                    self._included_regex.match(event_type))
 
     def excluded_type(self, event_type):
-        for t in self._excluded_types:
-            if fnmatch.fnmatch(event_type, t):
-                return True
-        return False
+        return bool(self._excluded_regex and
+                    self._excluded_regex.match(event_type))
 
     def match_type(self, event_type):
         return (self.included_type(event_type)
@@ -343,14 +361,46 @@ class NotificationEventsConverter(object):
             self.definitions.append(EventDefinition(event_def,
                                                     trait_plugin_mgr))
 
+        # Index the definitions, the first matching definition wins:
+        # - event types listed literally map to the definitions listing them,
+        # - definitions with wildcards are kept in order and tried one by
+        #   one, up to the first exact match.
+        self._exact_types = collections.defaultdict(list)
+        self._wildcard_definitions = []
+        for index, d in enumerate(self.definitions):
+            for t in d.exact_types:
+                self._exact_types[t].append(index)
+            if d.has_wildcard:
+                self._wildcard_definitions.append(index)
+        self._cache = utils.LRUCache(cfg.CONF.event.definitions_cache_size)
+
+    def _match_definition(self, event_type):
+        best = len(self.definitions)
+        for index in self._exact_types.get(event_type, ()):
+            if not self.definitions[index].excluded_type(event_type):
+                best = index
+                break
+        for index in self._wildcard_definitions:
+            if index >= best:
+                break
+            if self.definitions[index].match_type(event_type):
+                best = index
+                break
+        return self.definitions[best] if best < len(self.definitions) else None
+
+    def find_definition(self, event_type):
+        """Return the event definition handling an event type, if any."""
+        edef = self._cache.get(event_type)
+        if edef is None:
+            # False records that no definition matches
+            edef = self._match_definition(event_type) or False
+            self._cache[event_type] = edef
+        return edef or None
+
     def to_event(self, notification_body):
         event_type = notification_body['event_type']
         message_id = notification_body['message_id']
-        edef = None
-        for d in self.definitions:
-            if d.match_type(event_type):
-                edef = d
-                break
+        edef = self.find_definition(event_type)
 
         if edef is None:
             msg = (_('Dropping Notification %(type)s (uuid:%(msgid)s)')
@@ -80,3 +80,28 @@ class EventsNotificationEndpoint(object):
                 return oslo_messaging.NotificationResult.REQUEUE
             raise
         return oslo_messaging.NotificationResult.HANDLED
+
+    def process_notifications(self, priority, notifications):
+        """Convert a batch of notifications and publish the events at once.
+
+        :param priority: priority of the notifications
+        :param notifications: list of notifications as given by a batch
+                              listener
+        """
+        try:
+            events = []
+            for n in notifications:
+                notification = messaging.convert_to_old_notification_format(
+                    priority, n['ctxt'], n['publisher_id'], n['event_type'],
+                    n['payload'], n['metadata'])
+                event = self.event_converter.to_event(notification)
+                if event is not None:
+                    events.append(event)
+            if events:
+                with self.manager.publisher(self.ctxt) as p:
+                    p(events)
+        except Exception:
+            if not cfg.CONF.notification.ack_on_event_error:
+                return oslo_messaging.NotificationResult.REQUEUE
+            raise
+        return oslo_messaging.NotificationResult.HANDLED
@@ -14,6 +14,7 @@
 """SQLAlchemy storage backend."""
 
 from __future__ import absolute_import
+import collections
 import datetime
 import os
 
@@ -135,6 +136,8 @@ class Connection(base.Connection):
             self.isolation_level = 'SERIALIZABLE'
         else:
             self.isolation_level = 'REPEATABLE READ'
+        # NOTE: event types are few, all of their ids are kept
+        self._event_type_ids = {}
 
     def upgrade(self):
         # NOTE(gordc): to minimise memory, only import migration when needed
@@ -149,6 +152,7 @@ class Connection(base.Connection):
         for table in reversed(models.Base.metadata.sorted_tables):
             engine.execute(table.delete())
         engine.dispose()
+        self._event_type_ids.clear()
 
     def _get_or_create_event_type(self, event_type, session=None):
         """Check if an event type with the supplied name is already exists.
@@ -165,11 +169,129 @@ class Connection(base.Connection):
                 session.add(et)
         return et
 
+    def _get_event_type_ids(self, names):
+        """Resolve the ids of a set of event types.
+
+        The missing event types are created in their own transaction.
+
+        :param names: set of event type names
+        :return: dict mapping each event type name to its id
+        """
+        type_ids = {}
+        missing = set()
+        for name in names:
+            type_id = self._event_type_ids.get(name)
+            if type_id is None:
+                missing.add(name)
+            else:
+                type_ids[name] = type_id
+        if not missing:
+            return type_ids
+
+        event_type = models.EventType.__table__
+        engine = self._engine_facade.get_engine()
+
+        def _lookup(conn):
+            rows = conn.execute(
+                sa.select([event_type.c.id, event_type.c.desc])
+                .where(event_type.c.desc.in_(missing)))
+            for type_id, name in rows:
+                type_ids[name] = type_id
+
+        try:
+            with engine.begin() as conn:
+                _lookup(conn)
+                new = missing - set(type_ids)
+                if new:
+                    conn.execute(event_type.insert(),
+                                 [{'desc': name} for name in new])
+                    _lookup(conn)
+        except dbexc.DBDuplicateEntry:
+            # a concurrent writer created some of the event types, look
+            # them up again in a new transaction
+            with engine.begin() as conn:
+                _lookup(conn)
+        # only cache ids once they are committed
+        for name in missing:
+            self._event_type_ids[name] = type_ids[name]
+        return type_ids
+
     def record_events(self, event_models):
         """Write the events to SQL database via sqlalchemy.
 
+        The event types of the batch are resolved at once, then the events
+        are inserted with a single statement and their traits with one
+        statement per trait table. Should that fail, the events are recorded
+        one at a time so that only the faulty ones are skipped.
+
         :param event_models: a list of model.Event objects.
         """
+        if not event_models:
+            return
+        try:
+            self._record_events_batch(event_models)
+        except Exception as e:
+            LOG.debug('Failed to record events at once, recording them one '
+                      'at a time: %s', e)
+            # the cached event type ids may refer to event types expired
+            # by another process
+            self._event_type_ids.clear()
+            self._record_events_one_by_one(event_models)
+
+    def _record_events_batch(self, event_models):
+        events = collections.OrderedDict()
+        traits = []
+        duplicates = []
+        for event_model in event_models:
+            message_id = event_model.message_id
+            if message_id in events:
+                duplicates.append(message_id)
+                continue
+            events[message_id] = (event_model.event_type,
+                                  event_model.generated, event_model.raw)
+            for trait in event_model.traits or []:
+                traits.append((message_id, TRAIT_ID_TO_MODEL[trait.dtype],
+                               trait.name, trait.value))
+        type_ids = self._get_event_type_ids(
+            set(event_type for event_type, generated, raw
+                in events.values()))
+
+        event = models.Event.__table__
+        engine = self._engine_facade.get_engine()
+        with engine.begin() as conn:
+            # skip the events already recorded rather than failing on them
+            for message_id, in conn.execute(
+                    sa.select([event.c.message_id])
+                    .where(event.c.message_id.in_(list(events)))):
+                duplicates.append(message_id)
+                del events[message_id]
+            if events:
+                conn.execute(event.insert(),
+                             [{'message_id': message_id,
+                               'event_type_id': type_ids[event_type],
+                               'generated': generated,
+                               'raw': raw}
+                              for message_id, (event_type, generated, raw)
+                              in events.items()])
+                event_ids = dict(
+                    (message_id, event_id) for event_id, message_id
+                    in conn.execute(
+                        sa.select([event.c.id, event.c.message_id])
+                        .where(event.c.message_id.in_(list(events)))))
+                trait_map = collections.defaultdict(list)
+                for message_id, model, key, value in traits:
+                    if message_id in event_ids:
+                        trait_map[model].append(
+                            {'event_id': event_ids[message_id],
+                             'key': key,
+                             'value': value})
+                for model, rows in trait_map.items():
+                    conn.execute(model.__table__.insert(), rows)
+        for message_id in duplicates:
+            LOG.info(_LI("Duplicate event detected, skipping it: %s")
+                     % message_id)
+
+    def _record_events_one_by_one(self, event_models):
         session = self._engine_facade.get_session()
         error = None
         for event_model in event_models:
@@ -438,3 +560,4 @@ class Connection(base.Connection):
              .filter(~models.EventType.events.any())
              .delete(synchronize_session="fetch"))
             LOG.info(_LI("%d events are removed from database"), event_rows)
+        self._event_type_ids.clear()
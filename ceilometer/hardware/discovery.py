@@ -49,6 +49,10 @@ class NodesDiscoveryTripleO(plugin_base.DiscoveryBase):
     def _address(instance, field):
         return instance.addresses['ctlplane'][0].get(field)
 
+    @staticmethod
+    def resource_identity(resource):
+        return resource['resource_id']
+
     def discover(self, manager, param=None):
         """Discover resources to monitor.
 
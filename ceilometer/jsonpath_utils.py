@@ -0,0 +1,197 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Compilation of simple JSONPath expressions into plain getters.
+
+Most of the paths used by the event and meter definitions are dotted field
+lookups like ``payload.tenant_id``, possibly with ``|`` alternatives or
+index access. Walking them through the generic jsonpath-rw ``find`` for
+every notification is costly, so they are compiled once into closures
+returning the same matches, in the same order, as jsonpath-rw would.
+Expressions using anything else (wildcards, slices, filters, ...) keep
+using jsonpath-rw.
+"""
+
+from jsonpath_rw import jsonpath
+
+
+class UnsupportedPath(Exception):
+    pass
+
+
+def _fields_step(names):
+    def step(matches):
+        found = []
+        for path, value in matches:
+            for name in names:
+                try:
+                    # NOTE: do not use get(), for jsonpath-rw a None value
+                    # is still a match
+                    field_value = value[name]
+                except (TypeError, KeyError, AttributeError):
+                    continue
+                found.append((path + (name,) if path is not None else None,
+                              field_value))
+        return found
+    return step
+
+
+def _dotted_step(names):
+    def step(matches):
+        found = []
+        for path, value in matches:
+            try:
+                for name in names:
+                    value = value[name]
+            except (TypeError, KeyError, AttributeError):
+                continue
+            found.append((path + names if path is not None else None, value))
+        return found
+    return step
+
+
+def _index_step(index):
+    element = '[%i]' % index
+
+    def step(matches):
+        found = []
+        for path, value in matches:
+            # NOTE: same semantic as jsonpath-rw, including the exceptions
+            # raised on values without a length or on mappings
+            if len(value) > index:
+                found.append((path + (element,) if path is not None else None,
+                              value[index]))
+        return found
+    return step
+
+
+def _dotted_names(node, top=False):
+    """Return the field names of a chain of single field lookups."""
+    if type(node) is jsonpath.Fields:
+        if len(node.fields) == 1 and node.fields[0] != '*':
+            return tuple(node.fields)
+    elif type(node) is jsonpath.Root and top:
+        return ()
+    elif type(node) is jsonpath.Child:
+        left = _dotted_names(node.left, top)
+        right = _dotted_names(node.right)
+        if left is not None and right is not None:
+            return left + right
+    return None
+
+
+def _compile(node, top):
+    names = _dotted_names(node, top)
+    if names is not None:
+        return _dotted_step(names)
+    node_type = type(node)
+    if node_type is jsonpath.Fields:
+        if '*' in node.fields:
+            raise UnsupportedPath(node)
+        return _fields_step(tuple(node.fields))
+    if node_type is jsonpath.Index:
+        return _index_step(node.index)
+    if node_type is jsonpath.Root and top:
+        # NOTE: the root of the document only contributes to the path when
+        # it is the start of the expression, where matches are the document
+        return lambda matches: matches
+    if node_type is jsonpath.Child:
+        left = _compile(node.left, top)
+        right = _compile(node.right, False)
+        return lambda matches: right(left(matches))
+    if node_type is jsonpath.Union:
+        left = _compile(node.left, top)
+        right = _compile(node.right, top)
+        return lambda matches: left(matches) + right(matches)
+    raise UnsupportedPath(node)
+
+
+def compile_path(path, with_paths=False):
+    """Compile a parsed JSONPath expression into a getter.
+
+    The getter takes a document and returns the list of the matching
+    values or, if with_paths is set, of (path, value) tuples where path is
+    the dotted path of the match as built from the jsonpath-rw matches.
+    Expressions not supported by the compiler fall back to path.find().
+    """
+    try:
+        step = _compile(path, True)
+    except UnsupportedPath:
+        if with_paths:
+            return lambda data: [('.'.join(_match_path(match)), match.value)
+                                 for match in path.find(data)]
+        return lambda data: [match.value for match in path.find(data)]
+
+    if with_paths:
+        return lambda data: [('.'.join(p), value)
+                             for p, value in step([((), data)])]
+    return lambda data: [value for p, value in step([(None, data)])]
+
+
+def compile_plan(paths):
+    """Compile several parsed JSONPath expressions into a single getter.
+
+    paths maps names to parsed expressions. The getter takes a document
+    and returns a dict mapping each name to the list of its matching
+    values, names without match being left out. The dotted field lookups
+    are merged into a tree so that the document is walked once for all of
+    them, whatever their number.
+    """
+    tree = {}
+    getters = {}
+    for name, path in paths.items():
+        names = _dotted_names(path, True)
+        if names:
+            node = (None, tree)
+            for field in names:
+                node = node[1].setdefault(field, ([], {}))
+            node[0].append(name)
+        else:
+            getters[name] = compile_path(path)
+
+    def walk(children, value, found):
+        for field, (names, grandchildren) in children.items():
+            try:
+                field_value = value[field]
+            except (TypeError, KeyError, AttributeError):
+                continue
+            for name in names:
+                found[name] = [field_value]
+            if grandchildren:
+                walk(grandchildren, field_value, found)
+
+    def plan(data):
+        found = {}
+        walk(tree, data, found)
+        for name, getter in getters.items():
+            values = getter(data)
+            if values:
+                found[name] = values
+        return found
+    return plan
+
+
+def is_compiled(path):
+    """Return whether a parsed JSONPath expression can be compiled."""
+    try:
+        _compile(path, True)
+    except UnsupportedPath:
+        return False
+    return True
+
+
+def _match_path(match):
+    if match.context is not None:
+        for path_element in _match_path(match.context):
+            yield path_element
+        yield str(match.path)
@@ -13,12 +13,16 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import functools
+
 from oslo_config import cfg
 import oslo_messaging
 from oslo_messaging import serializer as oslo_serializer
 
 DEFAULT_URL = "__default__"
 TRANSPORTS = {}
+NOTIFICATION_PRIORITIES = ['audit', 'debug', 'info', 'warn', 'error',
+                           'critical', 'sample']
 
 
 def setup():
@@ -83,6 +87,47 @@ def get_notification_listener(transport, targets, endpoints,
         allow_requeue=allow_requeue)
 
 
+def get_batch_notification_listener(transport, targets, endpoints,
+                                    allow_requeue=False, batch_size=1,
+                                    batch_timeout=None):
+    """Return a configured oslo_messaging batch notification listener.
+
+    The endpoints are wrapped so that each of them gets the notifications
+    of a batch at once, see BatchNotificationEndpoint.
+    """
+    if not hasattr(oslo_messaging, 'get_batch_notification_listener'):
+        raise cfg.Error('[notification] batch_size above 1 requires '
+                        'oslo.messaging 4.5.0 or later for the batch '
+                        'notification listeners, lower it to 1 or '
+                        'upgrade oslo.messaging.')
+    return oslo_messaging.get_batch_notification_listener(
+        transport, targets,
+        [BatchNotificationEndpoint(endpoint) for endpoint in endpoints],
+        executor='eventlet', allow_requeue=allow_requeue,
+        batch_size=batch_size, batch_timeout=batch_timeout)
+
+
+class BatchNotificationEndpoint(object):
+    """Endpoint of a batch listener for a notification endpoint.
+
+    A batch listener calls its endpoints with a list of notifications, each
+    of them a dict with the ctxt, publisher_id, event_type, payload and
+    metadata keys. They are given to the process_notifications(priority,
+    notifications) method of the wrapped endpoint, for the priorities the
+    wrapped endpoint handles.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        filter_rule = getattr(endpoint, 'filter_rule', None)
+        if filter_rule is not None:
+            self.filter_rule = filter_rule
+        for priority in NOTIFICATION_PRIORITIES:
+            if callable(getattr(endpoint, priority, None)):
+                setattr(self, priority, functools.partial(
+                    endpoint.process_notifications, priority))
+
+
 def get_notifier(transport, publisher_id):
     """Return a configured oslo_messaging notifier."""
     serializer = oslo_serializer.RequestContextSerializer(
@@ -11,8 +11,8 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
 import fnmatch
-import functools
 import itertools
 import os
 import pkg_resources
@@ -26,13 +26,19 @@ import oslo_messaging
 
 from ceilometer.agent import plugin_base
 from ceilometer.i18n import _LE, _LI
+from ceilometer import jsonpath_utils
 from ceilometer import sample
+from ceilometer import utils
 
 OPTS = [
     cfg.StrOpt('meter_definitions_cfg_file',
                default="meters.yaml",
                help="Configuration file for defining meter notifications."
                ),
+    cfg.IntOpt('definitions_cache_size',
+               default=1024,
+               help='Number of event types for which the matching meter '
+               'definitions are cached. 0 disables the cache.'),
 ]
 
 cfg.CONF.register_opts(OPTS, group='meter')
@@ -70,29 +76,32 @@ class MeterDefinition(object):
         self._event_type = self.cfg.get('event_type')
         if isinstance(self._event_type, six.string_types):
             self._event_type = [self._event_type]
+        self.exact_types = [t for t in self._event_type
+                            if not any(c in t for c in '*?[')]
+        self.has_wildcard = len(self.exact_types) < len(self._event_type)
 
         if ('type' not in self.cfg.get('lookup', []) and
                 self.cfg['type'] not in sample.TYPES):
             raise MeterDefinitionException(
                 _LE("Invalid type %s specified") % self.cfg['type'], self.cfg)
 
-        self._field_getter = {}
+        self._constants = {}
+        self._metadata_keys = None
+        paths = {}
         for name, field in self.cfg.items():
             if name in ["event_type", "lookup"] or not field:
                 continue
             elif isinstance(field, six.integer_types):
-                self._field_getter[name] = field
+                self._constants[name] = field
             elif isinstance(field, dict) and name == 'metadata':
-                meta = {}
+                self._metadata_keys = list(field)
                 for key, val in field.items():
-                    parts = self.parse_jsonpath(val)
-                    meta[key] = functools.partial(self._parse_jsonpath_field,
-                                                  parts)
-                self._field_getter['metadata'] = meta
+                    paths[('metadata', key)] = self.parse_jsonpath(val)
             else:
-                parts = self.parse_jsonpath(field)
-                self._field_getter[name] = functools.partial(
-                    self._parse_jsonpath_field, parts)
+                paths[name] = self.parse_jsonpath(field)
+        self._paths = paths
+        # all the fields are extracted from a notification in one pass
+        self._extract = jsonpath_utils.compile_plan(paths)
 
     def parse_jsonpath(self, field):
         try:
@@ -109,24 +118,33 @@ class MeterDefinition(object):
             if fnmatch.fnmatch(meter_name, t):
                 return True
 
-    def parse_fields(self, field, message, all_values=False):
-        getter = self._field_getter.get(field)
-        if not getter:
-            return
-        elif isinstance(getter, dict):
-            dict_val = {}
-            for key, val in getter.items():
-                dict_val[key] = val(message, all_values)
-            return dict_val
-        elif callable(getter):
-            return getter(message, all_values)
-        else:
-            return getter
+    def extract_fields(self, message):
+        """Return the values of all the path fields of a notification."""
+        return self._extract(message)
+
+    def parse_fields(self, field, message, all_values=False, extracted=None):
+        """Return the value of a field of a notification.
+
+        :param extracted: the fields already extracted from the message by
+                          extract_fields(), to avoid walking it again.
+        """
+        if field in self._constants:
+            return self._constants[field]
+        if field == 'metadata' and self._metadata_keys is not None:
+            if extracted is None:
+                extracted = self.extract_fields(message)
+            return dict((key, self._field_value(extracted, (field, key),
+                                                all_values))
+                        for key in self._metadata_keys)
+        if field in self._paths:
+            if extracted is None:
+                extracted = self.extract_fields(message)
+            return self._field_value(extracted, field, all_values)
 
     @staticmethod
-    def _parse_jsonpath_field(parts, message, all_values):
-        values = [match.value for match in parts.find(message)
-                  if match.value is not None]
+    def _field_value(extracted, field, all_values):
+        values = [value for value in extracted.get(field, ())
+                  if value is not None]
         if values:
             if not all_values:
                 return values[0]
@@ -207,6 +225,39 @@ class ProcessMeterNotifications(plugin_base.NotificationBase):
         super(ProcessMeterNotifications, self).__init__(manager)
         self.definitions = load_definitions(setup_meters_config())
 
+    @property
+    def definitions(self):
+        return self._definitions
+
+    @definitions.setter
+    def definitions(self, definitions):
+        # Index the definitions: event types listed literally map to the
+        # definitions listing them, definitions with wildcards are matched
+        # one by one. The matches of an event type are cached.
+        self._definitions = definitions
+        self._exact_types = collections.defaultdict(list)
+        self._wildcard_definitions = []
+        for index, d in enumerate(definitions):
+            for t in d.exact_types:
+                self._exact_types[t].append(index)
+            if d.has_wildcard:
+                self._wildcard_definitions.append(index)
+        self._cache = utils.LRUCache(cfg.CONF.meter.definitions_cache_size)
+
+    def _match_definitions(self, event_type):
+        indexes = set(self._exact_types.get(event_type, ()))
+        indexes.update(index for index in self._wildcard_definitions
+                       if self._definitions[index].match_type(event_type))
+        return [self._definitions[index] for index in sorted(indexes)]
+
+    def find_definitions(self, event_type):
+        """Return the meter definitions handling an event type, in order."""
+        definitions = self._cache.get(event_type)
+        if definitions is None:
+            definitions = self._match_definitions(event_type)
+            self._cache[event_type] = definitions
+        return definitions
+
     def get_targets(self, conf):
         """Return a sequence of oslo_messaging.Target
 
@@ -238,8 +289,8 @@ class ProcessMeterNotifications(plugin_base.NotificationBase):
         return targets
 
     @staticmethod
-    def _normalise_as_list(value, d, body, length):
-        values = d.parse_fields(value, body, True)
+    def _normalise_as_list(value, d, body, length, extracted=None):
+        values = d.parse_fields(value, body, True, extracted)
         if not values:
             if value in d.cfg.get('lookup'):
                 LOG.warning('Could not find %s values', value)
@@ -251,68 +302,79 @@ class ProcessMeterNotifications(plugin_base.NotificationBase):
         return values if isinstance(values, list) else [values]
 
     def process_notification(self, notification_body):
-        for d in self.definitions:
-            if d.match_type(notification_body['event_type']):
-                userid = self.get_user_id(d, notification_body)
-                projectid = self.get_project_id(d, notification_body)
-                resourceid = d.parse_fields('resource_id', notification_body)
-                ts = d.parse_fields('timestamp', notification_body)
-                metadata = d.parse_fields('metadata', notification_body)
-                if d.cfg.get('lookup'):
-                    meters = d.parse_fields('name', notification_body, True)
-                    if not meters:  # skip if no meters in payload
-                        break
-                    try:
-                        resources = self._normalise_as_list(
-                            'resource_id', d, notification_body, len(meters))
-                        volumes = self._normalise_as_list(
-                            'volume', d, notification_body, len(meters))
-                        units = self._normalise_as_list(
-                            'unit', d, notification_body, len(meters))
-                        types = self._normalise_as_list(
-                            'type', d, notification_body, len(meters))
-                        users = (self._normalise_as_list(
-                            'user_id', d, notification_body, len(meters))
-                            if 'user_id' in d.cfg['lookup'] else [userid])
-                        projs = (self._normalise_as_list(
-                            'project_id', d, notification_body, len(meters))
-                            if 'project_id' in d.cfg['lookup']
-                            else [projectid])
-                        times = (self._normalise_as_list(
-                            'timestamp', d, notification_body, len(meters))
-                            if 'timestamp' in d.cfg['lookup'] else [ts])
-                    except InvalidPayload:
-                        break
-                    for m, v, unit, t, r, p, user, ts in zip(
-                            meters, volumes, itertools.cycle(units),
-                            itertools.cycle(types), itertools.cycle(resources),
-                            itertools.cycle(projs), itertools.cycle(users),
-                            itertools.cycle(times)):
-                        yield sample.Sample.from_notification(
-                            name=m, type=t, unit=unit, volume=v,
-                            resource_id=r, user_id=user, project_id=p,
-                            message=notification_body, timestamp=ts,
-                            metadata=metadata)
-                else:
+        for d in self.find_definitions(notification_body['event_type']):
+            fields = d.extract_fields(notification_body)
+            userid = self.get_user_id(d, notification_body, fields)
+            projectid = self.get_project_id(d, notification_body, fields)
+            resourceid = d.parse_fields('resource_id', notification_body,
+                                        extracted=fields)
+            ts = d.parse_fields('timestamp', notification_body,
+                                extracted=fields)
+            metadata = d.parse_fields('metadata', notification_body,
+                                      extracted=fields)
+            if d.cfg.get('lookup'):
+                meters = d.parse_fields('name', notification_body, True,
+                                        fields)
+                if not meters:  # skip if no meters in payload
+                    break
+                try:
+                    resources = self._normalise_as_list(
+                        'resource_id', d, notification_body, len(meters),
+                        fields)
+                    volumes = self._normalise_as_list(
+                        'volume', d, notification_body, len(meters), fields)
+                    units = self._normalise_as_list(
+                        'unit', d, notification_body, len(meters), fields)
+                    types = self._normalise_as_list(
+                        'type', d, notification_body, len(meters), fields)
+                    users = (self._normalise_as_list(
+                        'user_id', d, notification_body, len(meters),
+                        fields)
+                        if 'user_id' in d.cfg['lookup'] else [userid])
+                    projs = (self._normalise_as_list(
+                        'project_id', d, notification_body, len(meters),
+                        fields)
+                        if 'project_id' in d.cfg['lookup']
+                        else [projectid])
+                    times = (self._normalise_as_list(
+                        'timestamp', d, notification_body, len(meters),
+                        fields)
+                        if 'timestamp' in d.cfg['lookup'] else [ts])
+                except InvalidPayload:
+                    break
+                for m, v, unit, t, r, p, user, ts in zip(
+                        meters, volumes, itertools.cycle(units),
+                        itertools.cycle(types), itertools.cycle(resources),
+                        itertools.cycle(projs), itertools.cycle(users),
+                        itertools.cycle(times)):
                     yield sample.Sample.from_notification(
-                        name=d.cfg['name'],
-                        type=d.cfg['type'],
-                        unit=d.cfg['unit'],
-                        volume=d.parse_fields('volume', notification_body),
-                        resource_id=resourceid,
-                        user_id=userid,
-                        project_id=projectid,
-                        message=notification_body,
-                        timestamp=ts, metadata=metadata)
+                        name=m, type=t, unit=unit, volume=v,
+                        resource_id=r, user_id=user, project_id=p,
+                        message=notification_body, timestamp=ts,
+                        metadata=metadata)
+            else:
+                yield sample.Sample.from_notification(
+                    name=d.cfg['name'],
+                    type=d.cfg['type'],
+                    unit=d.cfg['unit'],
+                    volume=d.parse_fields('volume', notification_body,
+                                          extracted=fields),
+                    resource_id=resourceid,
+                    user_id=userid,
+                    project_id=projectid,
+                    message=notification_body,
+                    timestamp=ts, metadata=metadata)
 
     @staticmethod
-    def get_user_id(d, notification_body):
-        return (d.parse_fields('user_id', notification_body) or
+    def get_user_id(d, notification_body, extracted=None):
+        return (d.parse_fields('user_id', notification_body,
+                               extracted=extracted) or
                 notification_body.get('_context_user_id') or
                 notification_body.get('_context_user', None))
 
     @staticmethod
-    def get_project_id(d, notification_body):
-        return (d.parse_fields('project_id', notification_body) or
+    def get_project_id(d, notification_body, extracted=None):
+        return (d.parse_fields('project_id', notification_body,
+                               extracted=extracted) or
                 notification_body.get('_context_tenant_id') or
                 notification_body.get('_context_tenant', None))
@@ -24,6 +24,10 @@ class _BaseServicesDiscovery(plugin_base.DiscoveryBase):
         super(_BaseServicesDiscovery, self).__init__()
         self.neutron_cli = neutron_client.Client()
 
+    @staticmethod
+    def resource_identity(resource):
+        return resource['id']
+
 
 class LBPoolsDiscovery(_BaseServicesDiscovery):
     def discover(self, manager, param=None):
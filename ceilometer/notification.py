@@ -13,6 +13,8 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 import itertools
+import os
+import uuid
 
 from oslo_config import cfg
 from oslo_context import context
@@ -59,6 +61,30 @@ OPTS = [
                 default=False,
                 help='Enable workload partitioning, allowing multiple '
                      'notification agents to be run simultaneously.'),
+    cfg.IntOpt('batch_size',
+               default=1,
+               min=1,
+               help='Number of notifications to process at once. Above 1, '
+                    'batch listeners are used and the samples and events '
+                    'of a whole batch are published together.'),
+    cfg.IntOpt('batch_timeout',
+               default=5,
+               min=1,
+               help='Number of seconds to wait before processing an '
+                    'incomplete batch of notifications, when batch_size '
+                    'is above 1.'),
+    cfg.IntOpt('pipeline_batch_size',
+               default=100,
+               min=1,
+               help='Maximum number of samples or events sent in a single '
+                    'message to a pipeline processing queue when workload '
+                    'partitioning is enabled.'),
+    cfg.FloatOpt('pipeline_batch_timeout',
+                 default=1.0,
+                 help='Maximum time, in seconds, a sample or event is held '
+                      'before being sent to a pipeline processing queue. '
+                      'Held data is always sent once a notification is '
+                      'processed. 0 disables the limit.'),
     cfg.MultiStrOpt('messaging_urls',
                     default=[],
                     secret=True,
@@ -82,6 +108,11 @@ class NotificationService(service_base.BaseService):
     to the main OpenStack queue and another listener(and notifier) for IPC to
     divide pipeline sink endpoints. Coordination should be enabled to have
     proper active/active HA.
+
+    With several workers, each worker process has its own listeners and
+    pipeline managers and joins the coordination group on its own, so that
+    the pipeline processing queues are spread over all the worker processes
+    of all the agents.
     """
 
     NOTIFICATION_NAMESPACE = 'ceilometer.notification'
@@ -152,7 +183,8 @@ class NotificationService(service_base.BaseService):
         if cfg.CONF.notification.workload_partitioning:
             self.ctxt = context.get_admin_context()
             self.group_id = self.NOTIFICATION_NAMESPACE
-            self.partition_coordinator = coordination.PartitionCoordinator()
+            self.partition_coordinator = coordination.PartitionCoordinator(
+                self._get_member_id())
             self.partition_coordinator.start()
             self.partition_coordinator.join_group(self.group_id)
         else:
@@ -192,6 +224,13 @@ class NotificationService(service_base.BaseService):
 
         self.init_pipeline_refresh()
 
+    @staticmethod
+    def _get_member_id():
+        # NOTE: the host and pid identify the worker in the group, the
+        # random part a restarted worker which got the pid of a former one
+        return '%s.%d.%s' % (cfg.CONF.host, os.getpid(),
+                             uuid.uuid4().hex[:8])
+
     def _configure_main_queue_listeners(self, pipe_manager,
                                         event_pipe_manager):
         notification_manager = self._get_notifications_manager(pipe_manager)
@@ -228,11 +267,20 @@ class NotificationService(service_base.BaseService):
         urls = cfg.CONF.notification.messaging_urls or [None]
         for url in urls:
             transport = messaging.get_transport(url)
-            listener = messaging.get_notification_listener(
-                transport, targets, endpoints)
+            listener = self._get_listener(transport, targets, endpoints)
             listener.start()
             self.listeners.append(listener)
 
+    @staticmethod
+    def _get_listener(transport, targets, endpoints):
+        if cfg.CONF.notification.batch_size > 1:
+            return messaging.get_batch_notification_listener(
+                transport, targets, endpoints,
+                batch_size=cfg.CONF.notification.batch_size,
+                batch_timeout=cfg.CONF.notification.batch_timeout)
+        return messaging.get_notification_listener(transport, targets,
+                                                   endpoints)
+
     def _refresh_agent(self, event):
         self._configure_pipeline_listeners(True)
 
@@ -246,6 +294,10 @@ class NotificationService(service_base.BaseService):
             self.group_id,
             range(cfg.CONF.notification.pipeline_processing_queues))
 
+        LOG.info(_LI('Pipeline processing queue sets of worker %(pid)d: '
+                     '%(sets)s'), {'pid': os.getpid(),
+                                   'sets': sorted(partitioned)})
+
         queue_set = {}
         for pipe_set, pipe in itertools.product(partitioned, pipelines):
             queue_set['%s-%s-%s' %
@@ -267,12 +319,12 @@ class NotificationService(service_base.BaseService):
             self.pipeline_listeners = []
 
         for topic, pipe in queue_set.items():
-            LOG.debug('Pipeline endpoint: %s from set: %s', pipe.name,
-                      pipe_set)
+            LOG.debug('Pipeline endpoint: %s from queue: %s', pipe.name,
+                      topic)
             pipe_endpoint = (pipeline.EventPipelineEndpoint
                              if isinstance(pipe, pipeline.EventPipeline)
                              else pipeline.SamplePipelineEndpoint)
-            listener = messaging.get_notification_listener(
+            listener = self._get_listener(
                 transport,
                 [oslo_messaging.Target(topic=topic)],
                 [pipe_endpoint(self.ctxt, pipe)])
@@ -53,6 +53,7 @@ import ceilometer.publisher.utils
 import ceilometer.sample
 import ceilometer.service
 import ceilometer.storage
+import ceilometer.transformer
 import ceilometer.utils
 
 
@@ -107,7 +108,7 @@ def list_opts():
         ('notification',
          itertools.chain(ceilometer.notification.OPTS,
                          [ceilometer.service.NOTI_OPT])),
-        ('polling', ceilometer.agent.manager.OPTS),
+        ('polling', ceilometer.agent.manager.POLLING_OPTS),
         ('publisher', ceilometer.publisher.utils.OPTS),
         ('publisher_notifier', ceilometer.publisher.messaging.NOTIFIER_OPTS),
         ('publisher_rpc', ceilometer.publisher.messaging.RPC_OPTS),
@@ -120,6 +121,7 @@ def list_opts():
                          ceilometer.nova_client.SERVICE_OPTS,
                          ceilometer.objectstore.rgw.SERVICE_OPTS,
                          ceilometer.objectstore.swift.SERVICE_OPTS,)),
+        ('transformer', ceilometer.transformer.OPTS),
         ('vmware', ceilometer.compute.virt.vmware.inspector.OPTS),
         ('xenapi', ceilometer.compute.virt.xenapi.inspector.OPTS),
     ]
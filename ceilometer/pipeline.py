@@ -18,9 +18,13 @@
 # under the License.
 
 import abc
+import collections
 import fnmatch
 import hashlib
+import itertools
 import os
+import time
+import zlib
 
 from oslo_config import cfg
 from oslo_log import log
@@ -82,13 +86,21 @@ class PipelineEndpoint(object):
     def __init__(self, context, pipeline):
         self.publish_context = PublishContext(context, [pipeline])
 
-    @abc.abstractmethod
     def sample(self, ctxt, publisher_id, event_type, payload, metadata):
-        pass
+        return self.publish_payload(payload)
+
+    def process_notifications(self, priority, notifications):
+        """Publish the datapoints of a batch of notifications at once."""
+        return self.publish_payload(list(itertools.chain.from_iterable(
+            n['payload'] for n in notifications)))
+
+    @abc.abstractmethod
+    def publish_payload(self, payload):
+        """Publish the serialized datapoints of a pipeline queue."""
 
 
 class SamplePipelineEndpoint(PipelineEndpoint):
-    def sample(self, ctxt, publisher_id, event_type, payload, metadata):
+    def publish_payload(self, payload):
         samples = [
             sample_util.Sample(name=s['counter_name'],
                                type=s['counter_type'],
@@ -108,7 +120,7 @@ class SamplePipelineEndpoint(PipelineEndpoint):
 
 
 class EventPipelineEndpoint(PipelineEndpoint):
-    def sample(self, ctxt, publisher_id, event_type, payload, metadata):
+    def publish_payload(self, payload):
         events = [
             models.Event(
                 message_id=ev['message_id'],
@@ -138,13 +150,21 @@ class _PipelineTransportManager(object):
 
     @staticmethod
     def hash_grouping(datapoint, grouping_keys):
-        value = ''
-        for key in grouping_keys or []:
-            value += datapoint.get(key) if datapoint.get(key) else ''
-        return hash(value)
+        # NOTE: the hash must not depend on the process, so that all the
+        # notification agents route a datapoint to the same queue.
+        values = [datapoint.get(key) or u'' for key in grouping_keys or ()]
+        try:
+            value = u'\x00'.join(values).encode('utf-8')
+        except (TypeError, UnicodeDecodeError):
+            value = b'\x00'.join(
+                v if isinstance(v, six.binary_type)
+                else six.text_type(v).encode('utf-8') for v in values)
+        return zlib.crc32(value) & 0xffffffff
 
     def add_transporter(self, transporter):
-        self.transporters.append(transporter)
+        d_filter, grouping_keys, notifiers = transporter
+        self.transporters.append((d_filter, tuple(grouping_keys or ()),
+                                  notifiers))
 
     def publisher(self, context):
         serializer = self.serializer
@@ -152,29 +172,50 @@ class _PipelineTransportManager(object):
         transporters = self.transporters
         filter_attr = self.filter_attr
         event_type = self.event_type
+        batch_size = cfg.CONF.notification.pipeline_batch_size
+        batch_timeout = cfg.CONF.notification.pipeline_batch_timeout
 
         class PipelinePublishContext(object):
+            def _send(self, notifier):
+                started, datapoints = self.batches.pop(notifier)
+                notifier.sample(context.to_dict(),
+                                event_type=event_type,
+                                payload=datapoints)
+
             def __enter__(self):
+                # the datapoints are bucketed by target queue and sent
+                # once a bucket is full, too old or when leaving the context
+                self.batches = collections.OrderedDict()
+
                 def p(data):
-                    # TODO(gordc): cleanup so payload is always single
-                    #              datapoint. we can't correctly bucketise
-                    #              datapoints if batched.
                     data = [data] if not isinstance(data, list) else data
+                    now = time.time()
                     for datapoint in data:
                         serialized_data = serializer(datapoint)
+                        hashes = {}
                         for d_filter, grouping_keys, notifiers in transporters:
                             if d_filter(serialized_data[filter_attr]):
-                                key = (hash_grouping(serialized_data,
-                                                     grouping_keys)
-                                       % len(notifiers))
-                                notifier = notifiers[key]
-                                notifier.sample(context.to_dict(),
-                                                event_type=event_type,
-                                                payload=[serialized_data])
+                                if grouping_keys not in hashes:
+                                    hashes[grouping_keys] = hash_grouping(
+                                        serialized_data, grouping_keys)
+                                notifier = notifiers[hashes[grouping_keys] %
+                                                     len(notifiers)]
+                                batch = self.batches.setdefault(notifier,
+                                                                (now, []))
+                                batch[1].append(serialized_data)
+                                if len(batch[1]) >= batch_size:
+                                    self._send(notifier)
+                    if batch_timeout > 0:
+                        expired = time.time() - batch_timeout
+                        for notifier, (started, datapoints) in list(
+                                self.batches.items()):
+                            if started <= expired:
+                                self._send(notifier)
                 return p
 
             def __exit__(self, exc_type, exc_value, traceback):
-                pass
+                while self.batches:
+                    self._send(next(iter(self.batches)))
 
         return PipelinePublishContext()
 
@@ -439,25 +480,57 @@ class SampleSink(Sink):
 
     NAMESPACE = 'ceilometer.publisher'
 
-    def _transform_sample(self, start, ctxt, sample):
-        try:
-            for transformer in self.transformers[start:]:
+    def _transform_samples(self, start, ctxt, samples):
+        for transformer in self.transformers[start:]:
+            LOG.debug("Pipeline %(pipeline)s: Transform %(count)d samples "
+                      "from %(trans)s transformer",
+                      {'pipeline': self, 'count': len(samples),
+                       'trans': transformer})
+            try:
+                handle_samples = getattr(transformer, 'handle_samples', None)
+                if handle_samples is None:
+                    # transformer not based on TransformerBase
+                    samples = self._transform_each_sample(transformer, ctxt,
+                                                          samples)
+                else:
+                    samples = handle_samples(ctxt, samples)
+            except Exception as err:
+                # TODO(gordc): only use one log level.
+                LOG.warning(_("Pipeline %(pipeline)s: "
+                              "Exit after error from transformer "
+                              "%(trans)s for %(smp)s") % (
+                                  {'pipeline': self, 'trans': transformer,
+                                   'smp': samples}))
+                LOG.exception(err)
+                return []
+            if not samples:
+                LOG.debug("Pipeline %(pipeline)s: Samples dropped by "
+                          "transformer %(trans)s", {'pipeline': self,
+                                                    'trans': transformer})
+                return []
+        return samples
+
+    def _transform_each_sample(self, transformer, ctxt, samples):
+        """Hand samples one by one to a transformer without handle_samples.
+
+        A sample the transformer fails on is dropped, the others go on.
+        """
+        transformed = []
+        for sample in samples:
+            try:
                 sample = transformer.handle_sample(ctxt, sample)
-                if not sample:
-                    LOG.debug(
-                        "Pipeline %(pipeline)s: Sample dropped by "
-                        "transformer %(trans)s", {'pipeline': self,
-                                                  'trans': transformer})
-                    return
-            return sample
-        except Exception as err:
-            # TODO(gordc): only use one log level.
-            LOG.warning(_("Pipeline %(pipeline)s: "
-                          "Exit after error from transformer "
-                          "%(trans)s for %(smp)s") % ({'pipeline': self,
-                                                       'trans': transformer,
-                                                       'smp': sample}))
-            LOG.exception(err)
+            except Exception as err:
+                # TODO(gordc): only use one log level.
+                LOG.warning(_("Pipeline %(pipeline)s: "
+                              "Exit after error from transformer "
+                              "%(trans)s for %(smp)s") % (
+                                  {'pipeline': self, 'trans': transformer,
+                                   'smp': sample}))
+                LOG.exception(err)
+                continue
+            if sample:
+                transformed.append(sample)
+        return transformed
 
     def _publish_samples(self, start, ctxt, samples):
         """Push samples into pipeline for publishing.
@@ -473,16 +546,11 @@ class SampleSink(Sink):
         transformed_samples = []
         if not self.transformers:
             transformed_samples = samples
-        else:
-            for sample in samples:
-                LOG.debug(
-                    "Pipeline %(pipeline)s: Transform sample "
-                    "%(smp)s from %(trans)s transformer", {'pipeline': self,
-                                                           'smp': sample,
-                                                           'trans': start})
-                sample = self._transform_sample(start, ctxt, sample)
-                if sample:
-                    transformed_samples.append(sample)
+        elif samples:
+            # NOTE: flushed transformers may emit None for the samples they
+            # failed to compute.
+            transformed_samples = self._transform_samples(
+                start, ctxt, [s for s in samples if s])
 
         if transformed_samples:
             for p in self.publishers:
@@ -16,6 +16,7 @@
 """
 
 import abc
+import atexit
 import itertools
 import operator
 
@@ -24,12 +25,14 @@ from oslo_log import log
 import oslo_messaging
 from oslo_utils import encodeutils
 from oslo_utils import excutils
+from oslo_utils import units
 import six
 import six.moves.urllib.parse as urlparse
 
 from ceilometer.i18n import _, _LI, _LE
 from ceilometer import messaging
 from ceilometer import publisher
+from ceilometer.publisher import spool
 from ceilometer.publisher import utils
 
 
@@ -82,8 +85,29 @@ def raise_delivery_failure(exc):
                               cause=exc)
 
 
+class SpooledContext(object):
+    """Context of a message replayed from the spool."""
+
+    def __init__(self, values):
+        self.values = values
+
+    def to_dict(self):
+        return self.values
+
+
 @six.add_metaclass(abc.ABCMeta)
 class MessagingPublisher(publisher.PublisherBase):
+    """Base class of the publishers sending to the messaging bus.
+
+    With the queue policy, the messages not delivered are kept in memory,
+    up to max_queue_length messages, or, if spool_dir is set, in an on-disk
+    spool of at most max_spool_size bytes split in files of
+    spool_segment_size bytes, replayed in order once the bus is back. The
+    position of the replay is saved at most every spool_checkpoint_interval
+    seconds::
+
+        notifier://?policy=queue&spool_dir=/var/lib/ceilometer/spool
+    """
 
     def __init__(self, parsed_url):
         options = urlparse.parse_qs(parsed_url.query)
@@ -109,6 +133,23 @@ class MessagingPublisher(publisher.PublisherBase):
 
         self.retry = 1 if self.policy in ['queue', 'drop'] else None
 
+        # NOTE: with a spool directory, the queue policy keeps the messages
+        # not delivered on disk instead of in local_queue, bounded in bytes
+        # rather than in number of messages
+        self.spool = None
+        self._spooling = False
+        spool_dir = options.get('spool_dir', [None])[-1]
+        if spool_dir and self.policy == 'queue':
+            self.spool = spool.Spool(
+                spool_dir,
+                int(options.get('max_spool_size', [100 * units.Mi])[-1]),
+                int(options.get('spool_segment_size', [4 * units.Mi])[-1]),
+                float(options.get('spool_checkpoint_interval', [1])[-1]))
+            LOG.info(_LI('Publishing queue spooled in %s') % self.spool.path)
+            # NOTE: publishers have no shutdown hook, save the position of
+            # the replay when the process exits
+            atexit.register(self.spool.close)
+
     def publish_samples(self, context, samples):
         """Publish samples on RPC.
 
@@ -146,6 +187,19 @@ class MessagingPublisher(publisher.PublisherBase):
         # something in the self.local_queue
         queue = self.local_queue
         self.local_queue = []
+        if self.spool is not None:
+            # NOTE: the messages only go through the spool when they fail
+            # to be sent or, to keep them in order, when spooled messages
+            # are waiting or being replayed
+            replay = self._spooling or self.spool.pending()
+            if not replay:
+                queue = self._process_queue(queue, self.policy)
+            for context, topic, data in queue:
+                self.spool.append((context.to_dict() if context else {},
+                                   topic, data))
+            if replay:
+                self._process_spool()
+            return
         self.local_queue = (self._process_queue(queue, self.policy) +
                             self.local_queue)
         if self.policy == 'queue':
@@ -184,6 +238,33 @@ class MessagingPublisher(publisher.PublisherBase):
                 queue.pop(0)
         return []
 
+    def _process_spool(self):
+        # NOTE: a single greenthread replays the spool, the records spooled
+        # meanwhile by the others are sent by the same loop, in order
+        if self._spooling:
+            return
+        self._spooling = True
+        try:
+            while True:
+                position = None
+                records = self.spool.read()
+                try:
+                    for record_position, (ctxt, topic, data) in records:
+                        self._send(SpooledContext(ctxt), topic, data)
+                        position = record_position
+                except DeliveryFailure:
+                    LOG.warn(_("Failed to publish spooled datapoints, keep "
+                               "them in %s"), self.spool.path)
+                    return
+                finally:
+                    records.close()
+                    if position is not None:
+                        self.spool.commit(position)
+                if position is None:
+                    return
+        finally:
+            self._spooling = False
+
     def publish_events(self, context, events):
         """Send an event message for publishing
 
@@ -0,0 +1,290 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Append-only on-disk spool of the messages a publisher failed to send.
+
+The spool is a directory of segment files holding length-prefixed and
+checksummed JSON records, and of a checkpoint file holding the position
+of the first record not delivered yet. Records are only ever appended to
+the last segment, which is rotated once it reaches the segment size, and
+are read back in order through memory maps. Consumed segments are removed
+and, when the spool outgrows its maximum size, the oldest segments are
+dropped.
+
+The checkpoint is replaced atomically, at most once per checkpoint
+interval, once all the records are delivered and when the spool is closed,
+so after a crash the records are
+replayed from the last checkpoint: they are delivered at least once. A
+record partially written by a crash is discarded when the spool is opened.
+"""
+
+import errno
+import fcntl
+import mmap
+import os
+import struct
+import zlib
+
+from oslo_log import log
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
+import six
+
+from ceilometer.i18n import _LE, _LW
+
+
+LOG = log.getLogger(__name__)
+
+# length and crc32 of the record payload
+HEADER = struct.Struct('>II')
+SEGMENT_SUFFIX = '.seg'
+CHECKPOINT = 'checkpoint'
+LOCK = 'lock'
+
+
+def _crc32(data):
+    return zlib.crc32(data) & 0xffffffff
+
+
+class Spool(object):
+    """Ordered and size bounded persistent queue of JSON records.
+
+    Several processes, e.g. the workers of an agent, or several publishers
+    can share the same spool directory: each instance locks and uses the
+    first slot subdirectory not locked by another one, so that the
+    records spooled by a previous run are replayed by the instance
+    claiming its slot.
+
+    Positions returned by read() are (segment, offset) tuples designating
+    the end of a record, to pass to commit() once the record is delivered.
+    The commits are written to disk at most every checkpoint_interval
+    seconds, and as soon as no record is pending anymore.
+    """
+
+    def __init__(self, directory, max_size, segment_size,
+                 checkpoint_interval=1):
+        self.max_size = max_size
+        self.segment_size = segment_size
+        self._checkpoint_watch = timeutils.StopWatch(
+            duration=checkpoint_interval)
+        self._checkpoint_watch.start()
+        self._lock_file = None
+        self.path = self._claim_slot(directory)
+        self._segments = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.path)
+            if name.endswith(SEGMENT_SUFFIX))
+        if not self._segments:
+            self._segments = [0]
+        self._sizes = {}
+        for seq in self._segments[:-1]:
+            self._sizes[seq] = os.path.getsize(self._segment_path(seq))
+        self._writer = None
+        self._open_writer(self._recover(self._segments[-1]))
+        self._checkpoint = self._load_checkpoint()
+        self._checkpoint_written = self._checkpoint
+
+    def _claim_slot(self, directory):
+        slot = 0
+        while True:
+            path = os.path.join(directory, str(slot))
+            try:
+                os.makedirs(path)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            lock_file = open(os.path.join(path, LOCK), 'a')
+            try:
+                # NOTE: flock() and not lockf(), two instances of the same
+                # process must not share a slot either
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError as e:
+                lock_file.close()
+                if e.errno not in (errno.EACCES, errno.EAGAIN):
+                    raise
+                slot += 1
+            else:
+                self._lock_file = lock_file
+                return path
+
+    def _segment_path(self, seq):
+        return os.path.join(self.path, '%020d%s' % (seq, SEGMENT_SUFFIX))
+
+    def _recover(self, seq):
+        """Drop the record partially written by a crash, if any."""
+        path = self._segment_path(seq)
+        end = 0
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            while end + HEADER.size <= len(data):
+                length, crc = HEADER.unpack_from(data, end)
+                payload = data[end + HEADER.size:end + HEADER.size + length]
+                if len(payload) < length or _crc32(payload) != crc:
+                    break
+                end += HEADER.size + length
+            if end < len(data):
+                LOG.warn(_LW('Discarding %(size)d bytes of incomplete '
+                             'records at the end of %(path)s'),
+                         {'size': len(data) - end, 'path': path})
+                with open(path, 'r+b') as f:
+                    f.truncate(end)
+        return end
+
+    def _open_writer(self, size):
+        self._writer = open(self._segment_path(self._segments[-1]), 'ab')
+        self._sizes[self._segments[-1]] = size
+
+    def _load_checkpoint(self):
+        first = (self._segments[0], 0)
+        try:
+            with open(os.path.join(self.path, CHECKPOINT)) as f:
+                seq, offset = jsonutils.loads(f.read())
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return first
+        except (ValueError, TypeError):
+            LOG.warn(_LW('Invalid spool checkpoint in %s, replaying all the '
+                         'spooled records'), self.path)
+            return first
+        return max(first, (seq, offset))
+
+    def _write_checkpoint(self):
+        path = os.path.join(self.path, CHECKPOINT)
+        with open(path + '.tmp', 'w') as f:
+            f.write(jsonutils.dumps(list(self._checkpoint)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(path + '.tmp', path)
+        self._checkpoint_written = self._checkpoint
+        self._checkpoint_watch.restart()
+
+    @property
+    def size(self):
+        """Size in bytes of the spool segments."""
+        return sum(self._sizes.values())
+
+    def pending(self):
+        """Return whether records are waiting to be delivered."""
+        seq, offset = self._checkpoint
+        last = self._segments[-1]
+        return seq < last or offset < self._sizes[last]
+
+    def append(self, record):
+        payload = jsonutils.dumps(record)
+        if isinstance(payload, six.text_type):
+            payload = payload.encode('utf-8')
+        last = self._segments[-1]
+        if 0 < self._sizes[last] and (self._sizes[last] + HEADER.size +
+                                      len(payload) > self.segment_size):
+            self._rotate()
+            last = self._segments[-1]
+        self._writer.write(HEADER.pack(len(payload), _crc32(payload)))
+        self._writer.write(payload)
+        self._writer.flush()
+        self._sizes[last] += HEADER.size + len(payload)
+        self._check_size()
+
+    def _rotate(self):
+        os.fsync(self._writer.fileno())
+        self._writer.close()
+        self._segments.append(self._segments[-1] + 1)
+        self._open_writer(0)
+
+    def _check_size(self):
+        dropped = 0
+        while self.size > self.max_size > 0 and len(self._segments) > 1:
+            seq = self._segments.pop(0)
+            dropped += self._sizes.pop(seq)
+            os.unlink(self._segment_path(seq))
+        if dropped:
+            self._checkpoint = max(self._checkpoint, (self._segments[0], 0))
+            LOG.warn(_LW('Publisher spool %(path)s exceeds %(max)d bytes, '
+                         'dropping %(size)d bytes of the oldest records'),
+                     {'path': self.path, 'max': self.max_size,
+                      'size': dropped})
+
+    def read(self):
+        """Yield the (position, record) pending, in order.
+
+        Records appended while reading are yielded too.
+        """
+        seq, offset = self._checkpoint
+        while True:
+            if seq < self._segments[0]:
+                # dropped while reading
+                seq, offset = self._segments[0], 0
+            for position, record in self._read_segment(seq, offset):
+                yield position, record
+            following = [s for s in self._segments if s > seq]
+            if not following:
+                return
+            seq, offset = following[0], 0
+
+    def _read_segment(self, seq, offset):
+        try:
+            f = open(self._segment_path(seq), 'rb')
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return
+        with f:
+            while offset < os.fstat(f.fileno()).st_size:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if offset + HEADER.size > len(data):
+                    data.close()
+                    return
+                try:
+                    while offset + HEADER.size <= len(data):
+                        length, crc = HEADER.unpack_from(data, offset)
+                        start = offset + HEADER.size
+                        payload = data[start:start + length]
+                        if len(payload) < length or _crc32(payload) != crc:
+                            LOG.error(_LE('Corrupted record in %(path)s at '
+                                          'offset %(offset)d, skipping the '
+                                          'rest of the segment'),
+                                      {'path': f.name, 'offset': offset})
+                            return
+                        offset = start + length
+                        yield (seq, offset), jsonutils.loads(
+                            payload.decode('utf-8'))
+                finally:
+                    data.close()
+
+    def commit(self, position):
+        """Mark the records up to position as delivered."""
+        if position <= self._checkpoint:
+            return
+        self._checkpoint = position
+        while self._segments[0] < position[0]:
+            seq = self._segments.pop(0)
+            del self._sizes[seq]
+            try:
+                os.unlink(self._segment_path(seq))
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+        # NOTE: once the spool is drained the messages are sent without
+        # it, no later commit would save the position
+        if not self.pending() or self._checkpoint_watch.expired():
+            self._write_checkpoint()
+
+    def close(self):
+        if self._checkpoint != self._checkpoint_written:
+            self._write_checkpoint()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
@@ -21,6 +21,8 @@ import msgpack
 from oslo_config import cfg
 from oslo_log import log
 from oslo_utils import netutils
+from oslo_utils import strutils
+from six.moves.urllib import parse as urlparse
 
 import ceilometer
 from ceilometer.i18n import _
@@ -32,6 +34,11 @@ cfg.CONF.import_opt('udp_port', 'ceilometer.collector',
 
 LOG = log.getLogger(__name__)
 
+# Largest payload of an UDP datagram over IPv4
+MAX_DATAGRAM_SIZE = 65507
+# Size of the msgpack header of an array of up to 65535 elements
+ARRAY_HEADER_SIZE = 3
+
 
 class UDPPublisher(publisher.PublisherBase):
     def __init__(self, parsed_url):
@@ -45,12 +52,25 @@ class UDPPublisher(publisher.PublisherBase):
         self.socket = socket.socket(addr_family,
                                     socket.SOCK_DGRAM)
 
+        options = urlparse.parse_qs(parsed_url.query)
+        # the values of the option is a list of url params values
+        # only take care of the latest one if the option
+        # is provided more than once
+        self.batch = strutils.bool_from_string(
+            options.get('batch', ['false'])[-1])
+        self.max_datagram_size = min(
+            int(options.get('max_datagram_size', [8192])[-1]),
+            MAX_DATAGRAM_SIZE)
+
     def publish_samples(self, context, samples):
         """Send a metering message for publishing
 
         :param context: Execution context from the service or RPC call
         :param samples: Samples from pipeline after transformation
         """
+        if self.batch:
+            self._publish_batched_samples(samples)
+            return
 
         for sample in samples:
             msg = utils.meter_message_from_counter(
@@ -67,6 +87,46 @@ class UDPPublisher(publisher.PublisherBase):
                 LOG.warn(_("Unable to send sample over UDP"))
                 LOG.exception(e)
 
+    def _publish_batched_samples(self, samples):
+        """Pack as many samples as possible in each datagram.
+
+        The samples are sent as a msgpack array of metering messages, which
+        the collector tells apart from the single message datagrams. A
+        message which does not fit in max_datagram_size on its own is sent
+        alone, as a single message datagram.
+        """
+        packed = []
+        size = ARRAY_HEADER_SIZE
+        for sample in samples:
+            msg = msgpack.dumps(utils.meter_message_from_counter(
+                sample, cfg.CONF.publisher.telemetry_secret))
+            if len(msg) + ARRAY_HEADER_SIZE > self.max_datagram_size:
+                self._send(msg, 1)
+                continue
+            if size + len(msg) > self.max_datagram_size:
+                self._send_packed(packed)
+                packed = []
+                size = ARRAY_HEADER_SIZE
+            packed.append(msg)
+            size += len(msg)
+        if packed:
+            self._send_packed(packed)
+
+    def _send_packed(self, packed):
+        header = msgpack.Packer().pack_array_header(len(packed))
+        self._send(header + b''.join(packed), len(packed))
+
+    def _send(self, data, count):
+        LOG.debug("Publishing %(count)d samples in %(size)d bytes over UDP "
+                  "to %(host)s:%(port)d", {'count': count, 'size': len(data),
+                                           'host': self.host,
+                                           'port': self.port})
+        try:
+            self.socket.sendto(data, (self.host, self.port))
+        except Exception as e:
+            LOG.warn(_("Unable to send sample over UDP"))
+            LOG.exception(e)
+
     def publish_events(self, context, events):
         """Send an event message for publishing
 
@@ -15,10 +15,12 @@
 """Utils for publishers
 """
 
+import base64
 import hashlib
 import hmac
 
 from oslo_config import cfg
+from oslo_serialization import jsonutils
 import six
 
 from ceilometer import utils
@@ -36,17 +38,36 @@ OPTS = [
                                 cfg.DeprecatedOpt("metering_secret",
                                                   "publisher")]
                ),
+    cfg.IntOpt('telemetry_signature_version',
+               default=1,
+               min=1, max=2,
+               help='Version of the signature computed for the published '
+                    'messages. Version 1 hashes every key and value of the '
+                    'message separately, version 2 hashes a single canonical '
+                    'serialization of the message and is much cheaper on '
+                    'large messages. Both versions are always accepted when '
+                    'verifying a message, so only switch to version 2 once '
+                    'all the consumers of the messages have been upgraded.'),
 ]
 cfg.CONF.register_opts(OPTS, group="publisher")
 
 
-def compute_signature(message, secret):
-    """Return the signature for a message dictionary."""
-    if not secret:
-        return ''
+SIGNATURE_V2_PREFIX = 'v2:'
 
-    if isinstance(secret, six.text_type):
-        secret = secret.encode('utf-8')
+
+def _canonical_serialization(message):
+    # Skip any existing signature value, which would not have
+    # been part of the original message.
+    message = dict((k, v) for k, v in six.iteritems(message)
+                   if k != 'message_signature')
+    data = jsonutils.dumps(message, sort_keys=True, separators=(',', ':'),
+                           default=six.text_type)
+    if isinstance(data, six.text_type):
+        data = data.encode('utf-8')
+    return data
+
+
+def _compute_signature_v1(message, secret):
     digest_maker = hmac.new(secret, b'', hashlib.sha256)
     for name, value in utils.recursive_keypairs(message):
         if name == 'message_signature':
@@ -58,6 +79,40 @@ def compute_signature(message, secret):
     return digest_maker.hexdigest()
 
 
+def _compute_signature_v2(message, secret):
+    digest = hmac.new(secret, _canonical_serialization(message),
+                      hashlib.sha256).digest()
+    # NOTE: the prefix tells verify_signature which version to compute, the
+    # base64 form keeps the signature within the 64 characters of the
+    # storage drivers message_signature fields.
+    return SIGNATURE_V2_PREFIX + base64.b64encode(digest).decode('ascii')
+
+
+def compute_signature(message, secret, version=None):
+    """Return the signature for a message dictionary.
+
+    :param message: the message dictionary to sign
+    :param secret: the secret shared with the consumers of the message
+    :param version: version of the signature, defaults to the
+                    telemetry_signature_version option
+    """
+    if not secret:
+        return ''
+
+    if isinstance(secret, six.text_type):
+        secret = secret.encode('utf-8')
+    if version is None:
+        version = cfg.CONF.publisher.telemetry_signature_version
+    if version == 2:
+        try:
+            return _compute_signature_v2(message, secret)
+        except (TypeError, ValueError):
+            # messages that have no canonical serialization, e.g. with
+            # dictionaries mixing key types, keep the old signature
+            pass
+    return _compute_signature_v1(message, secret)
+
+
 def besteffort_compare_digest(first, second):
     """Returns True if both string inputs are equal, otherwise False.
 
@@ -98,7 +153,11 @@ def verify_signature(message, secret):
         return True
 
     old_sig = message.get('message_signature', '')
-    new_sig = compute_signature(message, secret)
+    version = 1
+    if (isinstance(old_sig, six.string_types) and
+            old_sig.startswith(SIGNATURE_V2_PREFIX)):
+        version = 2
+    new_sig = compute_signature(message, secret, version)
 
     if isinstance(old_sig, six.text_type):
         try:
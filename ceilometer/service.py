@@ -96,7 +96,9 @@ NOTI_OPT = cfg.IntOpt('workers',
                       deprecated_group='DEFAULT',
                       deprecated_name='notification_workers',
                       help='Number of workers for notification service, '
-                           'default value is 1.')
+                           'default value is 1. With workload partitioning, '
+                           'the pipeline processing queues are spread over '
+                           'all the workers.')
 cfg.CONF.register_opt(NOTI_OPT, 'notification')
 
 COLL_OPT = cfg.IntOpt('workers',
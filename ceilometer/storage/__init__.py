@@ -75,6 +75,36 @@ OPTS = [
                help="The max length of resources id in DB2 nosql, "
                     "the value should be larger than len(hostname) * 2 "
                     "as compute node's resource id is <hostname>_<nodename>."),
+    cfg.IntOpt('sql_meter_cache_size',
+               default=1024,
+               help="Number of meter definition ids cached by each "
+                    "SQL storage connection (< 1 disables the cache)."),
+    cfg.IntOpt('sql_resource_cache_size',
+               default=8192,
+               help="Number of resource ids cached by each SQL storage "
+                    "connection (< 1 disables the cache)."),
+    cfg.ListOpt('sql_rollup_periods',
+                default=[],
+                help="Lengths in seconds of the periods, e.g. 300,3600,86400, "
+                     "the SQL storage driver maintains per meter and "
+                     "resource statistics for as samples are recorded. "
+                     "Statistics queries starting at a multiple of one of "
+                     "them, with a period multiple of it, are answered from "
+                     "these rollups rather than from the samples. All the "
+                     "collectors, the API and ceilometer-expirer have to "
+                     "share the option: the API only uses the rollups of "
+                     "its own periods, and the rollups of a period are not "
+                     "used while a collector without it records samples. "
+                     "Empty disables the rollups."),
+    cfg.IntOpt('hbase_scan_shards',
+               default=1,
+               max=16,
+               help="Number of row ranges the HBase storage driver splits "
+                    "the scans of samples, resources and meters into. The "
+                    "ranges are scanned concurrently, each on its own "
+                    "connection of the pool of 100, or at once when the "
+                    "pool is short of connections (< 2 disables the "
+                    "splitting)."),
 ]
 
 cfg.CONF.register_opts(OPTS, group='database')
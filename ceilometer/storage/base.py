@@ -161,6 +161,18 @@ class Connection(object):
         raise ceilometer.NotImplementedError(
             'Recording metering data is not implemented')
 
+    def record_metering_data_batch(self, samples):
+        """Write a list of samples to the backend storage system.
+
+        Drivers able to store several samples at once should override this,
+        the default implementation records the samples one by one.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
+        for data in samples:
+            self.record_metering_data(data)
+
     @staticmethod
     def clear_expired_metering_data(ttl):
         """Clear expired data from the backend storage system.
@@ -85,7 +85,7 @@ class MTable(object):
         for row in sorted_keys:
             if row_start and row < row_start:
                 continue
-            if row_stop and row > row_stop:
+            if row_stop and row >= row_stop:
                 break
             rows[row] = self._get_latest_dict(row)
 
@@ -247,7 +247,7 @@ class MConnectionPool(object):
     def __init__(self):
         self.conn = MConnection()
 
-    def connection(self):
+    def connection(self, timeout=None):
         return self.conn
 
 
@@ -324,6 +324,46 @@ def make_general_rowkey_scan(rts_start=None, rts_end=None, some_id=None):
     return start_row, end_row
 
 
+def make_rts_boundaries(some_id, rts_low, rts_high, count):
+    """Return the rows splitting the rows of some_id into count sub-ranges.
+
+    The rows are those of some_id with a reversed timestamp between rts_low
+    and rts_high, the sub-ranges span periods of equal length.
+
+    :param some_id: first part of the rowkeys, e.g. a meter name
+    :param rts_low: lowest reversed timestamp, i.e. the newest one
+    :param rts_high: highest reversed timestamp, i.e. the oldest one
+    :param count: number of sub-ranges
+    :return: sorted list of count - 1 rows at most
+    """
+    step = (rts_high - rts_low) // count
+    if step <= 0:
+        return []
+    # NOTE: all reversed timestamps of the last centuries have 19 digits,
+    # so that their rows sort as the timestamps themselves.
+    return [prepare_key(some_id, rts_low + step * i)
+            for i in range(1, count)]
+
+
+def split_row_range(start_row, stop_row, boundaries):
+    """Split a row range into contiguous sub-ranges.
+
+    :param start_row: first row of the range, None for the table start
+    :param stop_row: row ending the range, None for the table end
+    :param boundaries: sorted rows to split the range at, those outside of
+      the range are ignored
+    :return: list of (start_row, stop_row) tuples covering the range
+    """
+    ranges = []
+    for row in boundaries:
+        if ((start_row is None or row > start_row) and
+                (stop_row is None or row < stop_row)):
+            ranges.append((start_row, row))
+            start_row = row
+    ranges.append((start_row, stop_row))
+    return ranges
+
+
 def prepare_key(*args):
     """Prepares names for rows and columns with correct separator.
 
@@ -12,13 +12,22 @@
 # under the License.
 
 import datetime
+import heapq
+import itertools
+import math
 import operator
+import threading
 import time
 
+import happybase
+from oslo_config import cfg
 from oslo_log import log
 from oslo_utils import timeutils
+import six
+from six.moves import queue
 
 import ceilometer
+from ceilometer import storage
 from ceilometer.storage import base
 from ceilometer.storage.hbase import base as hbase_base
 from ceilometer.storage.hbase import migration as hbase_migration
@@ -36,9 +45,19 @@ AVAILABLE_CAPABILITIES = {
                             'metadata': True}},
     'samples': {'query': {'simple': True,
                           'metadata': True}},
-    'statistics': {'query': {'simple': True,
+    'statistics': {'groupby': True,
+                   'query': {'simple': True,
                              'metadata': True},
-                   'aggregation': {'standard': True}},
+                   'aggregation': {'standard': True,
+                                   'selectable': {
+                                       'max': True,
+                                       'min': True,
+                                       'sum': True,
+                                       'avg': True,
+                                       'count': True,
+                                       'stddev': True,
+                                       'cardinality': True}}
+                   },
 }
 
 
@@ -46,6 +65,103 @@ AVAILABLE_STORAGE_CAPABILITIES = {
     'storage': {'production_ready': True},
 }
 
+STANDARD_AGGREGATES = ('max', 'min', 'sum', 'avg', 'count')
+
+CARDINALITY_FIELDS = ('resource_id', 'user_id', 'project_id')
+
+# Columns of the meter table holding the fields statistics can be grouped by,
+# None when the field is not stored in a column of its own.
+GROUPBY_COLUMNS = {
+    'user_id': 'f:user_id',
+    'project_id': 'f:project_id',
+    'resource_id': 'f:resource_id',
+    'source': None,
+    'resource_metadata.instance_type': 'f:r_metadata.instance_type',
+}
+
+# Rows the resource table, keyed by resource id, is split at when scanned
+# concurrently. Most resource ids are UUIDs, the other ones end up in the
+# first or last range.
+RESOURCE_ROW_ALPHABET = '0123456789abcdef'
+
+# Number of rows each concurrent scan may fetch ahead of the merge.
+SCAN_QUEUE_SIZE = 1000
+
+# Seconds each concurrent scan waits for a connection of the pool before the
+# ranges are scanned as a single one.
+SCAN_CONNECTION_TIMEOUT = 1
+
+
+class StatisticsAccumulator(object):
+    """Running statistics of the samples of a period and group.
+
+    The samples are added one by one, so that the statistics are computed
+    while the scan is consumed. The standard deviation uses Welford's
+    algorithm, which is numerically stable in a single pass.
+
+    :param cardinality: the fields whose distinct values are counted.
+    """
+
+    def __init__(self, cardinality=()):
+        self.unit = None
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.sum = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.duration_start = None
+        self.duration_end = None
+        self.distinct = dict((field, set()) for field in cardinality)
+
+    def update(self, meter):
+        vol = meter['counter_volume']
+        ts = meter['timestamp']
+        self.unit = meter['counter_unit']
+        self.count += 1
+        self.min = vol if self.min is None else min(vol, self.min)
+        self.max = vol if self.max is None else max(vol, self.max)
+        self.sum += vol
+        delta = vol - self.mean
+        self.mean += delta / float(self.count)
+        self.m2 += delta * (vol - self.mean)
+        self.duration_start = min(ts, self.duration_start or ts)
+        self.duration_end = max(ts, self.duration_end or ts)
+        for field, values in six.iteritems(self.distinct):
+            values.add(meter.get(field))
+
+    def to_statistics(self, period, period_start, period_end, groupby,
+                      aggregate):
+        """Return the models.Statistics of the accumulated samples."""
+        standard = dict(count=self.count, min=self.min, max=self.max,
+                        sum=self.sum, avg=self.sum / float(self.count))
+        if aggregate:
+            stats_args = dict((a.func, standard[a.func]) for a in aggregate
+                              if a.func in standard)
+            stats_args['aggregate'] = {}
+            for a in aggregate:
+                if a.func == 'stddev':
+                    value = math.sqrt(self.m2 / self.count)
+                elif a.func == 'cardinality':
+                    value = len(self.distinct[a.param])
+                else:
+                    value = standard[a.func]
+                key = '%s%s' % (a.func, '/%s' % a.param if a.param else '')
+                stats_args['aggregate'][key] = value
+        else:
+            stats_args = standard
+        return models.Statistics(
+            unit=self.unit,
+            period=period,
+            period_start=period_start,
+            period_end=period_end,
+            duration=timeutils.delta_seconds(self.duration_start,
+                                             self.duration_end),
+            duration_start=self.duration_start,
+            duration_end=self.duration_end,
+            groupby=groupby,
+            **stats_args)
+
 
 class Connection(hbase_base.Connection, base.Connection):
     """Put the metering data into a HBase database
@@ -118,6 +234,7 @@ class Connection(hbase_base.Connection, base.Connection):
 
     def __init__(self, url):
         super(Connection, self).__init__(url)
+        self._scan_shards = cfg.CONF.database.hbase_scan_shards
 
     def upgrade(self):
         tables = [self.RESOURCE_TABLE, self.METER_TABLE]
@@ -182,6 +299,142 @@ class Connection(hbase_base.Connection, base.Connection):
                          'message': data, 'recorded_at': timeutils.utcnow()})
             meter_table.put(row, record)
 
+    def _scan(self, table_name, row_ranges, limit=None, **kwargs):
+        """Scan a table over contiguous row ranges.
+
+        Several ranges are scanned concurrently, each in a thread using a
+        connection of its own from the pool, and their rows are merged in
+        row order, as a single scan would return them. When the pool is
+        short of connections, the ranges are scanned as a single one.
+
+        :param table_name: name of the table to scan
+        :param row_ranges: list of (row_start, row_stop) tuples
+        :param limit: maximum number of rows to return
+        :param kwargs: other arguments of the scans, e.g. filter or columns
+        :return: iterable of (row, data) tuples
+        """
+        if len(row_ranges) == 1:
+            row_start, row_stop = row_ranges[0]
+            with self.conn_pool.connection() as conn:
+                table = conn.table(table_name)
+                for row, data in table.scan(row_start=row_start,
+                                            row_stop=row_stop, limit=limit,
+                                            **kwargs):
+                    yield row, data
+            return
+
+        stopped = threading.Event()
+        scans = []
+        try:
+            for index, (row_start, row_stop) in enumerate(row_ranges):
+                rows = queue.Queue(SCAN_QUEUE_SIZE)
+                # each range may hold all of the rows returned
+                worker = threading.Thread(
+                    target=self._scan_range,
+                    args=(table_name, row_start, row_stop, limit, kwargs,
+                          rows, stopped))
+                worker.daemon = True
+                worker.start()
+                scans.append((rows, self._read_scan(rows, index)))
+            # NOTE: the merge needs the first row of every range, so it only
+            # starts once every range holds a connection. Otherwise the
+            # concurrent queries could wait for each other's connections.
+            for rows, scan in scans:
+                connected = rows.get()
+                if isinstance(connected, Exception):
+                    raise connected
+                if not connected:
+                    LOG.debug('No connection available to scan %(table)s '
+                              'in %(count)d ranges, scanning it at once',
+                              {'table': table_name, 'count': len(scans)})
+                    stopped.set()
+                    row_range = [(row_ranges[0][0], row_ranges[-1][1])]
+                    for row, data in self._scan(table_name, row_range,
+                                                limit, **kwargs):
+                        yield row, data
+                    return
+            # the index keeps data dicts from being compared
+            for row, index, data in itertools.islice(
+                    heapq.merge(*[scan for rows, scan in scans]), limit):
+                yield row, data
+        finally:
+            # stop the scans still running if the merge is left early
+            stopped.set()
+
+    def _scan_range(self, table_name, row_start, row_stop, limit, kwargs,
+                    rows, stopped):
+        """Scan a row range, queuing its rows for _read_scan().
+
+        Whether a connection was acquired is queued first.
+        """
+
+        def _put(item):
+            while not stopped.is_set():
+                try:
+                    rows.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            with self.conn_pool.connection(
+                    timeout=SCAN_CONNECTION_TIMEOUT) as conn:
+                if not _put(True):
+                    return
+                scan = conn.table(table_name).scan(
+                    row_start=row_start, row_stop=row_stop, limit=limit,
+                    **kwargs)
+                try:
+                    for item in scan:
+                        if not _put(item):
+                            return
+                finally:
+                    scan.close()
+        except happybase.NoConnectionsAvailable:
+            _put(False)
+        except Exception as e:
+            _put(e)
+        else:
+            _put(None)
+
+    @staticmethod
+    def _read_scan(rows, index):
+        """Read the rows queued by _scan_range(), tagged with the index."""
+        while True:
+            item = rows.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item[0], index, item[1]
+
+    def _sample_row_ranges(self, sample_filter, start_row, stop_row):
+        """Split the rows of a sample query into ranges scanned concurrently.
+
+        The rows of a meter are sorted by reversed timestamp, those of a
+        query on a meter and time range are split into periods of equal
+        length. Other queries are not split.
+        """
+        if (self._scan_shards < 2 or not sample_filter.meter or
+                not sample_filter.start_timestamp):
+            return [(start_row, stop_row)]
+        rts_low = hbase_utils.timestamp(sample_filter.end_timestamp or
+                                        timeutils.utcnow())
+        rts_high = hbase_utils.timestamp(sample_filter.start_timestamp)
+        return hbase_utils.split_row_range(
+            start_row, stop_row,
+            hbase_utils.make_rts_boundaries(sample_filter.meter, rts_low,
+                                            rts_high, self._scan_shards))
+
+    def _resource_row_ranges(self):
+        """Split the resource table into ranges scanned concurrently."""
+        count = min(self._scan_shards, len(RESOURCE_ROW_ALPHABET))
+        boundaries = [hbase_utils.encode_unicode(
+            RESOURCE_ROW_ALPHABET[len(RESOURCE_ROW_ALPHABET) * i // count])
+            for i in range(1, count)]
+        return hbase_utils.split_row_range(None, None, boundaries)
+
     def get_resources(self, user=None, project=None, source=None,
                       start_timestamp=None, start_timestamp_op=None,
                       end_timestamp=None, end_timestamp_op=None,
@@ -212,8 +465,9 @@ class Connection(hbase_base.Connection, base.Connection):
         with self.conn_pool.connection() as conn:
             resource_table = conn.table(self.RESOURCE_TABLE)
             LOG.debug("Query Resource table: %s", q)
-            for resource_id, data in resource_table.scan(filter=q,
-                                                         limit=limit):
+            for resource_id, data in self._scan(self.RESOURCE_TABLE,
+                                                self._resource_row_ranges(),
+                                                filter=q, limit=limit):
                 f_res, sources, meters, md = hbase_utils.deserialize_entry(
                     data)
                 resource_id = hbase_utils.encode_unicode(resource_id)
@@ -256,40 +510,38 @@ class Connection(hbase_base.Connection, base.Connection):
 
         metaquery = metaquery or {}
 
-        with self.conn_pool.connection() as conn:
-            resource_table = conn.table(self.RESOURCE_TABLE)
-            q = hbase_utils.make_query(metaquery=metaquery, user_id=user,
-                                       project_id=project,
-                                       resource_id=resource,
-                                       source=source)
-            LOG.debug("Query Resource table: %s", q)
-
-            gen = resource_table.scan(filter=q)
-            # We need result set to be sure that user doesn't receive several
-            # same meters. Please see bug
-            # https://bugs.launchpad.net/ceilometer/+bug/1301371
-            result = set()
-            for ignored, data in gen:
-                flatten_result, s, meters, md = hbase_utils.deserialize_entry(
-                    data)
-                for m in meters:
-                    if limit and len(result) >= limit:
-                        return
-                    _m_rts, m_source, name, m_type, unit = m[0]
-                    meter_dict = {'name': name,
-                                  'type': m_type,
-                                  'unit': unit,
-                                  'resource_id': flatten_result['resource_id'],
-                                  'project_id': flatten_result['project_id'],
-                                  'user_id': flatten_result['user_id']}
-                    frozen_meter = frozenset(meter_dict.items())
-                    if frozen_meter in result:
-                        continue
-                    result.add(frozen_meter)
-                    meter_dict.update({'source': m_source
-                                       if m_source else None})
-
-                    yield models.Meter(**meter_dict)
+        q = hbase_utils.make_query(metaquery=metaquery, user_id=user,
+                                   project_id=project,
+                                   resource_id=resource,
+                                   source=source)
+        LOG.debug("Query Resource table: %s", q)
+
+        gen = self._scan(self.RESOURCE_TABLE, self._resource_row_ranges(),
+                         filter=q)
+        # We need result set to be sure that user doesn't receive several
+        # same meters. Please see bug
+        # https://bugs.launchpad.net/ceilometer/+bug/1301371
+        result = set()
+        for ignored, data in gen:
+            flatten_result, s, meters, md = hbase_utils.deserialize_entry(data)
+            for m in meters:
+                if limit and len(result) >= limit:
+                    return
+                _m_rts, m_source, name, m_type, unit = m[0]
+                meter_dict = {'name': name,
+                              'type': m_type,
+                              'unit': unit,
+                              'resource_id': flatten_result['resource_id'],
+                              'project_id': flatten_result['project_id'],
+                              'user_id': flatten_result['user_id']}
+                frozen_meter = frozenset(meter_dict.items())
+                if frozen_meter in result:
+                    continue
+                result.add(frozen_meter)
+                meter_dict.update({'source': m_source
+                                   if m_source else None})
+
+                yield models.Meter(**meter_dict)
 
     def get_samples(self, sample_filter, limit=None):
         """Return an iterable of models.Sample instances.
@@ -299,43 +551,41 @@ class Connection(hbase_base.Connection, base.Connection):
         """
         if limit == 0:
             return
-        with self.conn_pool.connection() as conn:
-            meter_table = conn.table(self.METER_TABLE)
-            q, start, stop, columns = (hbase_utils.
-                                       make_sample_query_from_filter
-                                       (sample_filter, require_meter=False))
-            LOG.debug("Query Meter Table: %s", q)
-            gen = meter_table.scan(filter=q, row_start=start, row_stop=stop,
-                                   limit=limit, columns=columns)
-            for ignored, meter in gen:
-                d_meter = hbase_utils.deserialize_entry(meter)[0]
-                d_meter['message']['counter_volume'] = (
-                    float(d_meter['message']['counter_volume']))
-                d_meter['message']['recorded_at'] = d_meter['recorded_at']
-                yield models.Sample(**d_meter['message'])
+        q, start, stop, columns = (hbase_utils.
+                                   make_sample_query_from_filter
+                                   (sample_filter, require_meter=False))
+        LOG.debug("Query Meter Table: %s", q)
+        gen = self._scan(self.METER_TABLE,
+                         self._sample_row_ranges(sample_filter, start, stop),
+                         filter=q, limit=limit, columns=columns)
+        for ignored, meter in gen:
+            d_meter = hbase_utils.deserialize_entry(meter)[0]
+            d_meter['message']['counter_volume'] = (
+                float(d_meter['message']['counter_volume']))
+            d_meter['message']['recorded_at'] = d_meter['recorded_at']
+            yield models.Sample(**d_meter['message'])
 
     @staticmethod
-    def _update_meter_stats(stat, meter):
-        """Do the stats calculation on a requested time bucket in stats dict
-
-        :param stats: dict where aggregated stats are kept
-        :param index: time bucket index in stats
-        :param meter: meter record as returned from HBase
-        :param start_time: query start time
-        :param period: length of the time bucket
+    def _get_cardinality_fields(aggregate):
+        """Check the selectable aggregates and return the cardinality fields.
+
+        :param aggregate: list of aggregates to compute, or None for the
+          standard ones.
         """
-        vol = meter['counter_volume']
-        ts = meter['timestamp']
-        stat.unit = meter['counter_unit']
-        stat.min = min(vol, stat.min or vol)
-        stat.max = max(vol, stat.max)
-        stat.sum = vol + (stat.sum or 0)
-        stat.count += 1
-        stat.avg = (stat.sum / float(stat.count))
-        stat.duration_start = min(ts, stat.duration_start or ts)
-        stat.duration_end = max(ts, stat.duration_end or ts)
-        stat.duration = (timeutils.delta_seconds(stat.duration_start,
-                                                 stat.duration_end))
+        fields = []
+        for a in aggregate or []:
+            if a.func in STANDARD_AGGREGATES or a.func == 'stddev':
+                continue
+            elif a.func == 'cardinality':
+                if a.param not in CARDINALITY_FIELDS:
+                    raise storage.StorageBadAggregate('Bad aggregate: %s.%s'
+                                                      % (a.func, a.param))
+                fields.append(a.param)
+            else:
+                raise ceilometer.NotImplementedError(
+                    'Selectable aggregate function %s'
+                    ' is not supported' % a.func)
+        return fields
 
     def get_meter_statistics(self, sample_filter, period=None, groupby=None,
                              aggregate=None):
@@ -347,78 +597,96 @@ class Connection(hbase_base.Connection, base.Connection):
         .. note::
 
           Due to HBase limitations the aggregations are implemented
-          in the driver itself, therefore this method will be quite slow
-          because of all the Thrift traffic it is going to create.
+          in the driver itself. The scan is consumed as a stream and only
+          the columns needed by the statistics are fetched, so the memory
+          used depends on the number of periods and groups returned, not
+          on the number of samples scanned.
         """
-        if groupby:
-            raise ceilometer.NotImplementedError("Group by not implemented.")
-
-        if aggregate:
-            raise ceilometer.NotImplementedError(
-                'Selectable aggregates not implemented')
+        groupby = groupby or []
+        for group in groupby:
+            if group not in GROUPBY_COLUMNS:
+                raise ceilometer.NotImplementedError('Unable to group by '
+                                                     'these fields')
+        cardinality = self._get_cardinality_fields(aggregate)
+        period = period or 0
 
         with self.conn_pool.connection() as conn:
             meter_table = conn.table(self.METER_TABLE)
             q, start, stop, columns = (hbase_utils.
                                        make_sample_query_from_filter
                                        (sample_filter))
-            # These fields are used in statistics' calculating
-            columns.extend(['f:timestamp', 'f:counter_volume',
-                            'f:counter_unit'])
-            meters = map(hbase_utils.deserialize_entry,
-                         list(meter for (ignored, meter) in
-                              meter_table.scan(
-                                  filter=q, row_start=start,
-                                  row_stop=stop, columns=columns)))
+            # The raw message is by far the largest cell of a row, and
+            # neither it nor the recording time is used here.
+            columns = [c for c in columns
+                       if c not in ('f:message', 'f:recorded_at')]
 
-        if sample_filter.start_timestamp:
             start_time = sample_filter.start_timestamp
-        elif meters:
-            start_time = meters[-1][0]['timestamp']
-        else:
-            start_time = None
+            if period and not start_time:
+                # NOTE: periods are counted from the oldest sample, which
+                # comes last as HBase meters are stored as newest-first.
+                # Find it with a first scan of the timestamps only, rather
+                # than keeping the samples around until it is known.
+                for ignored, meter in meter_table.scan(
+                        filter=q, row_start=start, row_stop=stop,
+                        columns=columns + ['f:timestamp']):
+                    start_time = meter['f:timestamp']
+                if start_time is None:
+                    return []
+                start_time = hbase_utils.load(start_time)
 
-        if sample_filter.end_timestamp:
-            end_time = sample_filter.end_timestamp
-        elif meters:
-            end_time = meters[0][0]['timestamp']
-        else:
-            end_time = None
+            columns.extend(['f:timestamp', 'f:counter_volume',
+                            'f:counter_unit'])
+            columns.extend('f:%s' % field for field in cardinality)
+            for group in groupby:
+                if GROUPBY_COLUMNS[group] is None:
+                    # The source is only known from the qualifier of its
+                    # cell, so the whole row has to be fetched.
+                    columns = None
+                    break
+                columns.append(GROUPBY_COLUMNS[group])
+
+            stats = {}
+            for ignored, meter in meter_table.scan(
+                    filter=q, row_start=start, row_stop=stop,
+                    columns=columns):
+                flatten, sources, ignored, metadata = (
+                    hbase_utils.deserialize_entry(meter, get_raw_meta=False))
+                if period:
+                    offset = int(timeutils.delta_seconds(
+                        start_time, flatten['timestamp']) / period) * period
+                    period_start = start_time + datetime.timedelta(0, offset)
+                else:
+                    period_start = None
+                key = (period_start, tuple(
+                    self._get_group_value(group, flatten, sources, metadata)
+                    for group in groupby))
+                if key not in stats:
+                    stats[key] = StatisticsAccumulator(cardinality)
+                stats[key].update(flatten)
 
         results = []
-
-        if not period:
-            period = 0
-            period_start = start_time
-            period_end = end_time
-
-        # As our HBase meters are stored as newest-first, we need to iterate
-        # in the reverse order
-        for meter in meters[::-1]:
-            ts = meter[0]['timestamp']
+        # NOTE: the group values may be None, which does not compare with
+        # strings on Python 3.
+        for (period_start, values), stat in sorted(
+                stats.items(), key=lambda item: (
+                    item[0][0], [(v is not None, v) for v in item[0][1]])):
             if period:
-                offset = int(timeutils.delta_seconds(
-                    start_time, ts) / period) * period
-                period_start = start_time + datetime.timedelta(0, offset)
-
-            if not results or not results[-1].period_start == period_start:
-                if period:
-                    period_end = period_start + datetime.timedelta(
-                        0, period)
-                results.append(
-                    models.Statistics(unit='',
-                                      count=0,
-                                      min=0,
-                                      max=0,
-                                      avg=0,
-                                      sum=0,
-                                      period=period,
-                                      period_start=period_start,
-                                      period_end=period_end,
-                                      duration=None,
-                                      duration_start=None,
-                                      duration_end=None,
-                                      groupby=None)
-                )
-            self._update_meter_stats(results[-1], meter[0])
+                period_end = period_start + datetime.timedelta(0, period)
+            else:
+                period_start = (sample_filter.start_timestamp or
+                                stat.duration_start)
+                period_end = (sample_filter.end_timestamp or
+                              stat.duration_end)
+            results.append(stat.to_statistics(
+                period, period_start, period_end,
+                dict(zip(groupby, values)) if groupby else None,
+                aggregate))
         return results
+
+    @staticmethod
+    def _get_group_value(group, flatten, sources, metadata):
+        if group == 'source':
+            return sources[0] if sources else None
+        elif group.startswith('resource_metadata.'):
+            return metadata.get(group[len('resource_metadata.'):])
+        return flatten.get(group)
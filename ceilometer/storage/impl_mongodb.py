@@ -306,6 +306,90 @@ class Connection(pymongo_base.Connection):
 
         self.db.meter.insert_one(record)
 
+    @staticmethod
+    def _resource_batch_ops(resource_id, samples):
+        """Build the resource upserts equivalent to recording samples in turn.
+
+        :param resource_id: id of the resource the samples belong to
+        :param samples: samples of the resource, in reception order
+        """
+        meters = []
+        first = latest = samples[0]
+        for data in samples:
+            meter = {'counter_name': data['counter_name'],
+                     'counter_type': data['counter_type'],
+                     'counter_unit': data['counter_unit']}
+            if meter not in meters:
+                meters.append(meter)
+            if data['timestamp'] < first['timestamp']:
+                first = data
+            if data['timestamp'] >= latest['timestamp']:
+                latest = data
+        last = samples[-1]
+        return [
+            pymongo.UpdateOne(
+                {'_id': resource_id},
+                {'$set': {'project_id': last['project_id'],
+                          'user_id': last['user_id'],
+                          'source': last['source'],
+                          },
+                 '$setOnInsert': {
+                     'metadata': latest['resource_metadata'],
+                     'first_sample_timestamp': first['timestamp'],
+                     'last_sample_timestamp': latest['timestamp'],
+                 },
+                 '$addToSet': {'meter': {'$each': meters}},
+                 },
+                upsert=True),
+            # only update last sample timestamp if actually later
+            pymongo.UpdateOne(
+                {'_id': resource_id,
+                 '$or': [{'last_sample_timestamp': None},
+                         {'last_sample_timestamp':
+                          {'$lte': latest['timestamp']}}]},
+                {'$set': {'metadata': latest['resource_metadata'],
+                          'last_sample_timestamp': latest['timestamp']}}),
+            # only update first sample timestamp if actually earlier, a null
+            # first sample timestamp is left alone as in
+            # record_metering_data
+            pymongo.UpdateOne(
+                {'_id': resource_id,
+                 'first_sample_timestamp': {'$gt': first['timestamp']}},
+                {'$set': {'first_sample_timestamp': first['timestamp']}}),
+        ]
+
+    def record_metering_data_batch(self, samples):
+        """Write a list of samples to the backend storage system.
+
+        All the samples of a resource are folded into the same resource
+        upserts, sent with a single ordered bulk_write, and the raw samples
+        are then stored with one insert_many.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
+        if not samples:
+            return
+        records = []
+        by_resource = {}
+        recorded_at = timeutils.utcnow()
+        for data in samples:
+            # Use a copy so we do not modify a data structure owned by our
+            # caller (the driver adds a new key '_id').
+            record = copy.deepcopy(data)
+            record['resource_metadata'] = pymongo_utils.improve_keys(
+                record.pop('resource_metadata'))
+            record['recorded_at'] = recorded_at
+            records.append(record)
+            by_resource.setdefault(record['resource_id'], []).append(record)
+
+        requests = []
+        for resource_id, resource_samples in six.iteritems(by_resource):
+            requests.extend(self._resource_batch_ops(resource_id,
+                                                     resource_samples))
+        self.db.resource.bulk_write(requests, ordered=True)
+        self.db.meter.insert_many(records)
+
     def clear_expired_metering_data(self, ttl):
         """Clear expired data from the backend storage system.
 
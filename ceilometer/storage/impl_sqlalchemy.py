@@ -16,6 +16,7 @@
 from __future__ import absolute_import
 import datetime
 import hashlib
+import math
 import os
 
 from oslo_config import cfg
@@ -34,7 +35,7 @@ from sqlalchemy.orm import aliased
 from sqlalchemy.sql.expression import cast
 
 import ceilometer
-from ceilometer.i18n import _, _LI
+from ceilometer.i18n import _, _LI, _LW
 from ceilometer import storage
 from ceilometer.storage import base
 from ceilometer.storage import models as api_models
@@ -96,6 +97,108 @@ AVAILABLE_STORAGE_CAPABILITIES = {
     'storage': {'production_ready': True},
 }
 
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Seconds between the checks of the rollup periods maintained by the other
+# writers, see Connection._disable_unmaintained_rollups()
+ROLLUP_CHECK_INTERVAL = 600
+
+
+def rollup_start(timestamp, period):
+    """Return the start of the rollup period holding a timestamp.
+
+    :param timestamp: naive UTC datetime
+    :param period: length of the rollup periods, in seconds
+    """
+    delta = timestamp - EPOCH
+    seconds = delta.days * 86400 + delta.seconds
+    return EPOCH + datetime.timedelta(seconds=seconds - seconds % period)
+
+
+def merge_moments(count, mean, m2, other_count, other_mean, other_m2):
+    """Merge the count, mean and squared deviations of two sets of volumes.
+
+    Uses the pairwise formula of Chan et al., which keeps its precision when
+    the volumes are large compared to their deviations, unlike a variance
+    computed from sums of squares.
+
+    :param m2: sum of the squared deviations of the volumes from their mean
+    :return: the (count, mean, m2) tuple of the union of the two sets
+    """
+    total = count + other_count
+    delta = other_mean - mean
+    return (total, mean + delta * other_count / total,
+            m2 + other_m2 + delta * delta * count * other_count / total)
+
+
+class RollupResult(object):
+    """Statistics merged from rollup rows, for a period and group."""
+
+    def __init__(self, row, groupby, cardinality):
+        self.unit = row.unit
+        self.tsmin = row.tsmin
+        self.tsmax = row.tsmax
+        self.count = 0
+        self.sum = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.groupby = dict((g, getattr(row, g)) for g in groupby or [])
+        self.distinct = dict((p, set()) for p in cardinality)
+
+    def add(self, row):
+        self.tsmin = min(self.tsmin, row.tsmin)
+        self.tsmax = max(self.tsmax, row.tsmax)
+        count = int(row.count)
+        # NOTE: the squared deviations are only selected for the stddev, as
+        # the rollups cannot be summed up in the database then.
+        m2 = getattr(row, 'm2', None)
+        if m2 is not None:
+            _, self.mean, self.m2 = merge_moments(
+                self.count, self.mean, self.m2,
+                count, float(row.sum) / count, float(m2))
+        self.count += count
+        self.sum += float(row.sum)
+        self.min = (float(row.min) if self.min is None
+                    else min(self.min, float(row.min)))
+        self.max = (float(row.max) if self.max is None
+                    else max(self.max, float(row.max)))
+        for p, values in six.iteritems(self.distinct):
+            values.add(getattr(row, 'cardinality/%s' % p))
+
+    def as_row(self, aggregate):
+        """Return an object with the attributes of a statistics query row.
+
+        As for a query, the standard aggregates are only set when selected.
+        """
+        avg = self.sum / self.count
+        values = dict(count=self.count, min=self.min, max=self.max,
+                      sum=self.sum, avg=avg)
+        if aggregate:
+            # NOTE: a query row has no count when it is not selected
+            row = dict((a.func, values[a.func]) for a in aggregate
+                       if a.func in STANDARD_AGGREGATES)
+            row.setdefault('count', None)
+            for a in aggregate:
+                if a.func == 'stddev':
+                    row['stddev'] = math.sqrt(self.m2 / self.count)
+                elif a.func == 'cardinality':
+                    row['cardinality/%s' % a.param] = len(
+                        self.distinct[a.param])
+        else:
+            row = values
+        row.update(self.groupby, unit=self.unit, tsmin=self.tsmin,
+                   tsmax=self.tsmax)
+        return RollupRow(row)
+
+
+class RollupRow(object):
+    """Attribute access to the values of a statistics row."""
+
+    def __init__(self, values):
+        self.__dict__.update(values)
+
 
 def apply_metaquery_filter(session, query, metaquery):
     """Apply provided metaquery filter to existing query.
@@ -208,6 +311,27 @@ class Connection(base.Connection):
               message_signature: message signature
               message_id: message uuid
               }
+        - rollup
+          - the statistics of the samples of a meter and resource over a
+            period, for each of the sql_rollup_periods
+          - { period: length of the period in seconds
+              meter_id: meter id            (->meter.id)
+              resource_id: resource id      (->resource.internal_id)
+              period_start: datetime
+              count: number of samples
+              volume_sum: sum of the volumes
+              volume_min: smallest volume
+              volume_max: largest volume
+              duration_start: datetime of the first sample
+              duration_end: datetime of the last sample
+              volume_m2: sum of the squared deviations of the volumes
+                         from their mean
+              }
+        - rollup_coverage
+          - the time from which the rollups of a period hold all samples
+          - { period: length of the period in seconds
+              start: datetime
+              }
     """
     CAPABILITIES = utils.update_nested(base.Connection.CAPABILITIES,
                                        AVAILABLE_CAPABILITIES)
@@ -224,6 +348,15 @@ class Connection(base.Connection):
         options = dict(cfg.CONF.database.items())
         options['max_retries'] = 0
         self._engine_facade = db_session.EngineFacade(url, **options)
+        self._meter_cache = utils.LRUCache(
+            cfg.CONF.database.sql_meter_cache_size)
+        self._resource_cache = utils.LRUCache(
+            cfg.CONF.database.sql_resource_cache_size)
+        self._rollup_periods = sorted(set(
+            int(p) for p in cfg.CONF.database.sql_rollup_periods
+            if int(p) > 0))
+        self._rollup_coverage = {}
+        self._rollup_checked_at = None
 
     def upgrade(self):
         # NOTE(gordc): to minimise memory, only import migration when needed
@@ -237,10 +370,51 @@ class Connection(base.Connection):
         for table in reversed(models.Base.metadata.sorted_tables):
             engine.execute(table.delete())
         engine.dispose()
+        self._clear_id_caches()
+        self._rollup_coverage = {}
+        self._rollup_checked_at = None
+
+    def _clear_id_caches(self):
+        self._meter_cache.clear()
+        self._resource_cache.clear()
+
+    def id_cache_stats(self):
+        """Return the hit and miss counters of the meter and resource caches.
+
+        Meant to help sizing the sql_meter_cache_size and
+        sql_resource_cache_size options.
+        """
+        return {'meter': self._meter_cache.stats(),
+                'resource': self._resource_cache.stats()}
+
+    @staticmethod
+    def _metadata_hash(rmeta):
+        m_hash = jsonutils.dumps(rmeta, sort_keys=True)
+        if six.PY3:
+            m_hash = m_hash.encode('utf-8')
+        return hashlib.md5(m_hash).hexdigest()
+
+    @staticmethod
+    def _build_meta_map(meta_map, internal_id, rmeta):
+        """Add the queryable metadata rows of a resource to meta_map.
+
+        :param meta_map: dict of metadata model to list of rows to insert
+        :param internal_id: internal id of the resource owning the metadata
+        :param rmeta: resource metadata dictionary
+        """
+        if not (rmeta and isinstance(rmeta, dict)):
+            return
+        for key, v in utils.dict_to_keyval(rmeta):
+            try:
+                _model = sql_utils.META_TYPE_MAP[type(v)]
+                meta_map.setdefault(_model, []).append(
+                    {'id': internal_id, 'meta_key': key, 'value': v})
+            except KeyError:
+                LOG.warn(_("Unknown metadata type. Key (%s) "
+                         "will not be queryable."), key)
 
     @staticmethod
     def _create_meter(conn, name, type, unit):
-        # TODO(gordc): implement lru_cache to improve performance
         try:
             meter = models.Meter.__table__
             trans = conn.begin_nested()
@@ -265,14 +439,10 @@ class Connection(base.Connection):
 
     @staticmethod
     def _create_resource(conn, res_id, user_id, project_id, source_id,
-                         rmeta):
-        # TODO(gordc): implement lru_cache to improve performance
+                         rmeta, m_hash=None):
         try:
             res = models.Resource.__table__
-            m_hash = jsonutils.dumps(rmeta, sort_keys=True)
-            if six.PY3:
-                m_hash = m_hash.encode('utf-8')
-            m_hash = hashlib.md5(m_hash).hexdigest()
+            m_hash = m_hash or Connection._metadata_hash(rmeta)
             trans = conn.begin_nested()
             if conn.dialect.name == 'sqlite':
                 trans = conn.begin()
@@ -293,30 +463,173 @@ class Connection(base.Connection):
                                           resource_metadata=rmeta,
                                           metadata_hash=m_hash)
                     internal_id = result.inserted_primary_key[0]
-                    if rmeta and isinstance(rmeta, dict):
-                        meta_map = {}
-                        for key, v in utils.dict_to_keyval(rmeta):
-                            try:
-                                _model = sql_utils.META_TYPE_MAP[type(v)]
-                                if meta_map.get(_model) is None:
-                                    meta_map[_model] = []
-                                meta_map[_model].append(
-                                    {'id': internal_id, 'meta_key': key,
-                                     'value': v})
-                            except KeyError:
-                                LOG.warn(_("Unknown metadata type. Key (%s) "
-                                         "will not be queryable."), key)
-                        for _model in meta_map.keys():
-                            conn.execute(_model.__table__.insert(),
-                                         meta_map[_model])
+                    meta_map = {}
+                    Connection._build_meta_map(meta_map, internal_id, rmeta)
+                    for _model in meta_map.keys():
+                        conn.execute(_model.__table__.insert(),
+                                     meta_map[_model])
 
         except dbexc.DBDuplicateEntry:
             # retry function to pick up duplicate committed object
             internal_id = Connection._create_resource(
-                conn, res_id, user_id, project_id, source_id, rmeta)
+                conn, res_id, user_id, project_id, source_id, rmeta, m_hash)
 
         return internal_id
 
+    def _get_rollup_coverage(self):
+        """Return the time covered by the rollups of each configured period.
+
+        A period not known yet is covered from its next boundary on, as the
+        samples of the current one have not all been rolled up. The periods
+        of the other writers are checked every ROLLUP_CHECK_INTERVAL.
+        """
+        now = timeutils.utcnow()
+        if (self._rollup_checked_at is None or
+                timeutils.delta_seconds(self._rollup_checked_at, now) >=
+                ROLLUP_CHECK_INTERVAL):
+            self._disable_unmaintained_rollups(now)
+            self._rollup_checked_at = now
+        missing = [p for p in self._rollup_periods
+                   if p not in self._rollup_coverage]
+        if missing:
+            coverage = models.RollupCoverage.__table__
+            engine = self._engine_facade.get_engine()
+            with engine.begin() as conn:
+                known = dict((row.period, row.start) for row in conn.execute(
+                    sa.select([coverage.c.period, coverage.c.start])))
+            for period in missing:
+                start = known.get(period)
+                if start is None:
+                    start = rollup_start(now, period) + datetime.timedelta(
+                        seconds=period)
+                    try:
+                        with engine.begin() as conn:
+                            conn.execute(coverage.insert(), period=period,
+                                         start=start)
+                    except dbexc.DBDuplicateEntry:
+                        # another writer registered the period first
+                        with engine.begin() as conn:
+                            start = conn.execute(
+                                sa.select([coverage.c.start])
+                                .where(coverage.c.period == period)).scalar()
+                self._rollup_coverage[period] = start
+        return dict((p, self._rollup_coverage[p])
+                    for p in self._rollup_periods)
+
+    def _disable_unmaintained_rollups(self, now):
+        """Stop the use of the rollups of periods this writer does not have.
+
+        The rollups of a period miss the samples recorded by the writers
+        without it. Their coverage is moved past the time this writer may
+        record samples until its next check, so that statistics queries of
+        that time are answered from the samples. Once all the writers have
+        the period, the coverage stays at the boundary it was last moved to.
+
+        :param now: time of the check
+        """
+        until = now + datetime.timedelta(seconds=ROLLUP_CHECK_INTERVAL)
+        coverage = models.RollupCoverage.__table__
+        engine = self._engine_facade.get_engine()
+        with engine.begin() as conn:
+            for period, start in conn.execute(
+                    sa.select([coverage.c.period, coverage.c.start])):
+                if period in self._rollup_periods:
+                    continue
+                start_after = rollup_start(until, period) + datetime.timedelta(
+                    seconds=period)
+                if start >= start_after:
+                    continue
+                LOG.warning(_LW("The rollups of %ss periods are maintained by "
+                                "other writers, they are not used until "
+                                "%s as this one records samples without "
+                                "them, see sql_rollup_periods."),
+                            period, start_after)
+                conn.execute(coverage.update()
+                             .where(coverage.c.period == period)
+                             .where(coverage.c.start < start_after)
+                             .values(start=start_after))
+
+    @staticmethod
+    def _update_rollups(conn, coverage, samples):
+        """Add samples to the rollups of the periods covering them.
+
+        The samples are first merged per rollup, then each rollup is
+        read, merged with them and updated in place, or created when it does
+        not exist yet.
+
+        :param conn: connection with an open transaction
+        :param coverage: dict mapping each rollup period to the time
+                         its rollups are maintained from
+        :param samples: iterable of (meter id, resource internal id,
+                        timestamp, volume) tuples
+        """
+        rollups = {}
+        for meter_id, resource_id, timestamp, volume in samples:
+            if volume is None:
+                continue
+            for period, start in six.iteritems(coverage):
+                if timestamp < start:
+                    continue
+                key = (period, meter_id, resource_id,
+                       rollup_start(timestamp, period))
+                r = rollups.get(key)
+                if r is None:
+                    rollups[key] = [1, volume, volume, volume, float(volume),
+                                    0.0, timestamp, timestamp]
+                else:
+                    r[0] += 1
+                    r[1] += volume
+                    r[2] = min(r[2], volume)
+                    r[3] = max(r[3], volume)
+                    # Welford's algorithm for the mean and squared deviations
+                    delta = volume - r[4]
+                    r[4] += delta / r[0]
+                    r[5] += delta * (volume - r[4])
+                    r[6] = min(r[6], timestamp)
+                    r[7] = max(r[7], timestamp)
+
+        rollup = models.Rollup.__table__
+        # NOTE: update the rows in a stable order to avoid deadlocks
+        # between concurrent writers.
+        for key in sorted(rollups):
+            count, v_sum, v_min, v_max, mean, m2, ts_min, ts_max = rollups[key]
+            where = sa.and_(rollup.c.period == key[0],
+                            rollup.c.meter_id == key[1],
+                            rollup.c.resource_id == key[2],
+                            rollup.c.period_start == key[3])
+            # NOTE: the stored rollup is read under a lock and merged here,
+            # as its squared deviations only merge along with its count and
+            # sum, and MySQL evaluates the assignments of an UPDATE from left
+            # to right.
+            select = sa.select([rollup]).where(where).with_for_update()
+            row = conn.execute(select).first()
+            if row is None:
+                try:
+                    trans = conn.begin_nested()
+                    if conn.dialect.name == 'sqlite':
+                        trans = conn.begin()
+                    with trans:
+                        conn.execute(rollup.insert(), period=key[0],
+                                     meter_id=key[1], resource_id=key[2],
+                                     period_start=key[3], count=count,
+                                     volume_sum=v_sum, volume_min=v_min,
+                                     volume_max=v_max, volume_m2=m2,
+                                     duration_start=ts_min,
+                                     duration_end=ts_max)
+                    continue
+                except dbexc.DBDuplicateEntry:
+                    # a concurrent writer created the rollup in the meantime
+                    row = conn.execute(select).first()
+            count, _, m2 = merge_moments(
+                row.count, row.volume_sum / row.count, row.volume_m2,
+                count, mean, m2)
+            conn.execute(rollup.update().where(where).values(
+                count=count, volume_sum=row.volume_sum + v_sum,
+                volume_min=min(row.volume_min, v_min),
+                volume_max=max(row.volume_max, v_max), volume_m2=m2,
+                duration_start=min(row.duration_start, ts_min),
+                duration_end=max(row.duration_end, ts_max)))
+
     @api.wrap_db_retry(retry_interval=cfg.CONF.database.retry_interval,
                        max_retries=cfg.CONF.database.max_retries,
                        retry_on_deadlock=True)
@@ -326,26 +639,237 @@ class Connection(base.Connection):
         :param data: a dictionary such as returned by
                      ceilometer.meter.meter_message_from_counter
         """
+        m_key = (data['counter_name'], data['counter_type'],
+                 data['counter_unit'])
+        rmeta = data['resource_metadata']
+        r_key = (data['resource_id'], data['user_id'], data['project_id'],
+                 data['source'], self._metadata_hash(rmeta))
+        m_id = self._meter_cache.get(m_key)
+        res_id = self._resource_cache.get(r_key)
+        cached = m_id is not None or res_id is not None
+        coverage = self._get_rollup_coverage()
+
         engine = self._engine_facade.get_engine()
-        with engine.begin() as conn:
-            # Record the raw data for the sample.
-            m_id = self._create_meter(conn,
-                                      data['counter_name'],
-                                      data['counter_type'],
-                                      data['counter_unit'])
-            res_id = self._create_resource(conn,
-                                           data['resource_id'],
-                                           data['user_id'],
-                                           data['project_id'],
-                                           data['source'],
-                                           data['resource_metadata'])
-            sample = models.Sample.__table__
-            conn.execute(sample.insert(), meter_id=m_id,
-                         resource_id=res_id,
-                         timestamp=data['timestamp'],
-                         volume=data['counter_volume'],
-                         message_signature=data['message_signature'],
-                         message_id=data['message_id'])
+        try:
+            with engine.begin() as conn:
+                # Record the raw data for the sample.
+                if m_id is None:
+                    m_id = self._create_meter(conn, *m_key)
+                if res_id is None:
+                    res_id = self._create_resource(conn,
+                                                   data['resource_id'],
+                                                   data['user_id'],
+                                                   data['project_id'],
+                                                   data['source'],
+                                                   rmeta, r_key[4])
+                sample = models.Sample.__table__
+                conn.execute(sample.insert(), meter_id=m_id,
+                             resource_id=res_id,
+                             timestamp=data['timestamp'],
+                             volume=data['counter_volume'],
+                             message_signature=data['message_signature'],
+                             message_id=data['message_id'])
+                if coverage:
+                    self._update_rollups(conn, coverage, [
+                        (m_id, res_id, data['timestamp'],
+                         data['counter_volume'])])
+        except dbexc.DBReferenceError:
+            if not cached:
+                raise
+            # NOTE: the cached ids may refer to meters or resources
+            # expired by another process, start over without them.
+            self._clear_id_caches()
+            return self.record_metering_data(data)
+        # only cache ids once they are committed
+        self._meter_cache[m_key] = m_id
+        self._resource_cache[r_key] = res_id
+
+    @staticmethod
+    def _create_meters(conn, keys):
+        """Resolve the ids of a set of meters, creating the missing ones.
+
+        :param conn: connection with an open transaction
+        :param keys: set of (name, type, unit) tuples
+        :return: dict mapping each (name, type, unit) tuple to its meter id
+        """
+        meter = models.Meter.__table__
+        meter_ids = {}
+
+        def _lookup(wanted):
+            rows = conn.execute(
+                sa.select([meter.c.id, meter.c.name,
+                           meter.c.type, meter.c.unit])
+                .where(meter.c.name.in_(set(k[0] for k in wanted))))
+            for row in rows:
+                key = (row.name, row.type, row.unit)
+                if key in wanted:
+                    meter_ids[key] = row.id
+
+        _lookup(keys)
+        missing = keys - set(meter_ids)
+        if not missing:
+            return meter_ids
+        try:
+            trans = conn.begin_nested()
+            if conn.dialect.name == 'sqlite':
+                trans = conn.begin()
+            with trans:
+                conn.execute(meter.insert(),
+                             [dict(name=name, type=type, unit=unit)
+                              for name, type, unit in missing])
+        except dbexc.DBDuplicateEntry:
+            # a concurrent writer created some of the meters, fall back to
+            # the per meter path which picks up committed objects
+            for key in missing:
+                meter_ids[key] = Connection._create_meter(conn, *key)
+        else:
+            _lookup(missing)
+        return meter_ids
+
+    @staticmethod
+    def _create_resources(conn, resources):
+        """Resolve the internal ids of a set of resources.
+
+        The missing resources are created along with their metadata.
+
+        :param conn: connection with an open transaction
+        :param resources: dict mapping (resource_id, user_id, project_id,
+                          source_id, metadata_hash) tuples to the resource
+                          metadata
+        :return: dict mapping each resource tuple to its internal id
+        """
+        res = models.Resource.__table__
+        internal_ids = {}
+
+        def _lookup(wanted):
+            rows = conn.execute(
+                sa.select([res.c.internal_id, res.c.resource_id,
+                           res.c.user_id, res.c.project_id,
+                           res.c.source_id, res.c.metadata_hash])
+                .where(res.c.resource_id.in_(set(k[0] for k in wanted)))
+                .where(res.c.metadata_hash.in_(set(k[4] for k in wanted)))
+                .order_by(res.c.internal_id))
+            for row in rows:
+                key = (row.resource_id, row.user_id, row.project_id,
+                       row.source_id, row.metadata_hash)
+                if key in wanted:
+                    # NOTE: keep the most recent row if a resource has been
+                    # duplicated, the newly inserted one comes last.
+                    internal_ids[key] = row.internal_id
+
+        _lookup(resources)
+        missing = set(resources) - set(internal_ids)
+        if not missing:
+            return internal_ids
+        conn.execute(res.insert(),
+                     [dict(resource_id=key[0], user_id=key[1],
+                           project_id=key[2], source_id=key[3],
+                           resource_metadata=resources[key],
+                           metadata_hash=key[4])
+                      for key in missing])
+        _lookup(missing)
+
+        meta_map = {}
+        for key in missing:
+            Connection._build_meta_map(meta_map, internal_ids[key],
+                                       resources[key])
+        try:
+            trans = conn.begin_nested()
+            if conn.dialect.name == 'sqlite':
+                trans = conn.begin()
+            with trans:
+                for _model in meta_map.keys():
+                    conn.execute(_model.__table__.insert(),
+                                 meta_map[_model])
+        except dbexc.DBDuplicateEntry:
+            # a concurrent writer created the same resource and already
+            # recorded its metadata
+            pass
+        return internal_ids
+
+    @api.wrap_db_retry(retry_interval=cfg.CONF.database.retry_interval,
+                       max_retries=cfg.CONF.database.max_retries,
+                       retry_on_deadlock=True)
+    def record_metering_data_batch(self, samples):
+        """Write a list of samples to the backend storage system.
+
+        Meters and resources are deduplicated across the batch and resolved
+        with one query per table, the missing ones are created in bulk and
+        all the samples are then inserted with a single statement.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
+        if not samples:
+            return
+        meter_ids = {}
+        internal_ids = {}
+        missing_meters = set()
+        missing_resources = {}
+        sample_keys = []
+        for data in samples:
+            m_key = (data['counter_name'], data['counter_type'],
+                     data['counter_unit'])
+            rmeta = data['resource_metadata']
+            r_key = (data['resource_id'], data['user_id'],
+                     data['project_id'], data['source'],
+                     self._metadata_hash(rmeta))
+            sample_keys.append((m_key, r_key))
+            if m_key not in meter_ids and m_key not in missing_meters:
+                m_id = self._meter_cache.get(m_key)
+                if m_id is None:
+                    missing_meters.add(m_key)
+                else:
+                    meter_ids[m_key] = m_id
+            if r_key not in internal_ids and r_key not in missing_resources:
+                res_id = self._resource_cache.get(r_key)
+                if res_id is None:
+                    missing_resources[r_key] = rmeta
+                else:
+                    internal_ids[r_key] = res_id
+        cached = bool(meter_ids or internal_ids)
+        coverage = self._get_rollup_coverage()
+
+        engine = self._engine_facade.get_engine()
+        try:
+            with engine.begin() as conn:
+                new_meter_ids = (self._create_meters(conn, missing_meters)
+                                 if missing_meters else {})
+                new_internal_ids = (
+                    self._create_resources(conn, missing_resources)
+                    if missing_resources else {})
+                meter_ids.update(new_meter_ids)
+                internal_ids.update(new_internal_ids)
+                sample = models.Sample.__table__
+                conn.execute(sample.insert(),
+                             [dict(meter_id=meter_ids[m_key],
+                                   resource_id=internal_ids[r_key],
+                                   timestamp=data['timestamp'],
+                                   volume=data['counter_volume'],
+                                   message_signature=data[
+                                       'message_signature'],
+                                   message_id=data['message_id'])
+                              for data, (m_key, r_key)
+                              in zip(samples, sample_keys)])
+                if coverage:
+                    self._update_rollups(
+                        conn, coverage,
+                        ((meter_ids[m_key], internal_ids[r_key],
+                          data['timestamp'], data['counter_volume'])
+                         for data, (m_key, r_key)
+                         in zip(samples, sample_keys)))
+        except dbexc.DBReferenceError:
+            if not cached:
+                raise
+            # NOTE: the cached ids may refer to meters or resources
+            # expired by another process, start over without them.
+            self._clear_id_caches()
+            return self.record_metering_data_batch(samples)
+        # only cache ids once they are committed
+        for m_key, m_id in six.iteritems(new_meter_ids):
+            self._meter_cache[m_key] = m_id
+        for r_key, res_id in six.iteritems(new_internal_ids):
+            self._resource_cache[r_key] = res_id
 
     def clear_expired_metering_data(self, ttl):
         """Clear expired data from the backend storage system.
@@ -363,6 +887,9 @@ class Connection(base.Connection):
             rows = sample_q.delete()
             LOG.info(_LI("%d samples removed from database"), rows)
 
+        with session.begin():
+            self._expire_rollups(session, end)
+
         if not cfg.CONF.sql_expire_samples_only:
             with session.begin():
                 # remove Meter definitions with no matching samples
@@ -397,9 +924,34 @@ class Connection(base.Connection):
                               .filter(models.Resource.metadata_hash
                                       .like('delete_%')))
                 resource_q.delete(synchronize_session=False)
+            # drop the cached ids of the meters and resources removed above
+            self._clear_id_caches()
             LOG.info(_LI("Expired residual resource and"
                          " meter definition data"))
 
+    def _expire_rollups(self, session, end):
+        """Remove the rollups holding samples older than end.
+
+        The rollups of the period holding end go too, as some of their
+        samples are expired, and the coverage of each rollup period moves to
+        the next period boundary. This applies to all the periods known to
+        the database, as the periods this process is not configured with
+        may still be maintained by the collectors.
+
+        :param session: session with an open transaction
+        :param end: time before which samples are expired
+        """
+        for coverage in session.query(models.RollupCoverage).all():
+            period = coverage.period
+            rollup_q = session.query(models.Rollup).filter(
+                models.Rollup.period == period)
+            start = rollup_start(end, period)
+            if start < end:
+                start += datetime.timedelta(seconds=period)
+            rollup_q.filter(models.Rollup.period_start < start).delete(
+                synchronize_session=False)
+            coverage.start = max(coverage.start, start)
+
     def get_resources(self, user=None, project=None, source=None,
                       start_timestamp=None, start_timestamp_op=None,
                       end_timestamp=None, end_timestamp_op=None,
@@ -430,53 +982,55 @@ class Connection(base.Connection):
                                         resource=resource)
 
         session = self._engine_facade.get_session()
-        # get list of resource_ids
-        res_q = session.query(distinct(models.Resource.resource_id)).join(
-            models.Sample,
-            models.Sample.resource_id == models.Resource.internal_id)
-        res_q = make_query_from_filter(session, res_q, s_filter,
-                                       require_meter=False)
-        res_q = res_q.limit(limit) if limit else res_q
-        for res_id in res_q.all():
-
-            # get max and min sample timestamp value
-            min_max_q = (session.query(func.max(models.Sample.timestamp)
-                                       .label('max_timestamp'),
-                                       func.min(models.Sample.timestamp)
-                                       .label('min_timestamp'))
-                                .join(models.Resource,
-                                      models.Resource.internal_id ==
-                                      models.Sample.resource_id)
-                                .filter(models.Resource.resource_id ==
-                                        res_id[0]))
-
-            min_max_q = make_query_from_filter(session, min_max_q, s_filter,
-                                               require_meter=False)
-
-            min_max = min_max_q.first()
-
-            # get resource details for latest sample
-            res_q = (session.query(models.Resource.resource_id,
-                                   models.Resource.user_id,
-                                   models.Resource.project_id,
-                                   models.Resource.source_id,
-                                   models.Resource.resource_metadata)
-                            .join(models.Sample,
-                                  models.Sample.resource_id ==
-                                  models.Resource.internal_id)
-                            .filter(models.Sample.timestamp ==
-                                    min_max.max_timestamp)
-                            .filter(models.Resource.resource_id ==
-                                    res_id[0])
-                            .order_by(models.Sample.id.desc()).limit(1))
-
-            res = res_q.first()
-
+        # NOTE: the first and last sample timestamps of every resource are
+        # computed from the samples matching the filter, then the details of
+        # the resource are taken from its latest sample, the one with the
+        # highest id if several have the last timestamp. Everything is
+        # done in a single query of grouped subqueries, which unlike window
+        # functions are supported by all the backends.
+        stats_q = (session.query(
+            models.Resource.resource_id.label('resource_id'),
+            func.min(models.Sample.timestamp).label('min_timestamp'),
+            func.max(models.Sample.timestamp).label('max_timestamp'))
+            .join(models.Sample,
+                  models.Sample.resource_id == models.Resource.internal_id))
+        stats_q = make_query_from_filter(session, stats_q, s_filter,
+                                         require_meter=False)
+        stats_q = stats_q.group_by(models.Resource.resource_id)
+        stats_q = stats_q.limit(limit) if limit else stats_q
+        stats = stats_q.subquery()
+
+        latest = (session.query(
+            models.Resource.resource_id.label('resource_id'),
+            func.max(models.Sample.id).label('id'))
+            .join(models.Sample,
+                  models.Sample.resource_id == models.Resource.internal_id)
+            .join(stats, and_(
+                stats.c.resource_id == models.Resource.resource_id,
+                stats.c.max_timestamp == models.Sample.timestamp))
+            .group_by(models.Resource.resource_id)
+            .subquery())
+
+        res_q = (session.query(models.Resource.resource_id,
+                               models.Resource.user_id,
+                               models.Resource.project_id,
+                               models.Resource.source_id,
+                               models.Resource.resource_metadata,
+                               stats.c.min_timestamp,
+                               stats.c.max_timestamp)
+                 .join(models.Sample,
+                       models.Sample.resource_id ==
+                       models.Resource.internal_id)
+                 .join(latest, latest.c.id == models.Sample.id)
+                 .join(stats,
+                       stats.c.resource_id == models.Resource.resource_id))
+
+        for res in res_q.all():
             yield api_models.Resource(
                 resource_id=res.resource_id,
                 project_id=res.project_id,
-                first_sample_timestamp=min_max.min_timestamp,
-                last_sample_timestamp=min_max.max_timestamp,
+                first_sample_timestamp=res.min_timestamp,
+                last_sample_timestamp=res.max_timestamp,
                 source=res.source_id,
                 user_id=res.user_id,
                 metadata=res.resource_metadata
@@ -712,6 +1266,139 @@ class Connection(base.Connection):
             (g, getattr(result, g)) for g in groupby) if groupby else None)
         return api_models.Statistics(**stats_args)
 
+    def _get_rollup_period(self, sample_filter, period):
+        """Return the longest rollup period able to answer a query.
+
+        The start of the query, its end if any and its period have to be
+        multiples of the rollup period, and the rollups have to cover the
+        whole query. None is returned when the query has to be answered from
+        the samples.
+        """
+        start = sample_filter.start_timestamp
+        end = sample_filter.end_timestamp
+        if (not self._rollup_periods or start is None or
+                sample_filter.start_timestamp_op == 'gt' or
+                sample_filter.end_timestamp_op == 'le' or
+                sample_filter.metaquery or sample_filter.message_id):
+            return None
+        session = self._engine_facade.get_session()
+        coverage = dict(session.query(models.RollupCoverage.period,
+                                      models.RollupCoverage.start))
+        for rollup_period in reversed(self._rollup_periods):
+            if (rollup_period in coverage and
+                    coverage[rollup_period] <= start and
+                    not (period or 0) % rollup_period and
+                    rollup_start(start, rollup_period) == start and
+                    (end is None or
+                     rollup_start(end, rollup_period) == end)):
+                return rollup_period
+
+    def _get_rollup_statistics(self, sample_filter, period, groupby,
+                               aggregate, rollup_period):
+        """Return the statistics of a query computed from rollups.
+
+        The rollups are summed up per rollup period and group in the
+        database, then merged into the periods of the query. The squared
+        deviations of the rollups do not sum up, so when the stddev is
+        selected each rollup is read and merged here.
+        """
+        # validate the aggregates as the samples query does
+        self._get_aggregate_functions(aggregate)
+        cardinality = [a.param for a in aggregate or []
+                       if a.func == 'cardinality']
+        stddev = any(a.func == 'stddev' for a in aggregate or [])
+
+        rollup = models.Rollup
+        if stddev:
+            select = [
+                rollup.period_start,
+                rollup.duration_start.label('tsmin'),
+                rollup.duration_end.label('tsmax'),
+                models.Meter.unit,
+                rollup.count.label('count'),
+                rollup.volume_sum.label('sum'),
+                rollup.volume_min.label('min'),
+                rollup.volume_max.label('max'),
+                rollup.volume_m2.label('m2'),
+            ]
+        else:
+            select = [
+                rollup.period_start,
+                func.min(rollup.duration_start).label('tsmin'),
+                func.max(rollup.duration_end).label('tsmax'),
+                models.Meter.unit,
+                func.sum(rollup.count).label('count'),
+                func.sum(rollup.volume_sum).label('sum'),
+                func.min(rollup.volume_min).label('min'),
+                func.max(rollup.volume_max).label('max'),
+            ]
+        group_attributes = [rollup.period_start, models.Meter.unit]
+        for g in groupby or []:
+            if g != 'resource_metadata.instance_type':
+                attribute = getattr(models.Resource, g)
+            else:
+                attribute = models.MetaText.value.label(g)
+            select.append(attribute)
+            group_attributes.append(attribute)
+        for p in cardinality:
+            attribute = getattr(models.Resource, p)
+            select.append(attribute.label('cardinality/%s' % p))
+            group_attributes.append(attribute)
+
+        session = self._engine_facade.get_session()
+        query = (
+            session.query(*select)
+            .join(models.Meter, models.Meter.id == rollup.meter_id)
+            .join(models.Resource,
+                  models.Resource.internal_id == rollup.resource_id)
+            .filter(rollup.period == rollup_period)
+            .filter(rollup.period_start >= sample_filter.start_timestamp))
+        if sample_filter.end_timestamp:
+            query = query.filter(
+                rollup.period_start < sample_filter.end_timestamp)
+        if 'resource_metadata.instance_type' in (groupby or []):
+            query = query.join(
+                models.MetaText,
+                models.Resource.internal_id == models.MetaText.id)
+            query = query.filter(models.MetaText.meta_key == 'instance_type')
+        # only the meter and resource filters apply to the rollups
+        query = make_query_from_filter(session, query, storage.SampleFilter(
+            user=sample_filter.user, project=sample_filter.project,
+            resource=sample_filter.resource, meter=sample_filter.meter,
+            source=sample_filter.source))
+        if not stddev:
+            query = query.group_by(*group_attributes)
+
+        results = {}
+        start = sample_filter.start_timestamp
+        for row in query:
+            if period:
+                offset = int(timeutils.delta_seconds(
+                    start, row.period_start)) // period * period
+                period_start = start + datetime.timedelta(seconds=offset)
+            else:
+                period_start = None
+            key = (period_start, row.unit) + tuple(
+                getattr(row, g) for g in groupby or [])
+            if key not in results:
+                results[key] = RollupResult(row, groupby, cardinality)
+            results[key].add(row)
+
+        # NOTE: the group values may be None, which does not compare with
+        # strings on Python 3.
+        for key in sorted(results, key=lambda k: [(v is not None, v)
+                                                  for v in k]):
+            result = results[key].as_row(aggregate)
+            period_start = key[0]
+            if period:
+                period_end = period_start + datetime.timedelta(
+                    seconds=period)
+            else:
+                period_start, period_end = result.tsmin, result.tsmax
+            yield self._stats_result_to_model(
+                result, period or 0, period_start, period_end, groupby,
+                aggregate)
+
     def get_meter_statistics(self, sample_filter, period=None, groupby=None,
                              aggregate=None):
         """Return an iterable of api_models.Statistics instances.
@@ -726,6 +1413,13 @@ class Connection(base.Connection):
                     raise ceilometer.NotImplementedError('Unable to group by '
                                                          'these fields')
 
+        rollup_period = self._get_rollup_period(sample_filter, period)
+        if rollup_period:
+            for stat in self._get_rollup_statistics(
+                    sample_filter, period, groupby, aggregate, rollup_period):
+                yield stat
+            return
+
         if not period:
             for res in self._make_stats_query(sample_filter,
                                               groupby,
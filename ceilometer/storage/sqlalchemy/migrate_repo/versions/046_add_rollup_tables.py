@@ -0,0 +1,56 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import sqlalchemy as sa
+
+from ceilometer.storage.sqlalchemy import models
+
+
+def upgrade(migrate_engine):
+    meta = sa.MetaData(bind=migrate_engine)
+    sa.Table('meter', meta, autoload=True)
+    sa.Table('resource', meta, autoload=True)
+    rollup = sa.Table(
+        'rollup', meta,
+        sa.Column('period', sa.Integer, primary_key=True,
+                  autoincrement=False),
+        sa.Column('meter_id', sa.Integer, sa.ForeignKey('meter.id'),
+                  primary_key=True, autoincrement=False),
+        sa.Column('resource_id', sa.Integer,
+                  sa.ForeignKey('resource.internal_id'),
+                  primary_key=True, autoincrement=False),
+        sa.Column('period_start', models.PreciseTimestamp(),
+                  primary_key=True),
+        sa.Column('count', sa.Integer, nullable=False),
+        sa.Column('volume_sum', sa.Float(53)),
+        sa.Column('volume_min', sa.Float(53)),
+        sa.Column('volume_max', sa.Float(53)),
+        sa.Column('volume_m2', sa.Float(53)),
+        sa.Column('duration_start', models.PreciseTimestamp()),
+        sa.Column('duration_end', models.PreciseTimestamp()),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+    )
+    rollup.create()
+    sa.Index('ix_rollup_meter_id_period_start', rollup.c.meter_id,
+             rollup.c.period, rollup.c.period_start).create(
+                 bind=migrate_engine)
+
+    coverage = sa.Table(
+        'rollup_coverage', meta,
+        sa.Column('period', sa.Integer, primary_key=True,
+                  autoincrement=False),
+        sa.Column('start', models.PreciseTimestamp(), nullable=False),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+    )
+    coverage.create()
@@ -222,6 +222,41 @@ class Sample(Base):
     message_id = Column(String(128))
 
 
+class Rollup(Base):
+    """Statistics of the samples of a meter and resource over a period.
+
+    Maintained by the storage driver as samples are recorded, for each of
+    the configured rollup periods.
+    """
+
+    __tablename__ = 'rollup'
+    __table_args__ = (
+        Index('ix_rollup_meter_id_period_start', 'meter_id', 'period',
+              'period_start'),
+    )
+    period = Column(Integer, primary_key=True, autoincrement=False)
+    meter_id = Column(Integer, ForeignKey('meter.id'), primary_key=True,
+                      autoincrement=False)
+    resource_id = Column(Integer, ForeignKey('resource.internal_id'),
+                         primary_key=True, autoincrement=False)
+    period_start = Column(PreciseTimestamp(), primary_key=True)
+    count = Column(Integer, nullable=False)
+    volume_sum = Column(Float(53))
+    volume_min = Column(Float(53))
+    volume_max = Column(Float(53))
+    volume_m2 = Column(Float(53))
+    duration_start = Column(PreciseTimestamp())
+    duration_end = Column(PreciseTimestamp())
+
+
+class RollupCoverage(Base):
+    """Start of the time range covered by the rollups of a period."""
+
+    __tablename__ = 'rollup_coverage'
+    period = Column(Integer, primary_key=True, autoincrement=False)
+    start = Column(PreciseTimestamp(), nullable=False)
+
+
 class FullSample(Base):
     """Mapper model.
 
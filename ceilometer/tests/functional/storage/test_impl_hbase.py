@@ -20,6 +20,9 @@
   running the tests. Make sure the Thrift server is running on that server.
 
 """
+import datetime
+import hashlib
+
 import mock
 
 
@@ -31,9 +34,13 @@ except ImportError:
 
 from ceilometer.alarm.storage import impl_hbase as hbase_alarm
 from ceilometer.event.storage import impl_hbase as hbase_event
+from ceilometer import storage
+from ceilometer.storage.hbase import utils as hbase_utils
 from ceilometer.storage import impl_hbase as hbase
 from ceilometer.tests import base as test_base
 from ceilometer.tests import db as tests_db
+from ceilometer.tests.functional.storage \
+    import test_storage_scenarios as scenarios
 
 
 class ConnectionTest(tests_db.TestBase,
@@ -58,6 +65,131 @@ class ConnectionTest(tests_db.TestBase,
         self.assertIsInstance(conn.conn_pool, TestConn)
 
 
+class RowRangeTest(test_base.BaseTestCase):
+
+    def test_split_row_range(self):
+        self.assertEqual([(None, 'b'), ('b', 'd'), ('d', None)],
+                         hbase_utils.split_row_range(None, None, ['b', 'd']))
+        self.assertEqual([('a', 'b'), ('b', 'c')],
+                         hbase_utils.split_row_range('a', 'c',
+                                                     ['0', 'b', 'c', 'd']))
+        self.assertEqual([('a', 'c')],
+                         hbase_utils.split_row_range('a', 'c', []))
+
+    def test_make_rts_boundaries(self):
+        start = datetime.datetime(2015, 1, 1)
+        rts_low = hbase_utils.timestamp(start + datetime.timedelta(hours=4))
+        rts_high = hbase_utils.timestamp(start)
+        self.assertEqual(
+            [hbase_utils.prepare_key('cpu', hbase_utils.timestamp(
+                start + datetime.timedelta(hours=4 - i)))
+             for i in range(1, 4)],
+            hbase_utils.make_rts_boundaries('cpu', rts_low, rts_high, 4))
+        self.assertEqual([], hbase_utils.make_rts_boundaries(
+            'cpu', rts_high, rts_low, 4))
+
+
+@tests_db.run_with('hbase')
+class ShardedScanTest(scenarios.DBTestBase,
+                      tests_db.MixinTestsWithBackendScenarios):
+
+    def prepare_data(self):
+        self.start = datetime.datetime(2015, 7, 1)
+        for i in range(16):
+            resource_id = hashlib.md5(str(i).encode('utf-8')).hexdigest()
+            for hour in range(12):
+                for name in ('cpu', 'instance'):
+                    self.create_and_store_sample(
+                        timestamp=self.start + datetime.timedelta(
+                            hours=hour, minutes=i + 1),
+                        name=name, resource_id=resource_id,
+                        user_id='user-%d' % (i % 2), source='test')
+
+    def _query(self, shards, method, *args, **kwargs):
+        self.conn._scan_shards = shards
+        with mock.patch.object(self.conn.conn_pool, 'connection',
+                               wraps=self.conn.conn_pool.connection) as conn:
+            result = list(getattr(self.conn, method)(*args, **kwargs))
+        return result, conn.call_count
+
+    def test_get_samples(self):
+        sample_filter = storage.SampleFilter(
+            meter='cpu', start_timestamp=self.start,
+            end_timestamp=self.start + datetime.timedelta(hours=10))
+        expected, ignored = self._query(1, 'get_samples', sample_filter)
+        self.assertEqual(16 * 10, len(expected))
+        for shards in (4, 16):
+            samples, connections = self._query(shards, 'get_samples',
+                                               sample_filter)
+            self.assertEqual(shards, connections)
+            self.assertEqual([s.as_dict() for s in expected],
+                             [s.as_dict() for s in samples])
+            samples, connections = self._query(shards, 'get_samples',
+                                               sample_filter, limit=20)
+            self.assertEqual([s.as_dict() for s in expected[:20]],
+                             [s.as_dict() for s in samples])
+
+    def test_get_samples_not_split(self):
+        sample_filter = storage.SampleFilter(meter='cpu')
+        expected, ignored = self._query(1, 'get_samples', sample_filter)
+        samples, connections = self._query(4, 'get_samples', sample_filter)
+        self.assertEqual(1, connections)
+        self.assertEqual(len(expected), len(samples))
+
+    def test_get_resources(self):
+        expected, ignored = self._query(1, 'get_resources')
+        self.assertEqual(16, len(expected))
+        for shards in (4, 16, 32):
+            resources, connections = self._query(shards, 'get_resources')
+            # one more connection reads the rows missing columns
+            self.assertEqual(min(shards, 16) + 1, connections)
+            self.assertEqual([r.as_dict() for r in expected],
+                             [r.as_dict() for r in resources])
+            resources, connections = self._query(shards, 'get_resources',
+                                                 user='user-1', limit=3)
+            self.assertEqual([r.as_dict() for r in expected
+                              if r.user_id == 'user-1'][:3],
+                             [r.as_dict() for r in resources])
+
+    def test_get_meters(self):
+        expected, ignored = self._query(1, 'get_meters')
+        self.assertEqual(16 * 2, len(expected))
+        meters, connections = self._query(4, 'get_meters')
+        self.assertEqual(4, connections)
+        self.assertEqual([m.as_dict() for m in expected],
+                         [m.as_dict() for m in meters])
+        meters, connections = self._query(4, 'get_meters', limit=5)
+        self.assertEqual([m.as_dict() for m in expected[:5]],
+                         [m.as_dict() for m in meters])
+
+    def test_scan_without_connection_available(self):
+        expected, ignored = self._query(1, 'get_resources')
+        pool_connection = self.conn.conn_pool.connection
+        range_connections = []
+
+        def connection(timeout=None):
+            # the second range finds the pool empty
+            if timeout is not None:
+                range_connections.append(timeout)
+                if len(range_connections) == 2:
+                    raise happybase.NoConnectionsAvailable()
+            return pool_connection(timeout)
+
+        self.conn._scan_shards = 4
+        with mock.patch.object(self.conn.conn_pool, 'connection',
+                               side_effect=connection):
+            resources = list(self.conn.get_resources())
+        self.assertEqual(4, len(range_connections))
+        self.assertEqual([r.as_dict() for r in expected],
+                         [r.as_dict() for r in resources])
+
+    def test_scan_error_raised(self):
+        self.conn._scan_shards = 4
+        with mock.patch('ceilometer.storage.hbase.inmemory.MTable.scan',
+                        side_effect=IOError('connection lost')):
+            self.assertRaises(IOError, list, self.conn.get_resources())
+
+
 class CapabilitiesTest(test_base.BaseTestCase):
     # Check the returned capabilities list, which is specific to each DB
     # driver
@@ -73,19 +205,19 @@ class CapabilitiesTest(test_base.BaseTestCase):
             'samples': {'query': {'simple': True,
                                   'metadata': True,
                                   'complex': False}},
-            'statistics': {'groupby': False,
+            'statistics': {'groupby': True,
                            'query': {'simple': True,
                                      'metadata': True,
                                      'complex': False},
                            'aggregation': {'standard': True,
                                            'selectable': {
-                                               'max': False,
-                                               'min': False,
-                                               'sum': False,
-                                               'avg': False,
-                                               'count': False,
-                                               'stddev': False,
-                                               'cardinality': False}}
+                                               'max': True,
+                                               'min': True,
+                                               'sum': True,
+                                               'avg': True,
+                                               'count': True,
+                                               'stddev': True,
+                                               'cardinality': True}}
                            },
         }
 
@@ -21,8 +21,12 @@
 
 """
 
+import datetime
+
 from ceilometer.alarm.storage import impl_mongodb as impl_mongodb_alarm
 from ceilometer.event.storage import impl_mongodb as impl_mongodb_event
+from ceilometer.publisher import utils
+from ceilometer import sample
 from ceilometer.storage import impl_mongodb
 from ceilometer.tests import base as test_base
 from ceilometer.tests import db as tests_db
@@ -51,6 +55,53 @@ class MongoDBConnection(tests_db.TestBase,
         self.assertEqual(expect, ret)
 
 
+@tests_db.run_with('mongodb')
+class BatchRecordTest(tests_db.TestBase,
+                      tests_db.MixinTestsWithBackendScenarios):
+
+    def _make_msg(self, ts, tag, name='instance'):
+        s = sample.Sample(name, sample.TYPE_GAUGE, unit='', volume=1,
+                          user_id='user-id', project_id='project-id',
+                          resource_id='resource-id', timestamp=ts,
+                          resource_metadata={'tag': tag})
+        return utils.meter_message_from_counter(
+            s, self.CONF.publisher.telemetry_secret)
+
+    def test_record_metering_data_batch_out_of_order(self):
+        self.conn.record_metering_data(
+            self._make_msg(datetime.datetime(2012, 7, 2, 10, 40), 'first'))
+        self.conn.record_metering_data_batch([
+            self._make_msg(datetime.datetime(2012, 7, 2, 10, 45), 'last'),
+            self._make_msg(datetime.datetime(2012, 7, 2, 10, 30), 'earliest',
+                           name='instance:m1.tiny'),
+            self._make_msg(datetime.datetime(2012, 7, 2, 10, 42), 'middle'),
+        ])
+
+        self.assertEqual(4, self.conn.db.meter.count())
+        resource = self.conn.db.resource.find_one({'_id': 'resource-id'})
+        self.assertEqual(datetime.datetime(2012, 7, 2, 10, 30),
+                         resource['first_sample_timestamp'])
+        self.assertEqual(datetime.datetime(2012, 7, 2, 10, 45),
+                         resource['last_sample_timestamp'])
+        self.assertEqual({'tag': 'last'}, resource['metadata'])
+        self.assertEqual(set(['instance', 'instance:m1.tiny']),
+                         set(m['counter_name'] for m in resource['meter']))
+
+    def test_record_metering_data_batch_new_resource(self):
+        self.conn.record_metering_data_batch([
+            self._make_msg(datetime.datetime(2012, 7, 2, 10, 45), 'last'),
+            self._make_msg(datetime.datetime(2012, 7, 2, 10, 30), 'first'),
+        ])
+
+        resource = self.conn.db.resource.find_one({'_id': 'resource-id'})
+        self.assertEqual(datetime.datetime(2012, 7, 2, 10, 30),
+                         resource['first_sample_timestamp'])
+        self.assertEqual(datetime.datetime(2012, 7, 2, 10, 45),
+                         resource['last_sample_timestamp'])
+        self.assertEqual('last', resource['metadata']['tag'])
+        self.assertEqual(1, len(resource['meter']))
+
+
 @tests_db.run_with('mongodb')
 class IndexTest(tests_db.TestBase,
                 tests_db.MixinTestsWithBackendScenarios):
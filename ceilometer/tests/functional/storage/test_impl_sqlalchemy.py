@@ -23,10 +23,15 @@ import datetime
 import mock
 from oslo_utils import timeutils
 from six.moves import reprlib
+from sqlalchemy import func as sa_func
 
 from ceilometer.alarm.storage import impl_sqlalchemy as impl_sqla_alarm
+from ceilometer.api.controllers.v2 import meters as v2_meters
 from ceilometer.event.storage import impl_sqlalchemy as impl_sqla_event
 from ceilometer.event.storage import models
+from ceilometer.publisher import utils
+from ceilometer import sample
+from ceilometer import storage
 from ceilometer.storage import impl_sqlalchemy
 from ceilometer.storage.sqlalchemy import models as sql_models
 from ceilometer.tests import base as test_base
@@ -103,6 +108,57 @@ class EventTest(tests_db.TestBase):
         ev.id = 100
         self.assertTrue(reprlib.repr(ev))
 
+    def _make_events(self, count, start=0):
+        now = datetime.datetime.utcnow()
+        return [models.Event(
+            str(i), 'type-%d' % (i % 2), now,
+            [models.Trait('text', models.Trait.TEXT_TYPE, 'text-%d' % i),
+             models.Trait('int', models.Trait.INT_TYPE, i),
+             models.Trait('float', models.Trait.FLOAT_TYPE, i / 2.0)], {})
+            for i in range(start, start + count)]
+
+    def test_record_events_skips_duplicates(self):
+        self.event_conn.record_events(self._make_events(2))
+        events = self._make_events(4)
+        events.append(self._make_events(1, start=3)[0])
+        with mock.patch.object(impl_sqla_event.LOG, 'info') as info:
+            self.event_conn.record_events(events)
+        self.assertEqual(3, info.call_count)
+        session = self.event_conn._engine_facade.get_session()
+        self.assertEqual(4, session.query(sql_models.Event).count())
+        self.assertEqual(2, session.query(sql_models.EventType).count())
+        self.assertEqual(0, session.query(sql_models.TraitDatetime).count())
+        for table in (sql_models.TraitText, sql_models.TraitInt,
+                      sql_models.TraitFloat):
+            self.assertEqual(4, session.query(table).count())
+        event = (session.query(sql_models.Event)
+                 .filter(sql_models.Event.message_id == '3').one())
+        self.assertEqual(3, session.query(sql_models.TraitInt.value)
+                         .filter(sql_models.TraitInt.event_id == event.id)
+                         .scalar())
+
+    def test_record_events_caches_event_types(self):
+        self.event_conn.record_events(self._make_events(2))
+        self.assertEqual(set(['type-0', 'type-1']),
+                         set(self.event_conn._event_type_ids))
+        with mock.patch.object(impl_sqla_event.Connection,
+                               '_get_or_create_event_type') as get_or_create:
+            self.event_conn.record_events(self._make_events(10, start=2))
+        self.assertFalse(get_or_create.called)
+        self.event_conn.clear_expired_event_data(3600)
+        self.assertEqual({}, self.event_conn._event_type_ids)
+
+    def test_record_events_falls_back_to_one_by_one(self):
+        events = self._make_events(3)
+        events[1].traits.append(models.Trait('bad', 'bad_dtype', 'value'))
+        with mock.patch.object(impl_sqla_event.LOG, 'exception') as log:
+            self.event_conn.record_events(events)
+        self.assertEqual(1, log.call_count)
+        session = self.event_conn._engine_facade.get_session()
+        self.assertEqual(['0', '2'], sorted(
+            m for m, in session.query(sql_models.Event.message_id)))
+        self.assertEqual(2, session.query(sql_models.TraitText).count())
+
 
 @tests_db.run_with('sqlite', 'mysql', 'pgsql')
 class RelationshipTest(scenarios.DBTestBase):
@@ -130,6 +186,251 @@ class RelationshipTest(scenarios.DBTestBase):
         self.assertEqual(set(resource_ids.all()), s)
 
 
+@tests_db.run_with('sqlite', 'mysql', 'pgsql')
+class IdCacheTest(scenarios.DBTestBase):
+
+    def test_cache_stats(self):
+        stats = self.conn.id_cache_stats()
+        self.assertEqual(1, stats['meter']['misses'])
+        self.assertEqual(10, stats['meter']['hits'])
+        self.assertEqual(10, stats['resource']['misses'])
+        self.assertEqual(1, stats['resource']['hits'])
+
+    def test_cache_hit_skips_lookup(self):
+        with mock.patch.object(self.conn, '_create_meter') as create_meter:
+            with mock.patch.object(self.conn,
+                                   '_create_resource') as create_resource:
+                self.create_and_store_sample(
+                    timestamp=datetime.datetime(2012, 7, 2, 10, 50),
+                    source='test-1')
+        self.assertFalse(create_meter.called)
+        self.assertFalse(create_resource.called)
+        f = storage.SampleFilter(meter='instance', source='test-1')
+        self.assertEqual(3, len(list(self.conn.get_samples(f))))
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_clear_expired_metering_data_clears_cache(self, mock_utcnow):
+        mock_utcnow.return_value = datetime.datetime(2014, 7, 2, 10, 45)
+        self.conn.clear_expired_metering_data(3 * 60)
+        stats = self.conn.id_cache_stats()
+        self.assertEqual(0, stats['meter']['size'])
+        self.assertEqual(0, stats['resource']['size'])
+
+        self.create_and_store_sample(
+            timestamp=datetime.datetime(2014, 7, 2, 10, 44),
+            source='test-1')
+        f = storage.SampleFilter(meter='instance')
+        results = list(self.conn.get_samples(f))
+        self.assertEqual(1, len(results))
+        self.assertEqual('resource-id', results[0].resource_id)
+
+
+@tests_db.run_with('sqlite', 'mysql', 'pgsql')
+class RollupTest(scenarios.DBTestBase):
+
+    def prepare_data(self):
+        # NOTE: the connection is created before the test sets its
+        # configuration up.
+        self.conn._rollup_periods = [300, 3600]
+        self.mock_utcnow.return_value = datetime.datetime(2015, 1, 1)
+        start = datetime.datetime(2015, 1, 1, 0, 5)
+        # two days of samples of two resources every ten minutes, from the
+        # start of the rollups
+        for i in range(2 * 24 * 6):
+            for r in range(2):
+                self.create_and_store_sample(
+                    timestamp=start + datetime.timedelta(minutes=10 * i,
+                                                         seconds=r),
+                    volume=(i * 7 + r * 3) % 11, resource_id='resource-%d' % r,
+                    user_id='user-%d' % r, source='test')
+
+    def _statistics(self, sample_filter, **kwargs):
+        return [s.as_dict() for s in
+                self.conn.get_meter_statistics(sample_filter, **kwargs)]
+
+    def _assert_same_statistics(self, sample_filter, rollup_period,
+                                **kwargs):
+        self.assertEqual(rollup_period, self.conn._get_rollup_period(
+            sample_filter, kwargs.get('period')))
+        from_rollups = self._statistics(sample_filter, **kwargs)
+        with mock.patch.object(self.conn, '_get_rollup_period',
+                               return_value=None):
+            from_samples = self._statistics(sample_filter, **kwargs)
+        self.assertNotEqual([], from_samples)
+        self.assertEqual(from_samples, from_rollups)
+
+    def test_rollups_recorded(self):
+        session = self.conn._engine_facade.get_session()
+        rollup = (session.query(sql_models.Rollup)
+                  .join(sql_models.Resource)
+                  .filter(sql_models.Rollup.period == 3600)
+                  .filter(sql_models.Resource.resource_id == 'resource-1')
+                  .order_by(sql_models.Rollup.period_start).first())
+        # the hourly rollups cover the samples from 01:00
+        self.assertEqual(datetime.datetime(2015, 1, 1, 1), rollup.period_start)
+        volumes = [(i * 7 + 3) % 11 for i in range(6, 12)]
+        self.assertEqual(6, rollup.count)
+        self.assertEqual(sum(volumes), rollup.volume_sum)
+        self.assertEqual(min(volumes), rollup.volume_min)
+        self.assertEqual(max(volumes), rollup.volume_max)
+        mean = float(sum(volumes)) / len(volumes)
+        self.assertAlmostEqual(sum((v - mean) ** 2 for v in volumes),
+                               rollup.volume_m2)
+        self.assertEqual(datetime.datetime(2015, 1, 1, 1, 5, 1),
+                         rollup.duration_start)
+        self.assertEqual(datetime.datetime(2015, 1, 1, 1, 55, 1),
+                         rollup.duration_end)
+        self.assertEqual(2 * 48 * 6, session.query(sql_models.Rollup).filter(
+            sql_models.Rollup.period == 300).count())
+
+    def test_samples_before_coverage_not_rolled_up(self):
+        self.create_and_store_sample(
+            timestamp=datetime.datetime(2014, 12, 31, 23, 59))
+        session = self.conn._engine_facade.get_session()
+        self.assertEqual(0, session.query(sql_models.Rollup).filter(
+            sql_models.Rollup.period_start < datetime.datetime(2015, 1, 1)
+        ).count())
+
+    def test_writer_without_period_disables_its_rollups(self):
+        def coverage():
+            session = self.conn._engine_facade.get_session()
+            return dict(session.query(sql_models.RollupCoverage.period,
+                                      sql_models.RollupCoverage.start))
+
+        self.mock_utcnow.return_value = datetime.datetime(2015, 1, 2, 10, 30)
+        self.conn._rollup_periods = [300]
+        self.create_and_store_sample(timestamp=self.mock_utcnow.return_value)
+        # the hourly rollups are not used until after the next check
+        self.assertEqual({300: datetime.datetime(2015, 1, 1, 0, 5),
+                          3600: datetime.datetime(2015, 1, 2, 11)},
+                         coverage())
+        self.mock_utcnow.return_value = datetime.datetime(2015, 1, 2, 10, 35)
+        self.create_and_store_sample(timestamp=self.mock_utcnow.return_value)
+        self.assertEqual(datetime.datetime(2015, 1, 2, 11), coverage()[3600])
+        self.mock_utcnow.return_value = datetime.datetime(2015, 1, 2, 10, 55)
+        self.create_and_store_sample(timestamp=self.mock_utcnow.return_value)
+        self.assertEqual(datetime.datetime(2015, 1, 2, 12), coverage()[3600])
+
+        self.conn._rollup_periods = [300, 3600]
+        f = storage.SampleFilter(
+            meter='instance', start_timestamp=datetime.datetime(2015, 1, 1, 1))
+        self.assertEqual(300, self.conn._get_rollup_period(f, None))
+        f.start_timestamp = datetime.datetime(2015, 1, 2, 12)
+        self.assertEqual(3600, self.conn._get_rollup_period(f, None))
+
+    def test_rollup_period_selection(self):
+        def rollup_period(period=None, **kwargs):
+            kwargs.setdefault('start_timestamp',
+                              datetime.datetime(2015, 1, 1, 1))
+            f = storage.SampleFilter(meter='instance', **kwargs)
+            return self.conn._get_rollup_period(f, period)
+
+        self.assertEqual(3600, rollup_period())
+        self.assertEqual(3600, rollup_period(7200))
+        self.assertEqual(300, rollup_period(600))
+        self.assertEqual(300, rollup_period(
+            3600, start_timestamp=datetime.datetime(2015, 1, 1, 1, 5)))
+        self.assertEqual(300, rollup_period(
+            end_timestamp=datetime.datetime(2015, 1, 1, 2, 5)))
+        self.assertIsNone(rollup_period(60))
+        self.assertIsNone(rollup_period(
+            start_timestamp=datetime.datetime(2015, 1, 1, 1, 1)))
+        # the 300 seconds rollups cover the samples from 00:05
+        self.assertIsNone(rollup_period(
+            start_timestamp=datetime.datetime(2015, 1, 1)))
+        self.assertIsNone(rollup_period(start_timestamp=None))
+        self.assertIsNone(rollup_period(start_timestamp_op='gt'))
+        self.assertIsNone(rollup_period(end_timestamp_op='le'))
+        self.assertIsNone(rollup_period(metaquery={'metadata.tag': 'x'}))
+
+    def test_statistics_by_period(self):
+        f = storage.SampleFilter(
+            meter='instance', start_timestamp=datetime.datetime(2015, 1, 1, 1),
+            end_timestamp=datetime.datetime(2015, 1, 2, 13))
+        self._assert_same_statistics(f, 3600, period=3 * 3600)
+        self._assert_same_statistics(f, 300, period=900)
+
+    def test_statistics_without_period(self):
+        f = storage.SampleFilter(
+            meter='instance', start_timestamp=datetime.datetime(2015, 1, 1, 2),
+            user='user-1')
+        self._assert_same_statistics(f, 3600)
+
+    def test_statistics_groupby(self):
+        f = storage.SampleFilter(
+            meter='instance', start_timestamp=datetime.datetime(2015, 1, 1, 1))
+        self._assert_same_statistics(f, 3600, period=86400,
+                                     groupby=['user_id', 'resource_id'])
+
+    def test_statistics_selectable_aggregates(self):
+        f = storage.SampleFilter(
+            meter='instance', start_timestamp=datetime.datetime(2015, 1, 1, 1),
+            end_timestamp=datetime.datetime(2015, 1, 1, 2))
+        aggregate = [v2_meters.Aggregate(func='max'),
+                     v2_meters.Aggregate(func='cardinality',
+                                         param='resource_id'),
+                     v2_meters.Aggregate(func='stddev')]
+        stats = self._statistics(f, aggregate=aggregate)
+        self.assertEqual(1, len(stats))
+        volumes = [(i * 7 + r * 3) % 11 for i in range(6, 12)
+                   for r in range(2)]
+        avg = float(sum(volumes)) / len(volumes)
+        stddev = (sum((v - avg) ** 2 for v in volumes) / len(volumes)) ** 0.5
+        self.assertEqual(max(volumes), stats[0]['max'])
+        self.assertNotIn('sum', stats[0])
+        self.assertEqual(2, stats[0]['aggregate']['cardinality/resource_id'])
+        self.assertAlmostEqual(stddev, stats[0]['aggregate']['stddev'])
+
+    def test_statistics_stddev_of_large_volumes(self):
+        # NOTE: the variance computed from the sums of squares of these
+        # volumes is lost in rounding errors.
+        for base in (10 ** 8, 10 ** 12):
+            meter = 'large-%d' % base
+            start = datetime.datetime(2015, 1, 1, 1, 5)
+            # two resources, rolled up over two hours, recorded one by one
+            # and in a batch
+            for i, volume in enumerate((1, 2, 3, 2, 3)):
+                self.create_and_store_sample(
+                    timestamp=start + datetime.timedelta(minutes=20 * i),
+                    volume=base + volume, resource_id='resource-%d' % (i % 2),
+                    name=meter)
+            self.conn.record_metering_data_batch([
+                utils.meter_message_from_counter(sample.Sample(
+                    meter, sample.TYPE_GAUGE, '', base + volume, 'user-id',
+                    'project-id', 'resource-id',
+                    start + datetime.timedelta(minutes=20 * i + 1), {}),
+                    self.CONF.publisher.telemetry_secret)
+                for i, volume in enumerate((1, 3, 1))])
+            volumes = (1, 2, 3, 2, 3, 1, 3, 1)
+            mean = float(sum(volumes)) / len(volumes)
+            stddev = (sum((v - mean) ** 2 for v in volumes) /
+                      len(volumes)) ** 0.5
+            f = storage.SampleFilter(
+                meter=meter, start_timestamp=datetime.datetime(2015, 1, 1, 1))
+            aggregate = [v2_meters.Aggregate(func='stddev')]
+            self.assertEqual(3600, self.conn._get_rollup_period(f, None))
+            stats = self._statistics(f, period=7200, aggregate=aggregate)
+            self.assertEqual(1, len(stats))
+            self.assertAlmostEqual(stddev, stats[0]['aggregate']['stddev'],
+                                   places=4)
+
+    def test_clear_expired_metering_data_expires_rollups(self):
+        self.mock_utcnow.return_value = datetime.datetime(2015, 1, 2, 10, 30)
+        self.conn._rollup_periods = [3600]
+        self.conn.clear_expired_metering_data(86400)
+        session = self.conn._engine_facade.get_session()
+        coverage = dict(session.query(sql_models.RollupCoverage.period,
+                                      sql_models.RollupCoverage.start))
+        # the rollups of the periods of the collectors only are expired too
+        self.assertEqual({300: datetime.datetime(2015, 1, 1, 10, 30),
+                          3600: datetime.datetime(2015, 1, 1, 11)}, coverage)
+        first = session.query(sa_func.min(sql_models.Rollup.period_start))
+        self.assertEqual(datetime.datetime(2015, 1, 1, 11), first.filter(
+            sql_models.Rollup.period == 3600).scalar())
+        self.assertEqual(datetime.datetime(2015, 1, 1, 10, 35), first.filter(
+            sql_models.Rollup.period == 300).scalar())
+
+
 class CapabilitiesTest(test_base.BaseTestCase):
     # Check the returned capabilities list, which is specific to each DB
     # driver
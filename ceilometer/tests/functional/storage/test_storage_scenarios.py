@@ -582,6 +582,36 @@ class RawSampleTest(DBTestBase,
         results = list(self.conn.get_samples(f))
         self.assertEqual(2, len(results))
 
+    def test_record_metering_data_batch(self):
+        msgs = []
+        for name, resource_id, tag in [
+                ('instance', 'resource-id', 'self.counter'),
+                ('instance', 'resource-id', 'self.counter'),
+                ('batch.meter', 'resource-id-batch', 'batch')]:
+            s = sample.Sample(
+                name, sample.TYPE_CUMULATIVE, unit='', volume=1,
+                user_id='user-id', project_id='project-id',
+                resource_id=resource_id,
+                timestamp=datetime.datetime(2012, 7, 2, 10, 44),
+                resource_metadata={'display_name': 'test-server',
+                                   'tag': tag},
+                source='test-batch')
+            msgs.append(utils.meter_message_from_counter(
+                s, self.CONF.publisher.telemetry_secret))
+        self.conn.record_metering_data_batch(msgs)
+
+        f = storage.SampleFilter(meter='instance', source='test-batch')
+        results = list(self.conn.get_samples(f))
+        self.assertEqual(2, len(results))
+        f = storage.SampleFilter(meter='batch.meter')
+        results = list(self.conn.get_samples(f))
+        self.assertEqual(1, len(results))
+        self.assertEqual('resource-id-batch', results[0].resource_id)
+        results = list(self.conn.get_resources(
+            metaquery={'metadata.tag': 'batch'}))
+        self.assertEqual(1, len(results))
+        self.assertEqual('resource-id-batch', results[0].resource_id)
+
     @tests_db.run_with('sqlite', 'mysql', 'pgsql', 'hbase', 'db2')
     def test_clear_metering_data(self):
         # NOTE(jd) Override this test in MongoDB because our code doesn't clear
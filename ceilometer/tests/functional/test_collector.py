@@ -13,6 +13,8 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 import socket
+import threading
+import time
 
 import mock
 import msgpack
@@ -115,6 +117,19 @@ class TestCollector(tests_base.BaseTestCase):
         sock.recvfrom = recvfrom
         return sock
 
+    def _make_fake_socket_multi(self, samples):
+        samples = list(samples)
+
+        def recvfrom(size):
+            if len(samples) == 1:
+                # Make the loop stop
+                self.srv.stop()
+            return msgpack.dumps(samples.pop(0)), ('127.0.0.1', 12345)
+
+        sock = mock.Mock()
+        sock.recvfrom = recvfrom
+        return sock
+
     def _verify_udp_socket(self, udp_socket):
         conf = self.CONF.collector
         udp_socket.setsockopt.assert_called_once_with(socket.SOL_SOCKET,
@@ -150,6 +165,93 @@ class TestCollector(tests_base.BaseTestCase):
         mock_dispatcher.record_metering_data.assert_called_once_with(
             self.counter)
 
+    def test_udp_receive_batched(self):
+        self._setup_messaging(False)
+        mock_dispatcher = self._setup_fake_dispatcher()
+        self.counter['source'] = 'mysource'
+        self.counter['counter_name'] = self.counter['name']
+        self.counter['counter_volume'] = self.counter['volume']
+        self.counter['counter_type'] = self.counter['type']
+        self.counter['counter_unit'] = self.counter['unit']
+        other = dict(self.counter, resource_id='dog')
+
+        udp_socket = self._make_fake_socket([self.counter, other])
+        with mock.patch('socket.socket', return_value=udp_socket):
+            self.srv.start()
+
+        self._verify_udp_socket(udp_socket)
+
+        mock_dispatcher.record_metering_data.assert_called_once_with(
+            [self.counter, other])
+
+    @mock.patch('select.select')
+    def test_udp_receive_several_datagrams(self, select):
+        self._setup_messaging(False)
+        self.CONF.set_override('udp_batch_size', 3, group='collector')
+        mock_dispatcher = self._setup_fake_dispatcher()
+        other = dict(self.counter, resource_id='dog')
+
+        udp_socket = self._make_fake_socket_multi([self.counter,
+                                                   [other, other]])
+        select.side_effect = [([udp_socket], [], []), ([], [], [])]
+        with mock.patch('socket.socket', return_value=udp_socket):
+            self.srv.start()
+
+        mock_dispatcher.record_metering_data.assert_called_once_with(
+            [self.counter, other, other])
+        self.assertEqual({'received': 2, 'decoded': 2, 'dropped': 0,
+                          'failed': 0}, self.srv.udp_stats())
+
+    def test_udp_socket_options(self):
+        self._setup_messaging(False)
+        self.CONF.set_override('udp_reuse_port', True, group='collector')
+        self.CONF.set_override('udp_rcvbuf', 4 * 1024 * 1024,
+                               group='collector')
+        self._setup_fake_dispatcher()
+
+        udp_socket = self._make_fake_socket(self.counter)
+        with mock.patch('socket.socket', return_value=udp_socket):
+            self.srv.start()
+
+        udp_socket.setsockopt.assert_has_calls([
+            mock.call(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1),
+            mock.call(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1),
+            mock.call(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)])
+
+    def test_udp_decode_workers(self):
+        self._setup_messaging(False)
+        self.CONF.set_override('udp_decode_workers', 2, group='collector')
+        mock_dispatcher = self._setup_fake_dispatcher()
+
+        udp_socket = self._make_fake_socket_multi([self.counter,
+                                                   self.counter])
+        with mock.patch('socket.socket', return_value=udp_socket):
+            self.srv.start()
+
+        start = timeutils.utcnow()
+        while timeutils.delta_seconds(start, timeutils.utcnow()) < 5:
+            if mock_dispatcher.record_metering_data.call_count == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual([mock.call(self.counter), mock.call(self.counter)],
+                         mock_dispatcher.record_metering_data.call_args_list)
+        self.assertEqual(2, self.srv.udp_stats()['decoded'])
+
+    @mock.patch.object(collector.CollectorService, '_udp_decode_worker')
+    def test_udp_decode_queue_full(self, decode_worker):
+        self._setup_messaging(False)
+        self.CONF.set_override('udp_decode_workers', 1, group='collector')
+        self.CONF.set_override('udp_queue_size', 1, group='collector')
+        self._setup_fake_dispatcher()
+
+        udp_socket = self._make_fake_socket_multi([self.counter,
+                                                   self.counter])
+        with mock.patch('socket.socket', return_value=udp_socket):
+            self.srv.start()
+
+        self.assertEqual({'received': 2, 'decoded': 0, 'dropped': 1,
+                          'failed': 0}, self.srv.udp_stats())
+
     def test_udp_socket_ipv6(self):
         self._setup_messaging(False)
         self.CONF.set_override('udp_address', '::1', group='collector')
@@ -302,3 +404,90 @@ class TestCollector(tests_base.BaseTestCase):
                                group='collector')
         self.CONF.set_override('store_events', True, group='notification')
         self._test_collector_no_requeue('event_listener')
+
+    @mock.patch.object(oslo_messaging.MessageHandlingServer, 'start',
+                       mock.Mock())
+    @mock.patch.object(collector.CollectorService, 'start_udp', mock.Mock())
+    def test_collector_batch_sample_requeue(self):
+        self.CONF.set_override('requeue_sample_on_dispatcher_error', True,
+                               group='collector')
+        self.CONF.set_override('batch_size', 10, group='collector')
+        self.CONF.set_override('batch_timeout', 0.01, group='collector')
+        self._test_collector_requeue('sample_listener')
+        self.assertIsInstance(self.srv.dispatcher_buffer,
+                              collector.DispatcherBuffer)
+        self.srv.dispatcher_buffer.stop()
+
+
+class TestDispatcherBuffer(tests_base.BaseTestCase):
+
+    def _make_buffer(self, batch_size=2, batch_timeout=5, max_buffered=10):
+        self.manager = mock.Mock()
+        buf = collector.DispatcherBuffer(self.manager, batch_size,
+                                         batch_timeout, max_buffered, 1)
+        self.addCleanup(buf.stop)
+        return buf
+
+    def _map_method_in_threads(self, buf, method, payloads):
+        threads = [threading.Thread(target=buf.map_method,
+                                    args=(method, payload))
+                   for payload in payloads]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def test_dispatch_full_batch(self):
+        buf = self._make_buffer(batch_size=3)
+        self._map_method_in_threads(buf, 'record_metering_data',
+                                    [[1], [2, 3]])
+        self.manager.map_method.assert_called_once_with(
+            'record_metering_data', mock.ANY)
+        self.assertEqual([1, 2, 3],
+                         sorted(self.manager.map_method.call_args[0][1]))
+
+    def test_dispatch_on_timeout(self):
+        buf = self._make_buffer(batch_size=100, batch_timeout=0.01)
+        buf.map_method('record_events', {'message_id': 1})
+        self.manager.map_method.assert_called_once_with(
+            'record_events', [{'message_id': 1}])
+
+    def test_batches_per_method(self):
+        buf = self._make_buffer(batch_size=2, batch_timeout=0.01)
+        self._map_method_in_threads(buf, 'record_metering_data', [[1], [2]])
+        buf.map_method('record_events', [3])
+        self.assertEqual(
+            [mock.call('record_metering_data', mock.ANY),
+             mock.call('record_events', [3])],
+            self.manager.map_method.call_args_list)
+
+    def test_dispatch_error_raised_to_callers(self):
+        buf = self._make_buffer(batch_size=1)
+        self.manager.map_method.side_effect = FakeException('boom')
+        self.assertRaises(FakeException, buf.map_method,
+                          'record_metering_data', [1])
+
+    def test_backpressure(self):
+        buf = self._make_buffer(batch_size=1, max_buffered=1)
+        release = threading.Event()
+        dispatched = []
+
+        def map_method(method, items):
+            release.wait()
+            dispatched.extend(items)
+
+        self.manager.map_method.side_effect = map_method
+        first = threading.Thread(target=buf.map_method,
+                                 args=('record_metering_data', [1]))
+        first.start()
+        second = threading.Thread(target=buf.map_method,
+                                  args=('record_metering_data', [2]))
+        second.start()
+        second.join(0.1)
+        # the second caller waits for room in the buffer
+        self.assertTrue(second.is_alive())
+        self.assertEqual(1, buf._buffered)
+        release.set()
+        first.join()
+        second.join()
+        self.assertEqual([1, 2], dispatched)
@@ -123,6 +123,16 @@ class TestNotification(tests_base.BaseTestCase):
             self.srv.start()
         self.fake_event_endpoint = fake_event_endpoint_class.return_value
 
+    def test_member_id_per_worker(self):
+        self.CONF.set_override('host', 'agent-host')
+        with mock.patch('os.getpid', return_value=42):
+            member_id = self.srv._get_member_id()
+            self.assertTrue(member_id.startswith('agent-host.42.'))
+            self.assertNotEqual(member_id, self.srv._get_member_id())
+        with mock.patch('os.getpid', return_value=43):
+            self.assertTrue(
+                self.srv._get_member_id().startswith('agent-host.43.'))
+
     def test_start_multiple_listeners(self):
         urls = ["fake://vhost1", "fake://vhost2"]
         self.CONF.set_override("messaging_urls", urls, group="notification")
@@ -560,9 +570,11 @@ class TestRealNotificationMultipleAgents(tests_base.BaseTestCase):
         self.srv2 = notification.NotificationService()
         with mock.patch('ceilometer.coordination.PartitionCoordinator'
                         '._get_members', return_value=['harry', 'lloyd']):
-            with mock.patch('uuid.uuid4', return_value='harry'):
+            with mock.patch.object(self.srv, '_get_member_id',
+                                   return_value='harry'):
                 self.srv.start()
-            with mock.patch('uuid.uuid4', return_value='lloyd'):
+            with mock.patch.object(self.srv2, '_get_member_id',
+                                   return_value='lloyd'):
                 self.srv2.start()
 
         notifier = messaging.get_notifier(self.transport,
@@ -577,7 +589,9 @@ class TestRealNotificationMultipleAgents(tests_base.BaseTestCase):
                       payload2)
         self.expected_samples = 4
         start = timeutils.utcnow()
-        with mock.patch('six.moves.builtins.hash', lambda x: int(x)):
+        with mock.patch('ceilometer.pipeline._PipelineTransportManager'
+                        '.hash_grouping',
+                        staticmethod(lambda d, keys: int(d['resource_id']))):
             while timeutils.delta_seconds(start, timeutils.utcnow()) < 60:
                 if (len(self.publisher.samples + self.publisher2.samples) >=
                         self.expected_samples):
@@ -18,6 +18,7 @@
 # under the License.
 
 import abc
+import copy
 import datetime
 import traceback
 
@@ -47,6 +48,7 @@ class BasePipelineTestCase(base.BaseTestCase):
         The faked entry point setting is below:
         update: TransformerClass
         except: TransformerClassException
+        except_some: TransformerClassSomeException
         drop:   TransformerClassDrop
         """
         pass
@@ -55,6 +57,7 @@ class BasePipelineTestCase(base.BaseTestCase):
         class_name_ext = {
             'update': self.TransformerClass,
             'except': self.TransformerClassException,
+            'except_some': self.TransformerClassSomeException,
             'drop': self.TransformerClassDrop,
             'cache': accumulator.TransformerAccumulator,
             'aggregator': conversions.AggregatorTransformer,
@@ -128,6 +131,15 @@ class BasePipelineTestCase(base.BaseTestCase):
         def handle_sample(ctxt, counter):
             raise Exception()
 
+    class TransformerClassSomeException(object):
+        grouping_keys = ['resource_id']
+
+        @staticmethod
+        def handle_sample(ctxt, counter):
+            if counter.resource_id == 'failing':
+                raise Exception()
+            return counter
+
     def setUp(self):
         super(BasePipelineTestCase, self).setUp()
 
@@ -666,6 +678,20 @@ class BasePipelineTestCase(base.BaseTestCase):
         self.assertEqual('a_update',
                          getattr(self.TransformerClassDrop.samples[0], 'name'))
 
+    def test_transformer_exception_drops_failing_sample(self):
+        self._reraise_exception = False
+        self._set_pipeline_cfg('transformers', [{'name': 'except_some',
+                                                 'parameters': {}}])
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        failing = copy.copy(self.test_counter)
+        failing.resource_id = 'failing'
+        with pipeline_manager.publisher(None) as p:
+            p([failing, self.test_counter])
+
+        publisher = pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual([self.test_counter], publisher.samples)
+
     def test_multiple_publisher(self):
         self._set_pipeline_cfg('publishers', ['test://', 'new://'])
         pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
@@ -864,6 +890,84 @@ class BasePipelineTestCase(base.BaseTestCase):
         self.assertEqual(sample.TYPE_CUMULATIVE, getattr(cpu_mins, 'type'))
         self.assertEqual(20, getattr(cpu_mins, 'volume'))
 
+    def test_unit_conversion_drops_failing_sample(self):
+        transformer_cfg = [
+            {
+                'name': 'unit_conversion',
+                'parameters': {
+                    'source': {},
+                    'target': {'name': 'cpu_scaled',
+                               'scale': 'volume / resource_metadata.cpus'},
+                }
+            },
+        ]
+        self._set_pipeline_cfg('transformers', transformer_cfg)
+        self._set_pipeline_cfg('counters', ['cpu'])
+        counters = [
+            sample.Sample(
+                name='cpu',
+                type=sample.TYPE_CUMULATIVE,
+                volume=volume,
+                unit='ns',
+                user_id='test_user',
+                project_id='test_proj',
+                resource_id='test_resource',
+                timestamp=timeutils.utcnow().isoformat(),
+                resource_metadata=metadata
+            ) for volume, metadata in ((10, {'cpus': 2}), (20, {}),
+                                       (30, {'cpus': 3}))
+        ]
+
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+
+        pipe.publish_data(None, counters)
+        publisher = pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual([5, 10], [s.volume for s in publisher.samples])
+        self.assertEqual(['cpu_scaled', 'cpu_scaled'],
+                         [s.name for s in publisher.samples])
+
+    def test_rate_of_change_conversion_batch(self):
+        transformer_cfg = [
+            {
+                'name': 'rate_of_change',
+                'parameters': {
+                    'target': {'name': 'cpu_rate'},
+                }
+            },
+        ]
+        self._set_pipeline_cfg('transformers', transformer_cfg)
+        self._set_pipeline_cfg('counters', ['cpu'])
+        now = timeutils.utcnow()
+        counters = [
+            sample.Sample(
+                name='cpu',
+                type=sample.TYPE_CUMULATIVE,
+                volume=volume,
+                unit='ns',
+                user_id='test_user',
+                project_id='test_proj',
+                resource_id=resource_id,
+                timestamp=(now + datetime.timedelta(
+                    seconds=offset)).isoformat(),
+                resource_metadata={}
+            ) for volume, resource_id, offset in (
+                (10, 'test_resource', 0), (100, 'test_resource2', 0),
+                (30, 'test_resource', 10), (150, 'test_resource2', 10))
+        ]
+
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+
+        pipe.publish_data(None, counters)
+        publisher = pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual(1, publisher.calls)
+        self.assertEqual([('test_resource', 2.0), ('test_resource2', 5.0)],
+                         [(s.resource_id, s.volume)
+                          for s in publisher.samples])
+
     def test_unit_identified_source_unit_conversion(self):
         transformer_cfg = [
             {
@@ -1617,6 +1721,59 @@ class BasePipelineTestCase(base.BaseTestCase):
         publisher = pipeline_manager.pipelines[0].publishers[0]
         self.assertEqual(1, len(publisher.samples))
 
+    def test_aggregator_timed_flush_per_key(self):
+        timeutils.set_time_override()
+        transformer_cfg = [
+            {
+                'name': 'aggregator',
+                'parameters': {'size': 900, 'retention_time': 60},
+            },
+        ]
+        self._set_pipeline_cfg('transformers', transformer_cfg)
+        self._set_pipeline_cfg('counters', ['storage.objects.incoming.bytes'])
+
+        def make_sample(resource_id, volume):
+            return sample.Sample(
+                name='storage.objects.incoming.bytes',
+                type=sample.TYPE_GAUGE,
+                volume=volume,
+                unit='B',
+                user_id='test_user',
+                project_id='test_proj',
+                resource_id=resource_id,
+                timestamp=timeutils.utcnow().isoformat(),
+                resource_metadata={'version': '1.0'}
+            )
+
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+        publisher = pipe.publishers[0]
+
+        pipe.publish_data(None, [make_sample('first', 10)])
+        timeutils.advance_time_seconds(40)
+        pipe.publish_data(None, [make_sample('second', 20),
+                                 make_sample('first', 20)])
+        timeutils.advance_time_seconds(30)
+        pipe.flush(None)
+        self.assertEqual([('first', 15)],
+                         [(s.resource_id, s.volume)
+                          for s in publisher.samples])
+
+        pipe.publish_data(None, [make_sample('first', 30),
+                                 make_sample('second', 40)])
+        timeutils.advance_time_seconds(40)
+        pipe.flush(None)
+        self.assertEqual([('first', 15), ('second', 30)],
+                         [(s.resource_id, s.volume)
+                          for s in publisher.samples])
+
+        timeutils.advance_time_seconds(60)
+        pipe.flush(None)
+        self.assertEqual([('first', 15), ('second', 30), ('first', 30)],
+                         [(s.resource_id, s.volume)
+                          for s in publisher.samples])
+
     def test_aggregator_without_authentication(self):
         transformer_cfg = [
             {
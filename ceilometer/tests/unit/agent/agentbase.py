@@ -494,6 +494,30 @@ class BaseAgentManagerTestCase(base.BaseTestCase):
         self.assertEqual(discovered_resources, self.Pollster.resources)
         self.assertEqual(discovered_resources, self.PollsterAnother.resources)
 
+    def test_per_pollster_discovery_unhashable_duplicated(self):
+        self.Pollster.discovery = 'testdiscovery'
+        self.mgr.discovery_manager = self.create_discovery_manager()
+        self.Discovery.resources = [{'id': 'a'}, {'id': 'b'}, {'id': 'a'}]
+        self.pipeline_cfg['sources'][0]['resources'] = []
+        self.setup_polling()
+        polling_tasks = self.mgr.setup_polling_tasks()
+        self.mgr.interval_task(polling_tasks.get(60))
+        self.assertEqual([{'id': 'a'}, {'id': 'b'}], self.Pollster.resources)
+
+    def test_per_pollster_discovery_resource_identity(self):
+        self.Pollster.discovery = 'testdiscovery'
+        self.mgr.discovery_manager = self.create_discovery_manager()
+        self.Discovery.resources = [{'id': 'a', 'status': 'ACTIVE'},
+                                    {'id': 'a', 'status': 'ERROR'}]
+        self.pipeline_cfg['sources'][0]['resources'] = []
+        self.setup_polling()
+        polling_tasks = self.mgr.setup_polling_tasks()
+        with mock.patch.object(self.Discovery, 'resource_identity',
+                               side_effect=lambda r: r['id']):
+            self.mgr.interval_task(polling_tasks.get(60))
+        self.assertEqual([{'id': 'a', 'status': 'ACTIVE'}],
+                         self.Pollster.resources)
+
     def _do_test_per_pipeline_discovery(self,
                                         discovered_resources,
                                         static_resources):
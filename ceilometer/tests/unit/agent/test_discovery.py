@@ -106,3 +106,19 @@ class TestHardwareDiscovery(base.BaseTestCase):
         self.discovery.nova_cli.instance_get_all.return_value = [instance]
         resources = self.discovery.discover(self.manager)
         self.assertEqual(0, len(resources))
+
+    def test_hardware_resource_identity(self):
+        self.assertEqual('resource_id',
+                         self.discovery.resource_identity(self.expected))
+
+
+class TestResourceIdentity(base.BaseTestCase):
+    def test_hashable_resource(self):
+        discovery = localnode.LocalNodeDiscovery()
+        self.assertEqual('local_host',
+                         discovery.resource_identity('local_host'))
+
+    def test_unhashable_resource(self):
+        discovery = localnode.LocalNodeDiscovery()
+        self.assertEqual(str({'id': 'a'}),
+                         discovery.resource_identity({'id': 'a'}))
@@ -377,6 +377,89 @@ class TestRunTasks(agentbase.BaseAgentManagerTestCase):
             'polling source %(source)s anymore!')
             % ({'name': pollster.name, 'source': source_name}))
 
+    def _poll_with(self, pollsters, resources=None):
+        self.mgr.extensions.extend(
+            extension.Extension(name, None, None, pollster)
+            for name, pollster in pollsters.items())
+        self.pipeline_cfg = {
+            'sources': [{
+                'name': 'test_concurrent',
+                'interval': 10,
+                'meters': list(pollsters),
+                'resources': resources or ['test://'],
+                'sinks': ['test_sink']}],
+            'sinks': [{
+                'name': 'test_sink',
+                'transformers': [],
+                'publishers': ["test"]}]
+        }
+        self.mgr.polling_manager = pipeline.PollingManager(self.pipeline_cfg)
+        return list(self.mgr.setup_polling_tasks().values())[0]
+
+    def test_concurrent_pollsters(self):
+        self.CONF.set_override('pollster_workers', 2, group='polling')
+        events = []
+
+        class PollsterSlow(agentbase.TestPollster):
+            samples = []
+            resources = []
+
+            def get_samples(self, manager, cache, resources):
+                events.append('start')
+                eventlet.sleep(0.01)
+                events.append('end')
+                return super(PollsterSlow, self).get_samples(
+                    manager, cache, resources)
+
+        polling_task = self._poll_with({'testslow': PollsterSlow(),
+                                        'testslow2': PollsterSlow()})
+        self.mgr.interval_task(polling_task)
+        self.assertEqual(['start', 'start', 'end', 'end'], events)
+        self.assertEqual(2, len(self.notified_samples))
+
+    def test_sequential_pollsters(self):
+        events = []
+
+        class PollsterSlow(agentbase.TestPollster):
+            samples = []
+            resources = []
+
+            def get_samples(self, manager, cache, resources):
+                events.append('start')
+                eventlet.sleep(0.01)
+                events.append('end')
+                return super(PollsterSlow, self).get_samples(
+                    manager, cache, resources)
+
+        polling_task = self._poll_with({'testslow': PollsterSlow(),
+                                        'testslow2': PollsterSlow()})
+        self.mgr.interval_task(polling_task)
+        self.assertEqual(['start', 'end', 'start', 'end'], events)
+        self.assertEqual(2, len(self.notified_samples))
+
+    @mock.patch('ceilometer.agent.manager.LOG')
+    def test_pollster_timeout(self, LOG):
+        self.CONF.set_override('pollster_workers', 2, group='polling')
+
+        class PollsterHang(agentbase.TestPollster):
+            samples = []
+            resources = []
+
+            def get_samples(self, manager, cache, resources):
+                eventlet.sleep(60)
+
+        polling_task = self._poll_with({'testhang': PollsterHang(),
+                                        'test': self.Pollster()})
+        polling_task._timeout = 0.01
+        self.mgr.interval_task(polling_task)
+        self.assertEqual(1, len(self.notified_samples))
+        self.assertEqual('test', self.notified_samples[0]['counter_name'])
+        LOG.warning.assert_called_once_with(
+            'Pollster %(name)s of polling source %(source)s timed out '
+            'after %(timeout)s seconds',
+            {'name': 'testhang', 'source': 'test_concurrent',
+             'timeout': 0.01})
+
     def test_batching_polled_samples_false(self):
         self.CONF.set_override('batch_polled_samples', False)
         self._batching_samples(4, 4)
@@ -56,3 +56,24 @@ class NotificationBaseTestCase(base.BaseTestCase):
         }
         plugin.to_samples_and_publish.assert_called_with(mock.ANY,
                                                          notification)
+
+    def test_plugin_process_notifications(self):
+        manager = mock.MagicMock()
+        plugin = self.FakePlugin(manager)
+        plugin.process_notification = mock.Mock(
+            side_effect=[['sample1'], Exception('boom'),
+                         ['sample2', 'sample3']])
+        notifications = [
+            {'ctxt': {'user_id': 'user%d' % i}, 'publisher_id': 'compute',
+             'event_type': 'compute.instance.create.end',
+             'payload': {'foo': i}, 'metadata': {}}
+            for i in range(3)]
+        plugin.process_notifications('info', notifications)
+        self.assertEqual(3, plugin.process_notification.call_count)
+        self.assertEqual(
+            {'priority': 'info', 'publisher_id': 'compute',
+             'event_type': 'compute.instance.create.end',
+             'payload': {'foo': 2}, '_context_user_id': 'user2'},
+            plugin.process_notification.call_args[0][0])
+        publish = manager.publisher.return_value.__enter__.return_value
+        publish.assert_called_once_with(['sample1', 'sample2', 'sample3'])
@@ -52,10 +52,10 @@ class TestDispatcherDB(base.BaseTestCase):
         )
 
         with mock.patch.object(self.dispatcher.meter_conn,
-                               'record_metering_data') as record_metering_data:
+                               'record_metering_data_batch') as record_batch:
             self.dispatcher.record_metering_data(msg)
 
-        record_metering_data.assert_called_once_with(msg)
+        record_batch.assert_called_once_with([msg])
 
     def test_invalid_message(self):
         msg = {'counter_name': 'test',
@@ -67,7 +67,7 @@ class TestDispatcherDB(base.BaseTestCase):
 
             called = False
 
-            def record_metering_data(self, data):
+            def record_metering_data_batch(self, samples):
                 self.called = True
 
         self.dispatcher._meter_conn = ErrorConnection()
@@ -91,10 +91,10 @@ class TestDispatcherDB(base.BaseTestCase):
         expected['timestamp'] = datetime.datetime(2012, 7, 2, 13, 53, 40)
 
         with mock.patch.object(self.dispatcher.meter_conn,
-                               'record_metering_data') as record_metering_data:
+                               'record_metering_data_batch') as record_batch:
             self.dispatcher.record_metering_data(msg)
 
-        record_metering_data.assert_called_once_with(expected)
+        record_batch.assert_called_once_with([expected])
 
     def test_timestamp_tzinfo_conversion(self):
         msg = {'counter_name': 'test',
@@ -111,7 +111,26 @@ class TestDispatcherDB(base.BaseTestCase):
                                                   31, 50, 262000)
 
         with mock.patch.object(self.dispatcher.meter_conn,
-                               'record_metering_data') as record_metering_data:
+                               'record_metering_data_batch') as record_batch:
             self.dispatcher.record_metering_data(msg)
 
-        record_metering_data.assert_called_once_with(expected)
+        record_batch.assert_called_once_with([expected])
+
+    def test_invalid_message_in_batch(self):
+        msg = {'counter_name': 'test',
+               'resource_id': self.id(),
+               'counter_volume': 1,
+               }
+        msg['message_signature'] = utils.compute_signature(
+            msg, self.CONF.publisher.telemetry_secret,
+        )
+        invalid = {'counter_name': 'test',
+                   'resource_id': self.id(),
+                   'counter_volume': 2,
+                   'message_signature': 'invalid-signature'}
+
+        with mock.patch.object(self.dispatcher.meter_conn,
+                               'record_metering_data_batch') as record_batch:
+            self.dispatcher.record_metering_data([msg, invalid, msg])
+
+        record_batch.assert_called_once_with([msg, msg])
@@ -14,6 +14,7 @@
 # under the License.
 
 import datetime
+import fnmatch
 
 import jsonpath_rw_ext
 import mock
@@ -704,6 +705,75 @@ class TestNotificationConverter(ConverterBase):
         e = c.to_event(self.test_notification2)
         self.assertIsNotValidEvent(e, self.test_notification2)
 
+    def test_find_definition_last_match_wins(self):
+        event_defs = [
+            {'event_type': 'compute.instance.create.start', 'traits': {}},
+            {'event_type': 'compute.instance.*', 'traits': {}},
+            {'event_type': ['compute.*', '!compute.instance.exists'],
+             'traits': {}},
+            {'event_type': ['compute.instance.exists', 'image.*'],
+             'traits': {}},
+        ]
+        c = converter.NotificationEventsConverter(
+            event_defs, self.fake_plugin_mgr, add_catchall=False)
+        definitions = dict((t, c.find_definition(t)) for t in (
+            'compute.instance.create.start', 'compute.instance.exists',
+            'compute.instance.delete.end', 'compute.metrics.update',
+            'image.upload', 'network.create.end'))
+        self.assertEqual(event_defs[3], definitions[
+            'compute.instance.exists'].cfg)
+        self.assertEqual(event_defs[2], definitions[
+            'compute.instance.create.start'].cfg)
+        self.assertEqual(event_defs[2], definitions[
+            'compute.instance.delete.end'].cfg)
+        self.assertEqual(event_defs[2], definitions[
+            'compute.metrics.update'].cfg)
+        self.assertEqual(event_defs[3], definitions['image.upload'].cfg)
+        self.assertIsNone(definitions['network.create.end'])
+
+    def test_find_definition_same_as_match_type(self):
+        event_defs = [
+            {'event_type': 'compute.instance.create.start', 'traits': {}},
+            {'event_type': ['*.start', '!scheduler.*'], 'traits': {}},
+            {'event_type': ['image.?pload', 'image.[dc]*'], 'traits': {}},
+            {'event_type': '!image.*', 'traits': {}},
+        ]
+        c = converter.NotificationEventsConverter(
+            event_defs, self.fake_plugin_mgr, add_catchall=False)
+        for event_type in ('compute.instance.create.start', 'image.upload',
+                           'image.delete', 'image.update',
+                           'scheduler.run_instance.start', 'foo'):
+            expected = None
+            for d in c.definitions:
+                if (any(fnmatch.fnmatch(event_type, t)
+                        for t in d._included_types) and
+                        not any(fnmatch.fnmatch(event_type, t)
+                                for t in d._excluded_types)):
+                    expected = d
+                    break
+            self.assertIs(expected, c.find_definition(event_type),
+                          event_type)
+
+    def test_find_definition_cached(self):
+        c = converter.NotificationEventsConverter(
+            self.valid_event_def1, self.fake_plugin_mgr, add_catchall=False)
+        with mock.patch.object(c, '_match_definition',
+                               wraps=c._match_definition) as match:
+            for i in range(3):
+                c.to_event(self.test_notification1)
+                c.to_event(self.test_notification2)
+        self.assertEqual(2, match.call_count)
+
+    def test_find_definition_cache_disabled(self):
+        self.CONF.set_override('definitions_cache_size', 0, group='event')
+        c = converter.NotificationEventsConverter(
+            self.valid_event_def1, self.fake_plugin_mgr, add_catchall=False)
+        with mock.patch.object(c, '_match_definition',
+                               wraps=c._match_definition) as match:
+            for i in range(3):
+                c.to_event(self.test_notification1)
+        self.assertEqual(3, match.call_count)
+
     @staticmethod
     def _convert_message(convert, level):
         message = {'priority': level, 'event_type': "foo",
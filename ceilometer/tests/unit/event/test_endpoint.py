@@ -186,3 +186,35 @@ class TestEventEndpoint(tests_base.BaseTestCase):
             exception_mock = mock_logger.exception
             self.assertIn('Continue after error from publisher',
                           exception_mock.call_args_list[0][0][0])
+
+    def test_process_notifications(self):
+        self._setup_endpoint(['test://'])
+        self.endpoint.event_converter.to_event.side_effect = [
+            mock.MagicMock(event_type='test.test'), None,
+            mock.MagicMock(event_type='test.test')]
+        notification = dict(ctxt=TEST_NOTICE_CTXT,
+                            publisher_id='compute.vagrant-precise',
+                            event_type='compute.instance.create.end',
+                            payload=TEST_NOTICE_PAYLOAD,
+                            metadata=TEST_NOTICE_METADATA)
+        ret = self.endpoint.process_notifications('info',
+                                                  [notification] * 3)
+        self.assertEqual(oslo_messaging.NotificationResult.HANDLED, ret)
+        self.assertEqual(3, self.endpoint.event_converter.to_event.call_count)
+        self.assertEqual(1, self.fake_publisher.publish_events.call_count)
+        self.assertEqual(
+            2, len(self.fake_publisher.publish_events.call_args[0][1]))
+
+    def test_process_notifications_requeue(self):
+        self._setup_endpoint(['test://'])
+        self.fake_publisher.publish_events.side_effect = Exception
+        self.CONF.set_override("ack_on_event_error", False,
+                               group="notification")
+        notification = dict(ctxt=TEST_NOTICE_CTXT,
+                            publisher_id='compute.vagrant-precise',
+                            event_type='compute.instance.create.end',
+                            payload=TEST_NOTICE_PAYLOAD,
+                            metadata=TEST_NOTICE_METADATA)
+        ret = self.endpoint.process_notifications('info',
+                                                  [notification] * 2)
+        self.assertEqual(oslo_messaging.NotificationResult.REQUEUE, ret)
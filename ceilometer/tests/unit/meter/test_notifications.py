@@ -362,6 +362,67 @@ class TestMeterProcessing(test.BaseTestCase):
         c = list(self.handler.process_notification(NOTIFICATION))
         self.assertEqual(0, len(c))
 
+    def test_find_definitions(self):
+        cfg = yaml.dump(
+            {'metric': [dict(name="test1",
+                             event_type="test.*",
+                             type="delta",
+                             unit="B",
+                             volume="$.payload.volume",
+                             resource_id="$.payload.resource_id"),
+                        dict(name="test2",
+                             event_type=["test.create", "other.create"],
+                             type="delta",
+                             unit="B",
+                             volume="$.payload.volume",
+                             resource_id="$.payload.resource_id"),
+                        dict(name="test3",
+                             event_type="*.create",
+                             type="delta",
+                             unit="B",
+                             volume="$.payload.volume",
+                             resource_id="$.payload.resource_id")]})
+        self.handler.definitions = notifications.load_definitions(
+            self.__setup_meter_def_file(cfg))
+        for event_type in ('test.create', 'other.create', 'test.delete',
+                           'other.delete'):
+            self.assertEqual(
+                [d for d in self.handler.definitions
+                 if d.match_type(event_type)],
+                self.handler.find_definitions(event_type))
+        self.assertEqual(['test3', 'test2', 'test1'],
+                         [d.cfg['name'] for d in
+                          self.handler.find_definitions('test.create')])
+
+        with mock.patch.object(self.handler, '_match_definitions') as match:
+            self.handler.find_definitions('test.create')
+            self.assertFalse(match.called)
+
+        self.handler.definitions = []
+        self.assertEqual([], self.handler.find_definitions('test.create'))
+
+    def test_fields_extracted_once(self):
+        cfg = yaml.dump(
+            {'metric': [dict(name="test1",
+                             event_type="test.*",
+                             type="delta",
+                             unit="B",
+                             volume="$.payload.volume",
+                             resource_id="$.payload.resource_id",
+                             project_id="$.payload.project_id",
+                             user_id="$.payload.user_id",
+                             metadata={'proj': '$.payload.project_id'})]})
+        self.handler.definitions = notifications.load_definitions(
+            self.__setup_meter_def_file(cfg))
+        d = self.handler.definitions[0]
+        with mock.patch.object(d, '_extract', wraps=d._extract) as extract:
+            c = list(self.handler.process_notification(NOTIFICATION))
+        self.assertEqual(1, extract.call_count)
+        self.assertEqual(1, len(c))
+        s1 = c[0].as_dict()
+        self.assertEqual('bea70e51c7340cb9d555b15cbfcaec23', s1['resource_id'])
+        self.assertEqual({'proj': s1['project_id']}, s1['resource_metadata'])
+
     def test_regex_match_meter(self):
         cfg = yaml.dump(
             {'metric': [dict(name="test1",
@@ -18,6 +18,7 @@ import datetime
 import uuid
 
 import eventlet
+import fixtures
 import mock
 from oslo_config import fixture as fixture_config
 from oslo_context import context
@@ -398,3 +399,84 @@ class TestPublisherPolicyReactions(TestPublisher):
             'test-1999',
             publisher.local_queue[1023][2][0][self.attr]
         )
+
+
+@mock.patch('ceilometer.publisher.messaging.LOG', mock.Mock())
+class TestPublisherSpool(TestPublisher):
+
+    def setUp(self):
+        super(TestPublisherSpool, self).setUp()
+        self.spool_dir = self.useFixture(fixtures.TempDir()).path
+        self.url = netutils.urlsplit(
+            '%s://?policy=queue&spool_dir=%s' % (self.protocol,
+                                                 self.spool_dir))
+
+    def _publish(self, publisher, i):
+        for s in self.test_data:
+            setattr(s, self.attr, 'test-%d' % i)
+        getattr(publisher, self.pub_func)(context.RequestContext(),
+                                          self.test_data)
+
+    def test_published_with_spool_and_rpc_down_up(self):
+        publisher = self.publisher_cls(self.url)
+        self.addCleanup(publisher.spool.close)
+        with mock.patch.object(publisher, '_send') as fake_send:
+            fake_send.side_effect = msg_publisher.DeliveryFailure()
+            for i in range(0, 3):
+                self._publish(publisher, i)
+            self.assertEqual(0, len(publisher.local_queue))
+            self.assertTrue(publisher.spool.pending())
+
+            fake_send.side_effect = None
+            self._publish(publisher, 3)
+        self.assertFalse(publisher.spool.pending())
+        sent = [data[0][self.attr]
+                for ctxt, topic, data in (c[1] for c in fake_send.mock_calls)]
+        # the oldest message is retried first by every publication
+        self.assertEqual(['test-0'] * 4 + ['test-1', 'test-2', 'test-3'],
+                         sent)
+
+    def test_published_with_spool_and_rpc_up(self):
+        publisher = self.publisher_cls(self.url)
+        self.addCleanup(publisher.spool.close)
+        with mock.patch.object(publisher, '_send') as fake_send:
+            with mock.patch.object(publisher.spool, 'append') as append:
+                for i in range(0, 3):
+                    self._publish(publisher, i)
+        self.assertEqual(0, append.call_count)
+        self.assertEqual(3, fake_send.call_count)
+
+    def test_published_with_spool_without_context(self):
+        publisher = self.publisher_cls(self.url)
+        self.addCleanup(publisher.spool.close)
+        with mock.patch.object(publisher, '_send') as fake_send:
+            fake_send.side_effect = msg_publisher.DeliveryFailure()
+            getattr(publisher, self.pub_func)(None, self.test_data)
+        self.assertTrue(publisher.spool.pending())
+        ctxt, topic, data = next(publisher.spool.read())[1]
+        self.assertEqual({}, ctxt)
+
+    def test_published_with_spool_replayed_after_restart(self):
+        publisher = self.publisher_cls(self.url)
+        with mock.patch.object(publisher, '_send') as fake_send:
+            fake_send.side_effect = msg_publisher.DeliveryFailure()
+            self._publish(publisher, 0)
+            self._publish(publisher, 1)
+        publisher.spool.close()
+
+        publisher = self.publisher_cls(self.url)
+        self.addCleanup(publisher.spool.close)
+        with mock.patch.object(publisher, '_send') as fake_send:
+            self._publish(publisher, 2)
+        sent = [(topic, data[0][self.attr])
+                for ctxt, topic, data in (c[1] for c in fake_send.mock_calls)]
+        self.assertEqual([(self.topic, 'test-0'), (self.topic, 'test-1'),
+                          (self.topic, 'test-2')], sent)
+        self.assertEqual(context.RequestContext().to_dict()['user'],
+                         fake_send.mock_calls[0][1][0].to_dict()['user'])
+
+    def test_spool_ignored_without_queue_policy(self):
+        publisher = self.publisher_cls(netutils.urlsplit(
+            '%s://?policy=drop&spool_dir=%s' % (self.protocol,
+                                                self.spool_dir)))
+        self.assertIsNone(publisher.spool)
@@ -0,0 +1,178 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/publisher/spool.py
+"""
+import json
+import os
+
+import fixtures
+import mock
+
+from ceilometer.publisher import spool
+from ceilometer.tests import base
+
+
+class TestSpool(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestSpool, self).setUp()
+        self.directory = self.useFixture(fixtures.TempDir()).path
+
+    def _spool(self, max_size=0, segment_size=1024, checkpoint_interval=0):
+        s = spool.Spool(self.directory, max_size, segment_size,
+                        checkpoint_interval)
+        self.addCleanup(s.close)
+        return s
+
+    @staticmethod
+    def _records(count, start=0):
+        return [{'counter_name': 'cpu', 'counter_volume': i}
+                for i in range(start, start + count)]
+
+    @staticmethod
+    def _segments(s):
+        return sorted(name for name in os.listdir(s.path)
+                      if name.endswith(spool.SEGMENT_SUFFIX))
+
+    def test_read_in_order_and_commit(self):
+        s = self._spool()
+        self.assertFalse(s.pending())
+        for record in self._records(10):
+            s.append(record)
+        self.assertTrue(s.pending())
+        read = list(s.read())
+        self.assertEqual(self._records(10), [r for p, r in read])
+
+        s.commit(read[3][0])
+        self.assertEqual(self._records(6, 4), [r for p, r in s.read()])
+        s.commit(read[-1][0])
+        self.assertFalse(s.pending())
+        self.assertEqual([], list(s.read()))
+
+    def test_appended_while_reading(self):
+        s = self._spool(segment_size=200)
+        s.append(self._records(1)[0])
+        read = []
+        for position, record in s.read():
+            read.append(record)
+            if record['counter_volume'] < 9:
+                s.append(self._records(1, record['counter_volume'] + 1)[0])
+        self.assertEqual(self._records(10), read)
+        self.assertGreater(len(self._segments(s)), 1)
+
+    def test_segment_rotation_and_removal(self):
+        s = self._spool(segment_size=200)
+        for record in self._records(20):
+            s.append(record)
+        segments = self._segments(s)
+        self.assertGreater(len(segments), 2)
+        for name in segments:
+            self.assertLessEqual(
+                os.path.getsize(os.path.join(s.path, name)), 200)
+
+        read = list(s.read())
+        self.assertEqual(self._records(20), [r for p, r in read])
+        s.commit(read[-1][0])
+        self.assertEqual(segments[-1:], self._segments(s))
+
+    def test_max_size_drops_oldest_segments(self):
+        s = self._spool(max_size=1000, segment_size=200)
+        for record in self._records(100):
+            s.append(record)
+        self.assertLessEqual(s.size, 1000)
+        read = [r for p, r in s.read()]
+        self.assertLess(len(read), 100)
+        self.assertEqual(self._records(len(read), 100 - len(read)), read)
+
+    def test_checkpoint_persisted(self):
+        s = self._spool(segment_size=200)
+        for record in self._records(10):
+            s.append(record)
+        read = list(s.read())
+        s.commit(read[6][0])
+        s.close()
+
+        s = self._spool(segment_size=200)
+        self.assertEqual(self._records(3, 7), [r for p, r in s.read()])
+        s.append(self._records(1, 10)[0])
+        self.assertEqual(self._records(4, 7), [r for p, r in s.read()])
+
+    def test_checkpoint_written_at_most_every_interval(self):
+        s = self._spool(checkpoint_interval=3600)
+        for record in self._records(10):
+            s.append(record)
+        read = list(s.read())
+        with mock.patch('os.fsync') as fsync:
+            for position, record in read[:5]:
+                s.commit(position)
+            self.assertEqual(0, fsync.call_count)
+            self.assertFalse(os.path.exists(os.path.join(
+                s.path, spool.CHECKPOINT)))
+            s.close()
+            self.assertEqual(1, fsync.call_count)
+
+        s = self._spool()
+        self.assertEqual(self._records(5, 5), [r for p, r in s.read()])
+
+    def test_checkpoint_written_once_drained(self):
+        s = self._spool(checkpoint_interval=3600)
+        for record in self._records(3):
+            s.append(record)
+        read = list(s.read())
+        s.commit(read[1][0])
+        self.assertFalse(os.path.exists(os.path.join(
+            s.path, spool.CHECKPOINT)))
+        s.commit(read[2][0])
+        with open(os.path.join(s.path, spool.CHECKPOINT)) as f:
+            self.assertEqual(list(read[2][0]), json.loads(f.read()))
+
+    def test_invalid_checkpoint_replays_all(self):
+        s = self._spool()
+        for record in self._records(3):
+            s.append(record)
+        s.commit(list(s.read())[1][0])
+        s.close()
+        with open(os.path.join(s.path, spool.CHECKPOINT), 'w') as f:
+            f.write('[1, ')
+
+        s = self._spool()
+        self.assertEqual(self._records(3), [r for p, r in s.read()])
+
+    def test_partial_record_discarded(self):
+        s = self._spool()
+        for record in self._records(3):
+            s.append(record)
+        s.close()
+        segment = os.path.join(s.path, self._segments(s)[-1])
+        size = os.path.getsize(segment)
+        # a crash in the middle of the last record
+        with open(segment, 'r+b') as f:
+            f.truncate(size - 5)
+
+        s = self._spool()
+        self.assertEqual(self._records(2), [r for p, r in s.read()])
+        s.append(self._records(1, 3)[0])
+        self.assertEqual(self._records(2) + self._records(1, 3),
+                         [r for p, r in s.read()])
+
+    def test_slots(self):
+        first = self._spool()
+        second = self._spool()
+        self.assertNotEqual(first.path, second.path)
+        first.append({'slot': 0})
+        second.append({'slot': 1})
+        first.close()
+
+        third = self._spool()
+        self.assertEqual(first.path, third.path)
+        self.assertEqual([{'slot': 0}], [r for p, r in third.read()])
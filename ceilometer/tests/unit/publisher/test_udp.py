@@ -158,6 +158,52 @@ class TestUDPPublisher(base.BaseTestCase):
         sent_counters.sort(key=sort_func)
         self.assertEqual(counters, sent_counters)
 
+    def _publish_batched(self, url):
+        self.data_sent = []
+        with mock.patch('socket.socket',
+                        self._make_fake_socket(self.data_sent)):
+            publisher = udp.UDPPublisher(netutils.urlsplit(url))
+        publisher.publish_samples(None, self.test_data)
+        return [msgpack.loads(data, encoding="utf-8")
+                for data, dest in self.data_sent]
+
+    def _expected_counters(self):
+        return [utils.meter_message_from_counter(d, "not-so-secret")
+                for d in self.test_data]
+
+    def test_published_batched(self):
+        datagrams = self._publish_batched('udp://somehost?batch=1')
+        self.assertEqual([self._expected_counters()], datagrams)
+
+    def test_batch_option_parsing(self):
+        for value, expected in (('1', True), ('true', True), ('True', True),
+                                ('yes', True), ('0', False),
+                                ('false', False)):
+            publisher = udp.UDPPublisher(
+                netutils.urlsplit('udp://somehost?batch=%s' % value))
+            self.assertEqual(expected, publisher.batch)
+        publisher = udp.UDPPublisher(netutils.urlsplit('udp://somehost'))
+        self.assertFalse(publisher.batch)
+
+    def test_published_batched_max_datagram_size(self):
+        counters = self._expected_counters()
+        size = (max(len(msgpack.dumps(c)) for c in counters) * 2 +
+                udp.ARRAY_HEADER_SIZE)
+        datagrams = self._publish_batched(
+            'udp://somehost?batch=1&max_datagram_size=%d' % size)
+        self.assertEqual([counters[0:2], counters[2:4], counters[4:]],
+                         datagrams)
+        for data, dest in self.data_sent:
+            self.assertTrue(len(data) <= size)
+
+    def test_published_batched_oversized_sample(self):
+        counters = self._expected_counters()
+        size = len(msgpack.dumps(counters[0]))
+        datagrams = self._publish_batched(
+            'udp://somehost?batch=1&max_datagram_size=%d' % size)
+        # every sample is sent alone, in the single sample format
+        self.assertEqual(counters, datagrams)
+
     @staticmethod
     def _raise_ioerror(*args):
         raise IOError
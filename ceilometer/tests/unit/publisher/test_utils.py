@@ -14,6 +14,7 @@
 # under the License.
 """Tests for ceilometer/publisher/utils.py
 """
+from oslo_config import fixture as fixture_config
 from oslo_serialization import jsonutils
 from oslotest import base
 
@@ -133,3 +134,52 @@ class TestSignature(base.BaseTestCase):
     def test_verify_no_secret(self):
         data = {'a': 'A', 'b': 'B'}
         self.assertTrue(utils.verify_signature(data, ''))
+
+    def test_compute_signature_v2(self):
+        data = {'a': 'A', 'b': 'B', 'nested': {'c': ['c', 1.5]}}
+        sig = utils.compute_signature(data, 'not-so-secret', 2)
+        self.assertTrue(sig.startswith(utils.SIGNATURE_V2_PREFIX))
+        self.assertTrue(len(sig) <= 64)
+        self.assertNotEqual(utils.compute_signature(data, 'not-so-secret'),
+                            sig)
+        data['message_signature'] = sig
+        self.assertEqual(sig,
+                         utils.compute_signature(data, 'not-so-secret', 2))
+
+    def test_compute_signature_v2_change_value(self):
+        sig1 = utils.compute_signature({'a': 'A', 'b': 'B'},
+                                       'not-so-secret', 2)
+        sig2 = utils.compute_signature({'a': 'a', 'b': 'B'},
+                                       'not-so-secret', 2)
+        self.assertNotEqual(sig1, sig2)
+
+    def test_compute_signature_configured_version(self):
+        self.CONF = self.useFixture(fixture_config.Config()).conf
+        self.CONF.set_override('telemetry_signature_version', 2,
+                               group='publisher')
+        sig = utils.compute_signature({'a': 'A'}, 'not-so-secret')
+        self.assertTrue(sig.startswith(utils.SIGNATURE_V2_PREFIX))
+
+    def test_verify_signature_v2_nested_json(self):
+        data = {'a': 'A',
+                'b': 'B',
+                'nested': {'a': 'A',
+                           'b': 'B',
+                           'c': ('c',),
+                           'd': [u'd\xe9\u0437']
+                           },
+                }
+        data['message_signature'] = utils.compute_signature(
+            data, 'not-so-secret', 2)
+        jsondata = jsonutils.loads(jsonutils.dumps(data))
+        self.assertTrue(utils.verify_signature(jsondata, 'not-so-secret'))
+        jsondata['nested']['a'] = 'changed'
+        self.assertFalse(utils.verify_signature(jsondata, 'not-so-secret'))
+
+    def test_verify_signature_both_versions(self):
+        # consumers accept both versions during a rolling upgrade
+        for version in (1, 2):
+            data = {'a': 'A', 'b': 'B'}
+            data['message_signature'] = utils.compute_signature(
+                data, 'not-so-secret', version)
+            self.assertTrue(utils.verify_signature(data, 'not-so-secret'))
@@ -13,6 +13,13 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import os
+import subprocess
+import sys
+
+import mock
+from oslo_config import fixture as fixture_config
+from oslotest import base
 import yaml
 
 from ceilometer import pipeline
@@ -294,3 +301,115 @@ class TestDecoupledPipeline(pipeline_base.BasePipelineTestCase):
                           pipeline.PipelineManager,
                           self.pipeline_cfg,
                           self.transformer_manager)
+
+
+RESOURCE_CRC32 = 3163681814
+
+
+class TestSamplePipelineTransportManager(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestSamplePipelineTransportManager, self).setUp()
+        self.CONF = self.useFixture(fixture_config.Config()).conf
+        self.CONF.import_opt('pipeline_batch_size', 'ceilometer.notification',
+                             group='notification')
+        self.notifiers = [mock.Mock(), mock.Mock()]
+        self.manager = pipeline.SamplePipelineTransportManager()
+        self.manager.add_transporter((lambda name: name.startswith('a'),
+                                      ['resource_id'], self.notifiers))
+        self.context = mock.Mock()
+        self.context.to_dict.return_value = {}
+
+    @staticmethod
+    def _sample(name, resource_id):
+        return sample.Sample(name=name, type=sample.TYPE_GAUGE, unit='',
+                             volume=1, user_id='user', project_id='project',
+                             resource_id=resource_id,
+                             timestamp='2015-07-02T10:39:00.000000',
+                             resource_metadata={})
+
+    def _payloads(self, notifier):
+        return [[s['resource_id'] for s in c[1]['payload']]
+                for c in notifier.sample.call_args_list]
+
+    def _publish(self, *samples):
+        with mock.patch.object(self.manager, 'hash_grouping',
+                               lambda d, keys: int(d['resource_id'])):
+            with self.manager.publisher(self.context) as p:
+                for s in samples:
+                    p(s)
+                    yield
+
+    def test_batched_per_notifier(self):
+        samples = [self._sample('a', str(i)) for i in range(5)]
+        samples.append(self._sample('b', '1'))
+        for _ in self._publish(samples):
+            self.assertFalse(self.notifiers[0].sample.called)
+            self.assertFalse(self.notifiers[1].sample.called)
+        self.assertEqual([['0', '2', '4']], self._payloads(self.notifiers[0]))
+        self.assertEqual([['1', '3']], self._payloads(self.notifiers[1]))
+        self.assertEqual('ceilometer.pipeline',
+                         self.notifiers[0].sample.call_args[1]['event_type'])
+
+    def test_batch_size(self):
+        self.CONF.set_override('pipeline_batch_size', 2, group='notification')
+        samples = [self._sample('a', str(i)) for i in range(5)]
+        for _, expected in zip(self._publish(*samples), [0, 0, 1, 1, 1]):
+            self.assertEqual(expected, self.notifiers[0].sample.call_count)
+        self.assertEqual([['0', '2'], ['4']],
+                         self._payloads(self.notifiers[0]))
+        self.assertEqual([['1', '3']], self._payloads(self.notifiers[1]))
+
+    def test_batch_timeout(self):
+        self.CONF.set_override('pipeline_batch_timeout', 10,
+                               group='notification')
+        with mock.patch('time.time') as now:
+            now.return_value = 100
+            publish = self._publish(self._sample('a', '0'),
+                                    self._sample('a', '2'))
+            next(publish)
+            self.assertFalse(self.notifiers[0].sample.called)
+            now.return_value = 110
+            next(publish)
+            self.assertEqual([['0', '2']], self._payloads(self.notifiers[0]))
+            self.assertRaises(StopIteration, next, publish)
+        self.assertEqual(1, self.notifiers[0].sample.call_count)
+
+    def test_serialized_once(self):
+        self.manager.add_transporter((lambda name: True, ['resource_id'],
+                                      [self.notifiers[1]]))
+        with mock.patch.object(self.manager, 'serializer',
+                               wraps=self.manager.serializer) as serializer:
+            list(self._publish(self._sample('a', '0')))
+        self.assertEqual(1, serializer.call_count)
+        self.assertEqual([['0']], self._payloads(self.notifiers[0]))
+        self.assertEqual([['0']], self._payloads(self.notifiers[1]))
+
+    def test_hash_grouping(self):
+        hash_grouping = self.manager.hash_grouping
+        datapoint = {'resource_id': 'resource', 'user_id': None,
+                     'project_id': u'proj\xe9t'}
+        # NOTE: the value must not change across releases either
+        self.assertEqual(RESOURCE_CRC32,
+                         hash_grouping(datapoint, ['resource_id']))
+        self.assertEqual(hash_grouping(datapoint, ['resource_id']),
+                         hash_grouping(datapoint, ('resource_id',)))
+        self.assertEqual(hash_grouping(datapoint, ['resource_id', 'user_id']),
+                         hash_grouping(datapoint, ['resource_id', 'missing']))
+        self.assertNotEqual(hash_grouping(datapoint, ['resource_id']),
+                            hash_grouping(datapoint, ['project_id']))
+        self.assertNotEqual(hash_grouping({'a': 'ab', 'b': 'c'}, ['a', 'b']),
+                            hash_grouping({'a': 'a', 'b': 'bc'}, ['a', 'b']))
+        self.assertEqual(hash_grouping({}, []), hash_grouping({}, None))
+
+    def test_hash_grouping_same_across_processes(self):
+        code = ("from ceilometer import pipeline; "
+                "print([pipeline.SamplePipelineTransportManager.hash_grouping("
+                "{'resource_id': 'resource-%d' % i, 'project_id': 'project'},"
+                " ['resource_id', 'project_id']) for i in range(100)])")
+        outputs = set()
+        for seed in ('1', '2', 'random'):
+            env = dict(os.environ, PYTHONHASHSEED=seed)
+            outputs.add(subprocess.check_output([sys.executable, '-c', code],
+                                                env=env))
+        self.assertEqual(1, len(outputs))
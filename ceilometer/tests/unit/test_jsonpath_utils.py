@@ -0,0 +1,252 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/jsonpath_utils.py
+"""
+import copy
+import re
+
+from jsonpath_rw_ext import parser
+import six
+import yaml
+
+from ceilometer import jsonpath_utils
+from ceilometer.tests import base
+
+
+PARSER = parser.ExtentedJsonPathParser()
+
+
+def reference_find(path, data):
+    def get_path(match):
+        if match.context is not None:
+            for path_element in get_path(match.context):
+                yield path_element
+            yield str(match.path)
+    return [('.'.join(get_path(match)), match.value)
+            for match in path.find(data)]
+
+
+def set_path(data, expression, value):
+    """Set the value of a plain dotted path, creating its parents."""
+    tokens = re.findall(r'\[(\d+)\]|"([^"]+)"|([^.\[\]"]+)', expression)
+    keys = [int(index) if index else (quoted or name)
+            for index, quoted, name in tokens]
+    for key, next_key in zip(keys, keys[1:]):
+        if not isinstance(data, (dict, list)):
+            # already set as a leaf by a shorter path
+            return
+        child = [] if isinstance(next_key, int) else {}
+        if isinstance(key, int):
+            data.extend([None] * (key + 1 - len(data)))
+            if data[key] is None:
+                data[key] = child
+        else:
+            data.setdefault(key, child)
+        data = data[key]
+    if isinstance(keys[-1], int):
+        data.extend([None] * (keys[-1] + 1 - len(data)))
+    if isinstance(data, dict) or isinstance(keys[-1], int):
+        data[keys[-1]] = value
+
+
+class TestCompilePath(base.BaseTestCase):
+
+    DOCUMENT = {
+        'publisher_id': 'compute.host-1',
+        'payload': {
+            'tenant_id': 'tenant',
+            'user_id': None,
+            'state': 'active',
+            'org.openstack.flavor': 'm1.tiny',
+            'fixed_ips': [{'address': '10.0.0.2'}, {'address': '10.0.0.3'}],
+            'name': 'name',
+            'hosts': 'host-1',
+        },
+        '_context_tenant': 'context-tenant',
+        '_context_user_id': 'context-user',
+    }
+
+    EXPRESSIONS = [
+        'publisher_id',
+        'payload.tenant_id',
+        'payload.user_id',
+        'payload.missing',
+        'payload.tenant_id.deeper',
+        'payload."org.openstack.flavor"',
+        'payload.state,name,missing',
+        '$.payload.state',
+        'payload.fixed_ips[0].address',
+        'payload.fixed_ips[1].address',
+        'payload.fixed_ips[5].address',
+        'payload.fixed_ips.address',
+        'payload.hosts[0]',
+        '(payload.tenant_id)|(_context_tenant)',
+        '(payload.user_id)|(_context_user_id)',
+        '(payload.missing)|(payload.other)|(publisher_id)',
+        '(payload.fixed_ips[0])|(payload.fixed_ips[1].address)',
+        'payload.*',
+        'payload.fixed_ips[*].address',
+        'publisher_id.`split(., 0, -1)`',
+    ]
+
+    def _assert_parity(self, expression, document):
+        path = PARSER.parse(expression)
+        expected = reference_find(path, document)
+        self.assertEqual(
+            expected,
+            jsonpath_utils.compile_path(path, with_paths=True)(document),
+            expression)
+        self.assertEqual(
+            [value for p, value in expected],
+            jsonpath_utils.compile_path(path)(document),
+            expression)
+
+    def test_parity(self):
+        for expression in self.EXPRESSIONS:
+            self._assert_parity(expression, self.DOCUMENT)
+            self._assert_parity(expression, {})
+            self._assert_parity(expression, {'payload': 'payload'})
+
+    def test_compiled(self):
+        for expression in self.EXPRESSIONS[:-3]:
+            self.assertTrue(
+                jsonpath_utils.is_compiled(PARSER.parse(expression)),
+                expression)
+        for expression in self.EXPRESSIONS[-3:]:
+            self.assertFalse(
+                jsonpath_utils.is_compiled(PARSER.parse(expression)),
+                expression)
+
+    def test_compile_plan(self):
+        paths = dict((expression, PARSER.parse(expression))
+                     for expression in self.EXPRESSIONS)
+        plan = jsonpath_utils.compile_plan(paths)
+        for document in (self.DOCUMENT, {}, {'payload': 'payload'}):
+            expected = {}
+            for expression, path in paths.items():
+                values = [value for p, value in reference_find(path,
+                                                               document)]
+                if values:
+                    expected[expression] = values
+            self.assertEqual(expected, plan(document))
+
+    def test_root_not_at_start_not_compiled(self):
+        self.assertFalse(
+            jsonpath_utils.is_compiled(PARSER.parse('payload.$')))
+
+    def test_index_errors_as_jsonpath_rw(self):
+        # NOTE: jsonpath-rw does not catch the errors of index lookups
+        path = PARSER.parse('payload.hosts[0]')
+        getter = jsonpath_utils.compile_path(path)
+        for document, exc in (({'payload': {'hosts': 1}}, TypeError),
+                              ({'payload': {'hosts': {'a': 1}}}, KeyError)):
+            self.assertRaises(exc, path.find, document)
+            self.assertRaises(exc, getter, document)
+
+
+class TestShippedDefinitionsParity(base.BaseTestCase):
+    """Run both engines over the paths of the shipped definitions."""
+
+    @staticmethod
+    def _alternatives(fields):
+        if isinstance(fields, six.string_types):
+            fields = [fields]
+        return [f.strip('()') for field in fields for f in field.split('|')]
+
+    def _event_fields(self):
+        with open(self.path_get('etc/ceilometer/event_definitions.yaml')) as f:
+            definitions = yaml.safe_load(f)
+        fields = [['publisher_id'], ['_context_request_id'],
+                  ['payload.tenant_id', '_context_tenant'],
+                  ['payload.user_id', '_context_user_id']]
+        for definition in definitions:
+            for trait in definition['traits'].values():
+                fields.append(trait['fields'])
+        return fields
+
+    def _meter_fields(self):
+        with open(self.path_get('ceilometer/meter/data/meters.yaml')) as f:
+            definitions = yaml.safe_load(f)
+        fields = []
+        for definition in definitions['metric']:
+            for name, field in definition.items():
+                if name in ('event_type', 'lookup'):
+                    continue
+                if name == 'metadata':
+                    fields.extend(field.values())
+                elif isinstance(field, six.string_types):
+                    fields.append(field)
+        return fields
+
+    def _expression(self, fields):
+        if isinstance(fields, six.string_types):
+            return fields
+        if len(fields) == 1:
+            return fields[0]
+        return '|'.join('(%s)' % path for path in fields)
+
+    def _documents(self, all_fields):
+        full = {}
+        for fields in all_fields:
+            for i, field in enumerate(self._alternatives(fields)):
+                if field.startswith('$.'):
+                    field = field[2:]
+                if re.match(r'^[\w."\[\]]+$', field):
+                    set_path(full, field, '%s-%d' % (field, i))
+        # drop one alternative out of two and blank some others
+        partial = copy.deepcopy(full)
+        payload = partial.get('payload', {})
+        for i, key in enumerate(sorted(payload)):
+            if i % 2:
+                del payload[key]
+            elif i % 3:
+                payload[key] = None
+        partial.pop('_context_tenant', None)
+        return [full, partial, {}, {'payload': 'payload'},
+                {'payload': {'initiator': 'initiator', 'target': []}}]
+
+    def _assert_parity(self, all_fields):
+        documents = self._documents(all_fields)
+        compiled = 0
+        for fields in all_fields:
+            expression = self._expression(fields)
+            path = PARSER.parse(expression)
+            if jsonpath_utils.is_compiled(path):
+                compiled += 1
+            getter = jsonpath_utils.compile_path(path, with_paths=True)
+            for document in documents:
+                self.assertEqual(reference_find(path, document),
+                                 getter(document), expression)
+        paths = dict((i, PARSER.parse(self._expression(fields)))
+                     for i, fields in enumerate(all_fields))
+        plan = jsonpath_utils.compile_plan(paths)
+        for document in documents:
+            found = plan(document)
+            for i, path in paths.items():
+                self.assertEqual(
+                    [value for p, value in reference_find(path, document)],
+                    found.get(i, []), self._expression(all_fields[i]))
+        return compiled
+
+    def test_event_definitions(self):
+        all_fields = self._event_fields()
+        compiled = self._assert_parity(all_fields)
+        # NOTE: only the split() paths need jsonpath-rw
+        self.assertEqual(len([f for f in all_fields
+                              if '`' not in self._expression(f)]),
+                         compiled)
+
+    def test_meter_definitions(self):
+        all_fields = self._meter_fields()
+        compiled = self._assert_parity(all_fields)
+        self.assertGreater(compiled, len(all_fields) // 2)
@@ -12,9 +12,13 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import mock
+from oslo_config import cfg
 from oslo_config import fixture as fixture_config
 import oslo_messaging.conffixture
+from oslo_messaging.notify import dispatcher as notify_dispatcher
 from oslotest import base
+import testtools
 
 from ceilometer import messaging
 
@@ -63,3 +67,41 @@ class MessagingTests(base.BaseTestCase):
         self.CONF.set_override('rpc_backend', '')
         self.assertIsNone(messaging.get_transport(optional=True,
                                                   cache=False))
+
+    def test_batch_notification_endpoint(self):
+        endpoint = mock.Mock(spec=['info', 'error', 'filter_rule',
+                                   'process_notifications'])
+        batch_endpoint = messaging.BatchNotificationEndpoint(endpoint)
+        self.assertIs(endpoint.filter_rule, batch_endpoint.filter_rule)
+        self.assertFalse(hasattr(batch_endpoint, 'sample'))
+        batch_endpoint.info(['notification1', 'notification2'])
+        endpoint.process_notifications.assert_called_once_with(
+            'info', ['notification1', 'notification2'])
+        self.assertFalse(endpoint.info.called)
+
+    def test_batch_notification_endpoint_no_filter(self):
+        endpoint = mock.Mock(spec=['sample', 'process_notifications'])
+        batch_endpoint = messaging.BatchNotificationEndpoint(endpoint)
+        self.assertFalse(hasattr(batch_endpoint, 'filter_rule'))
+        self.assertTrue(callable(batch_endpoint.sample))
+
+    @testtools.skipUnless(
+        hasattr(oslo_messaging, 'get_batch_notification_listener'),
+        'oslo.messaging without batch notification listeners')
+    def test_get_batch_notification_listener(self):
+        endpoint = mock.Mock(spec=['info', 'process_notifications'])
+        transport = messaging.get_transport('fake://', cache=False)
+        listener = messaging.get_batch_notification_listener(
+            transport, [oslo_messaging.Target(topic='notifications')],
+            [endpoint], batch_size=10, batch_timeout=5)
+        self.assertIsInstance(listener.dispatcher,
+                              notify_dispatcher.BatchNotificationDispatcher)
+        self.assertIs(endpoint, listener.dispatcher.endpoints[0].endpoint)
+
+    def test_get_batch_notification_listener_unsupported(self):
+        transport = messaging.get_transport('fake://', cache=False)
+        with mock.patch.object(messaging, 'oslo_messaging',
+                               mock.Mock(spec=[])):
+            self.assertRaises(cfg.Error,
+                              messaging.get_batch_notification_listener,
+                              transport, [], [], batch_size=10)
@@ -0,0 +1,190 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/transformer/__init__.py
+"""
+import datetime
+
+import mock
+from oslo_config import fixture as fixture_config
+from oslo_utils import timeutils
+from oslotest import base
+
+from ceilometer import sample
+from ceilometer import transformer
+from ceilometer.transformer import arithmetic
+from ceilometer.transformer import conversions
+
+
+class TestStateStore(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestStateStore, self).setUp()
+        self.CONF = self.useFixture(fixture_config.Config()).conf
+        timeutils.set_time_override(datetime.datetime(2015, 1, 1))
+        self.addCleanup(timeutils.clear_time_override)
+
+    def test_defaults_from_config(self):
+        self.CONF.set_override('state_max_entries', 10, group='transformer')
+        self.CONF.set_override('state_ttl', 20, group='transformer')
+        store = transformer.StateStore()
+        self.assertEqual(10, store.maxsize)
+        self.assertEqual(20, store.ttl)
+
+    def test_lru_eviction(self):
+        store = transformer.StateStore(maxsize=2, ttl=0)
+        store['a'] = 1
+        store['b'] = 2
+        store['a'] = 3
+        store['c'] = 4
+        self.assertNotIn('b', store)
+        self.assertEqual(3, store['a'])
+        self.assertEqual(4, store.get('c'))
+        self.assertIsNone(store.get('b'))
+        self.assertRaises(KeyError, lambda: store['b'])
+        self.assertEqual(1, store.evictions)
+
+    def test_ttl_expiry(self):
+        store = transformer.StateStore(maxsize=0, ttl=60)
+        store['a'] = 1
+        timeutils.advance_time_seconds(30)
+        store['b'] = 2
+        timeutils.advance_time_seconds(31)
+        self.assertIsNone(store.get('a'))
+        self.assertEqual(2, store.get('b'))
+
+        store['a'] = 3
+        timeutils.advance_time_seconds(45)
+        store['c'] = 4
+        # b is expired and dropped by the update of c
+        self.assertEqual(['a', 'c'], store.keys())
+        timeutils.advance_time_seconds(61)
+        self.assertEqual(2, store.expire())
+        self.assertEqual(0, len(store))
+        self.assertEqual(4, store.expirations)
+
+    def test_pop_and_clear(self):
+        store = transformer.StateStore(maxsize=0, ttl=0)
+        store['a'] = 1
+        store['b'] = 2
+        self.assertEqual(1, store.pop('a'))
+        self.assertIsNone(store.pop('a'))
+        store.clear()
+        self.assertEqual(0, len(store))
+
+    def test_stats(self):
+        store = transformer.StateStore(maxsize=1, ttl=10)
+        empty = store.stats()['bytes']
+        store['a'] = (1, 'x' * 1000)
+        store['b'] = (1, 'y' * 1000)
+        stats = store.stats()
+        self.assertGreater(stats.pop('bytes'), empty + 1000)
+        self.assertEqual({'entries': 1, 'maxsize': 1, 'ttl': 10,
+                          'evictions': 1, 'expirations': 0}, stats)
+
+    def test_pack_sample(self):
+        s = sample.Sample(name='cpu', type=sample.TYPE_CUMULATIVE, unit='ns',
+                          volume=1, user_id='user', project_id='project',
+                          resource_id='resource', timestamp='2015-01-01',
+                          resource_metadata={'name': 'vm'}, source='source')
+        packed = transformer.pack_sample(s)
+        self.assertIsInstance(packed, tuple)
+        self.assertEqual(s.as_dict(), transformer.unpack_sample(packed)
+                         .as_dict())
+
+
+class TestStatefulTransformers(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestStatefulTransformers, self).setUp()
+        self.CONF = self.useFixture(fixture_config.Config()).conf
+        self.CONF.set_override('state_max_entries', 2, group='transformer')
+        timeutils.set_time_override(datetime.datetime(2015, 1, 1))
+        self.addCleanup(timeutils.clear_time_override)
+
+    @staticmethod
+    def _sample(name, resource_id, volume, timestamp='2015-01-01T00:00:00'):
+        return sample.Sample(name=name, type=sample.TYPE_CUMULATIVE,
+                             unit='ns', volume=volume, user_id='user',
+                             project_id='project', resource_id=resource_id,
+                             timestamp=timestamp, resource_metadata={})
+
+    def test_delta_state_bounded(self):
+        t = conversions.DeltaTransformer()
+        for i in range(10):
+            t.handle_sample(None, self._sample('cpu', 'r-%d' % i, i))
+        self.assertEqual(2, len(t.cache))
+        self.assertEqual(8, t.cache.evictions)
+        delta = t.handle_sample(None, self._sample(
+            'cpu', 'r-9', 12, '2015-01-01T00:01:00'))
+        self.assertEqual(3, delta.volume)
+
+    def test_arithmetic_state_expires(self):
+        self.CONF.set_override('state_ttl', 600, group='transformer')
+        t = arithmetic.ArithmeticTransformer(
+            target={'name': 'ratio', 'expr': '$(a) / $(b)'})
+        t.handle_sample(None, self._sample('a', 'r-1', 1))
+        timeutils.advance_time_seconds(601)
+        t.handle_sample(None, self._sample('b', 'r-1', 2))
+        self.assertEqual([], t.flush(None))
+        t.handle_sample(None, self._sample('a', 'r-1', 3))
+        ratio = t.flush(None)
+        self.assertEqual(1, len(ratio))
+        self.assertEqual(1.5, ratio[0].volume)
+        self.assertEqual(0, len(t.cache))
+
+    def test_arithmetic_not_compact(self):
+        self.CONF.set_override('compact_state', False, group='transformer')
+        t = arithmetic.ArithmeticTransformer(
+            target={'name': 'ratio', 'expr': '$(a) / $(b)'})
+        t.handle_sample(None, self._sample('a', 'r-1', 1))
+        self.assertIsInstance(t.cache['r-1']['a'], sample.Sample)
+        t.handle_sample(None, self._sample('b', 'r-1', 4))
+        self.assertEqual(0.25, t.flush(None)[0].volume)
+
+
+class TestHandleSamples(base.BaseTestCase):
+
+    @staticmethod
+    def _samples(count):
+        return [sample.Sample(name='cpu', type=sample.TYPE_CUMULATIVE,
+                              unit='%', volume=i, user_id='user',
+                              project_id='project', resource_id='r',
+                              timestamp='2015-01-01T00:00:%02d' % i,
+                              resource_metadata={})
+                for i in range(count)]
+
+    def test_native_handle_samples(self):
+        for t in (conversions.DeltaTransformer(),
+                  conversions.ScalingTransformer(target={'scale': 10}),
+                  conversions.RateOfChangeTransformer()):
+            with mock.patch.object(t, 'handle_sample') as handle_sample:
+                transformed = t.handle_samples(None, self._samples(3))
+            self.assertEqual(0, handle_sample.call_count)
+            self.assertNotEqual([], transformed)
+
+    def test_subclass_handle_sample_used_for_lists(self):
+        class DoublingTransformer(conversions.ScalingTransformer):
+            def handle_sample(self, context, s):
+                s = super(DoublingTransformer, self).handle_sample(context, s)
+                s.volume *= 2
+                return s
+
+        t = DoublingTransformer(target={'scale': 10})
+        samples = [sample.Sample(name='cpu', type=sample.TYPE_GAUGE,
+                                 unit='%', volume=i, user_id='user',
+                                 project_id='project', resource_id='r',
+                                 timestamp='2015-01-01T00:00:00',
+                                 resource_metadata={})
+                   for i in range(3)]
+        self.assertEqual([0, 20, 40],
+                         [s.volume for s in t.handle_samples(None, samples)])
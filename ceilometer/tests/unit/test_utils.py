@@ -178,3 +178,24 @@ class TestUtils(base.BaseTestCase):
             assignments[k] -= n
         reassigned = len([c for c in assignments if c != 0])
         self.assertTrue(reassigned < num_keys / num_nodes)
+
+    def test_lru_cache(self):
+        cache = utils.LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(1, cache.get('a'))
+        cache['c'] = 3
+        self.assertNotIn('b', cache)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual({'size': 2, 'maxsize': 2, 'hits': 3, 'misses': 1,
+                          'evictions': 1}, cache.stats())
+        cache.clear()
+        self.assertEqual(0, len(cache))
+
+    def test_lru_cache_disabled(self):
+        cache = utils.LRUCache(0)
+        cache['a'] = 1
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(0, len(cache))
@@ -15,9 +15,39 @@
 
 import abc
 import collections
+import sys
 
+from oslo_config import cfg
+from oslo_log import log
+from oslo_utils import timeutils
 import six
 
+from ceilometer.i18n import _LE
+from ceilometer import sample
+
+LOG = log.getLogger(__name__)
+
+OPTS = [
+    cfg.IntOpt('state_max_entries',
+               default=100000,
+               help='Maximum number of entries, usually resources, whose '
+                    'state is kept by each stateful transformer. The least '
+                    'recently updated entries are evicted first. 0 means '
+                    'no limit.'),
+    cfg.IntOpt('state_ttl',
+               default=86400,
+               help='Number of seconds after which the state kept by a '
+                    'stateful transformer for an entry not updated, e.g. '
+                    'of a deleted resource, expires. 0 means no expiry.'),
+    cfg.BoolOpt('compact_state',
+                default=True,
+                help='Keep the samples held by the stateful transformers '
+                     'as tuples rather than as Sample objects, to reduce '
+                     'their memory footprint.'),
+]
+
+cfg.CONF.register_opts(OPTS, group='transformer')
+
 
 @six.add_metaclass(abc.ABCMeta)
 class TransformerBase(object):
@@ -43,6 +73,35 @@ class TransformerBase(object):
         :param sample: A sample.
         """
 
+    def handle_samples(self, context, samples):
+        """Transform a list of samples.
+
+        The default implementation hands the samples to handle_sample one
+        at a time. Transformers can override it to handle the whole list
+        at once.
+
+        A sample which cannot be transformed is logged and dropped, the
+        other samples of the list are still transformed.
+
+        :param context: Passed from the data collector.
+        :param samples: A list of samples.
+        :return: The list of transformed samples, without the dropped ones.
+        """
+        transformed = []
+        for s in samples:
+            try:
+                s = self.handle_sample(context, s)
+            except Exception:
+                self._log_error(s)
+                continue
+            if s:
+                transformed.append(s)
+        return transformed
+
+    def _log_error(self, sample):
+        LOG.exception(_LE('Transformer %(trans)s: dropping sample %(smp)s '
+                          'after error'), {'trans': self, 'smp': sample})
+
     @abc.abstractproperty
     def grouping_keys(self):
         """Keys used to group transformer."""
@@ -78,3 +137,123 @@ class Namespace(object):
     def __nonzero__(self):
         return len(self.__dict__) > 0
     __bool__ = __nonzero__
+
+
+_MISSING = object()
+
+
+class StateStore(object):
+    """Size bounded and expiring state of a stateful transformer.
+
+    Entries not updated for more than ttl seconds expire, and the least
+    recently updated ones are evicted once there are more than maxsize of
+    them. As the entries are kept in update order, both only cost the
+    number of entries removed. A maxsize or a ttl lower than 1 disables
+    the matching limit.
+    """
+
+    def __init__(self, maxsize=None, ttl=None):
+        conf = cfg.CONF.transformer
+        self.maxsize = conf.state_max_entries if maxsize is None else maxsize
+        self.ttl = conf.state_ttl if ttl is None else ttl
+        self.evictions = 0
+        self.expirations = 0
+        # key -> (update time, value)
+        self._data = collections.OrderedDict()
+
+    def _expired(self, updated, now):
+        return self.ttl > 0 and now - updated > self.ttl
+
+    def get(self, key, default=None):
+        try:
+            updated, value = self._data[key]
+        except KeyError:
+            return default
+        if self._expired(updated, timeutils.utcnow_ts()):
+            del self._data[key]
+            self.expirations += 1
+            return default
+        return value
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._data.pop(key, None)
+        self._data[key] = (timeutils.utcnow_ts(), value)
+        while len(self._data) > self.maxsize > 0:
+            self._data.popitem(last=False)
+            self.evictions += 1
+        self.expire()
+
+    def pop(self, key, default=None):
+        updated, value = self._data.pop(key, (None, default))
+        return value
+
+    def expire(self):
+        """Drop the expired entries and return their number."""
+        if self.ttl < 1:
+            return 0
+        now = timeutils.utcnow_ts()
+        count = 0
+        while self._data:
+            key, (updated, value) = next(six.iteritems(self._data))
+            if not self._expired(updated, now):
+                break
+            del self._data[key]
+            count += 1
+        self.expirations += count
+        return count
+
+    def keys(self):
+        return list(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        """Return the counters of the store and its approximate size.
+
+        The size in bytes only accounts for the containers and the objects
+        directly held by the entries, not for the objects shared with the
+        rest of the process.
+        """
+        return {'entries': len(self._data), 'maxsize': self.maxsize,
+                'ttl': self.ttl, 'evictions': self.evictions,
+                'expirations': self.expirations,
+                'bytes': sys.getsizeof(self._data) + sum(
+                    _sizeof(key) + _sizeof(entry)
+                    for key, entry in six.iteritems(self._data))}
+
+
+def _sizeof(value, depth=4):
+    size = sys.getsizeof(value)
+    if depth:
+        if isinstance(value, (tuple, list)):
+            size += sum(_sizeof(v, depth - 1) for v in value)
+        elif isinstance(value, dict):
+            size += sum(_sizeof(k, depth - 1) + _sizeof(v, depth - 1)
+                        for k, v in six.iteritems(value))
+        elif hasattr(value, '__dict__'):
+            size += _sizeof(value.__dict__, depth - 1)
+    return size
+
+
+def pack_sample(s):
+    """Return the compact tuple representation of a sample."""
+    return (s.name, s.type, s.unit, s.volume, s.user_id, s.project_id,
+            s.resource_id, s.timestamp, s.resource_metadata, s.source, s.id)
+
+
+def unpack_sample(packed):
+    """Return the sample of a tuple built by pack_sample."""
+    return sample.Sample(*packed)
@@ -13,11 +13,11 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-import collections
 import keyword
 import math
 import re
 
+from oslo_config import cfg
 from oslo_log import log
 import six
 
@@ -51,7 +51,9 @@ class ArithmeticTransformer(transformer.TransformerBase):
             self.reference_meter = self.required_meters[0]
             # convert to set for more efficient contains operation
             self.required_meters = set(self.required_meters)
-            self.cache = collections.defaultdict(dict)
+            # resource_id -> {escaped meter name: sample}
+            self.cache = transformer.StateStore()
+            self.compact = cfg.CONF.transformer.compact_state
             self.latest_timestamp = None
         else:
             LOG.warn(_('Arithmetic transformer must use at least one'
@@ -62,16 +64,26 @@ class ArithmeticTransformer(transformer.TransformerBase):
         escaped_name = self.escaped_names.get(_sample.name, '')
         if escaped_name not in self.required_meters:
             return
-        self.cache[_sample.resource_id][escaped_name] = _sample
+        samples = self.cache.get(_sample.resource_id)
+        if samples is None:
+            samples = {}
+        samples[escaped_name] = (transformer.pack_sample(_sample)
+                                 if self.compact else _sample)
+        # NOTE: set even when already cached, to refresh its expiry
+        self.cache[_sample.resource_id] = samples
 
     def _check_requirements(self, resource_id):
         """Check if all the required meters are available in the cache."""
-        return len(self.cache[resource_id]) == len(self.required_meters)
+        return len(self.cache.get(resource_id, ())) == len(
+            self.required_meters)
 
     def _calculate(self, resource_id):
         """Evaluate the expression and return a new sample if successful."""
-        ns_dict = dict((m, s.as_dict()) for m, s
-                       in six.iteritems(self.cache[resource_id]))
+        samples = self.cache[resource_id]
+        if self.compact:
+            samples = dict((m, transformer.unpack_sample(s))
+                           for m, s in six.iteritems(samples))
+        ns_dict = dict((m, s.as_dict()) for m, s in six.iteritems(samples))
         ns = transformer.Namespace(ns_dict)
         try:
             new_volume = eval(self.expr_escaped, {}, ns)
@@ -79,7 +91,7 @@ class ArithmeticTransformer(transformer.TransformerBase):
                 raise ArithmeticError(_('Expression evaluated to '
                                         'a NaN value!'))
 
-            reference_sample = self.cache[resource_id][self.reference_meter]
+            reference_sample = samples[self.reference_meter]
             return sample.Sample(
                 name=self.target.get('name', reference_sample.name),
                 unit=self.target.get('unit', reference_sample.unit),
@@ -103,7 +115,7 @@ class ArithmeticTransformer(transformer.TransformerBase):
         new_samples = []
         cache_clean_list = []
         if not self.misconfigured:
-            for resource_id in self.cache:
+            for resource_id in self.cache.keys():
                 if self._check_requirements(resource_id):
                     new_samples.append(self._calculate(resource_id))
                     cache_clean_list.append(resource_id)
@@ -14,6 +14,9 @@
 # under the License.
 
 import collections
+import datetime
+import heapq
+import itertools
 import re
 
 from oslo_log import log
@@ -60,6 +63,16 @@ class BaseConversionTransformer(transformer.TransformerBase):
         return mapped or self.target.get(attr, getattr(s, attr))
 
 
+def _handle_sample_inherited(obj, cls):
+    """Return whether obj handles a sample as cls does.
+
+    The native handle_samples of a transformer only apply when a subclass
+    does not override handle_sample.
+    """
+    return (six.get_unbound_function(type(obj).handle_sample) is
+            six.get_unbound_function(cls.handle_sample))
+
+
 class DeltaTransformer(BaseConversionTransformer):
     """Transformer based on the delta of a sample volume."""
 
@@ -70,10 +83,32 @@ class DeltaTransformer(BaseConversionTransformer):
         """
         super(DeltaTransformer, self).__init__(target=target, **kwargs)
         self.growth_only = growth_only
-        self.cache = {}
+        self.cache = transformer.StateStore()
 
     def handle_sample(self, context, s):
         """Handle a sample, converting if necessary."""
+        s = self._delta(s)
+        if s:
+            LOG.debug('Converted to: %s', s)
+        return s
+
+    def handle_samples(self, context, samples):
+        """Handle a list of samples, converting if necessary."""
+        if not _handle_sample_inherited(self, DeltaTransformer):
+            return super(DeltaTransformer, self).handle_samples(context,
+                                                                samples)
+        transformed = []
+        for s in samples:
+            try:
+                s = self._delta(s)
+            except Exception:
+                self._log_error(s)
+                continue
+            if s:
+                transformed.append(s)
+        return transformed
+
+    def _delta(self, s):
         key = s.name + s.resource_id
         prev = self.cache.get(key)
         timestamp = timeutils.parse_isotime(s.timestamp)
@@ -95,7 +130,6 @@ class DeltaTransformer(BaseConversionTransformer):
                 s = None
             else:
                 s = self._convert(s, volume_delta)
-                LOG.debug('Converted to: %s', s)
         else:
             LOG.warning(_LW('Dropping sample with no predecessor: %s'), (s,))
             s = None
@@ -130,6 +164,7 @@ class ScalingTransformer(BaseConversionTransformer):
         super(ScalingTransformer, self).__init__(source=source, target=target,
                                                  **kwargs)
         self.scale = self.target.get('scale')
+        self._scale_code = None
         LOG.debug('scaling conversion transformer with source:'
                   ' %(source)s target: %(target)s:', {'source': self.source,
                                                       'target': self.target})
@@ -139,11 +174,15 @@ class ScalingTransformer(BaseConversionTransformer):
 
         Either a straight multiplicative factor or else a string to be eval'd.
         """
-        ns = transformer.Namespace(s.as_dict())
-
         scale = self.scale
-        return ((eval(scale, {}, ns) if isinstance(scale, six.string_types)
-                 else s.volume * scale) if scale else s.volume)
+        if not scale:
+            return s.volume
+        if not isinstance(scale, six.string_types):
+            return s.volume * scale
+        # the expression is compiled once, on the first sample
+        if self._scale_code is None:
+            self._scale_code = compile(scale, '<scale>', 'eval')
+        return eval(self._scale_code, {}, transformer.Namespace(s.as_dict()))
 
     def _convert(self, s, growth=1):
         """Transform the appropriate sample fields."""
@@ -167,6 +206,23 @@ class ScalingTransformer(BaseConversionTransformer):
             LOG.debug('converted to: %s', s)
         return s
 
+    def handle_samples(self, context, samples):
+        """Handle a list of samples, converting if necessary."""
+        if not _handle_sample_inherited(self, ScalingTransformer):
+            return super(ScalingTransformer, self).handle_samples(context,
+                                                                  samples)
+        unit = self.source.get('unit')
+        transformed = []
+        for s in samples:
+            if unit is None or unit == s.unit:
+                try:
+                    s = self._convert(s)
+                except Exception:
+                    self._log_error(s)
+                    continue
+            transformed.append(s)
+        return transformed
+
 
 class RateOfChangeTransformer(ScalingTransformer):
     """Transformer based on the rate of change of a sample volume.
@@ -178,12 +234,34 @@ class RateOfChangeTransformer(ScalingTransformer):
     def __init__(self, **kwargs):
         """Initialize transformer with configured parameters."""
         super(RateOfChangeTransformer, self).__init__(**kwargs)
-        self.cache = {}
+        self.cache = transformer.StateStore()
         self.scale = self.scale or '1'
 
     def handle_sample(self, context, s):
         """Handle a sample, converting if necessary."""
         LOG.debug('handling sample %s', s)
+        s = self._rate_of_change(s)
+        if s:
+            LOG.debug('converted to: %s', s)
+        return s
+
+    def handle_samples(self, context, samples):
+        """Handle a list of samples, converting if necessary."""
+        if not _handle_sample_inherited(self, RateOfChangeTransformer):
+            return super(RateOfChangeTransformer, self).handle_samples(
+                context, samples)
+        transformed = []
+        for s in samples:
+            try:
+                s = self._rate_of_change(s)
+            except Exception:
+                self._log_error(s)
+                continue
+            if s:
+                transformed.append(s)
+        return transformed
+
+    def _rate_of_change(self, s):
         key = s.name + s.resource_id
         prev = self.cache.get(key)
         timestamp = timeutils.parse_isotime(s.timestamp)
@@ -211,7 +289,6 @@ class RateOfChangeTransformer(ScalingTransformer):
                               if time_delta else 0.0)
 
             s = self._convert(s, rate_of_change)
-            LOG.debug('converted to: %s', s)
         else:
             LOG.warn(_('dropping sample with no predecessor: %s'),
                      (s,))
@@ -223,7 +300,9 @@ class AggregatorTransformer(ScalingTransformer):
     """Transformer that aggregates samples.
 
     Aggregation goes until a threshold or/and a retention_time, and then
-    flushes them out into the wild.
+    flushes them out into the wild. The threshold is the number of samples
+    aggregated over all the keys, reaching it flushes all of them, while
+    the retention_time is counted for each key from its first sample.
 
     Example:
       To aggregate sample by resource_metadata and keep the
@@ -246,7 +325,10 @@ class AggregatorTransformer(ScalingTransformer):
         self.counts = collections.defaultdict(int)
         self.size = int(size) if size else None
         self.retention_time = float(retention_time) if retention_time else None
-        self.initial_timestamp = None
+        # (start of the aggregation, sequence, key) of the keys aggregated,
+        # the oldest first
+        self.expiry = []
+        self._sequence = itertools.count()
         self.aggregated_samples = 0
 
         self.key_attributes = []
@@ -280,13 +362,15 @@ class AggregatorTransformer(ScalingTransformer):
         return "%s-%s-%s" % (s.name, s.resource_id, non_aggregated_keys)
 
     def handle_sample(self, context, sample_):
-        if not self.initial_timestamp:
-            self.initial_timestamp = timeutils.parse_isotime(sample_.timestamp)
-
         self.aggregated_samples += 1
         key = self._get_unique_key(sample_)
         self.counts[key] += 1
         if key not in self.samples:
+            if self.retention_time:
+                start = timeutils.normalize_time(
+                    timeutils.parse_isotime(sample_.timestamp))
+                heapq.heappush(self.expiry,
+                               (start, next(self._sequence), key))
             self.samples[key] = self._convert(sample_)
             if self.merged_attribute_policy[
                     'resource_metadata'] == 'drop':
@@ -302,23 +386,30 @@ class AggregatorTransformer(ScalingTransformer):
                             getattr(sample_, field))
 
     def flush(self, context):
-        if not self.initial_timestamp:
+        if not self.samples:
+            return []
+
+        if self.aggregated_samples >= self.size:
+            keys = list(self.samples)
+            self.expiry = []
+        elif self.retention_time:
+            # NOTE: every key is aggregated for retention_time from its first
+            # sample, only the expired ones are looked at
+            limit = timeutils.utcnow() - datetime.timedelta(
+                seconds=self.retention_time)
+            keys = []
+            while self.expiry and self.expiry[0][0] < limit:
+                keys.append(heapq.heappop(self.expiry)[2])
+        else:
             return []
 
-        expired = (self.retention_time and
-                   timeutils.is_older_than(self.initial_timestamp,
-                                           self.retention_time))
-        full = self.aggregated_samples >= self.size
-        if full or expired:
-            x = list(self.samples.values())
+        x = []
+        for key in keys:
+            s = self.samples.pop(key)
+            count = self.counts.pop(key)
             # gauge aggregates need to be averages
-            for s in x:
-                if s.type == sample.TYPE_GAUGE:
-                    key = self._get_unique_key(s)
-                    s.volume /= self.counts[key]
-            self.samples.clear()
-            self.counts.clear()
-            self.aggregated_samples = 0
-            self.initial_timestamp = None
-            return x
-        return []
+            if s.type == sample.TYPE_GAUGE:
+                s.volume /= count
+            self.aggregated_samples -= count
+            x.append(s)
+        return x
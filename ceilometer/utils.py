@@ -20,11 +20,13 @@
 
 import bisect
 import calendar
+import collections
 import copy
 import datetime
 import decimal
 import hashlib
 import struct
+import threading
 
 from oslo_concurrency import processutils
 from oslo_config import cfg
@@ -247,6 +249,58 @@ class HashRing(object):
         return self._ring[self._sorted_keys[pos]]
 
 
+class LRUCache(object):
+    """A size bounded mapping discarding the least recently used entries.
+
+    Lookups are counted so that the cache can be sized from its hit ratio.
+    A cache with a maxsize lower than 1 never stores anything.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        if self.maxsize < 1:
+            return
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {'size': len(self._data), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
+
+
 def kill_listeners(listeners):
     # NOTE(gordc): correct usage of oslo.messaging listener is to stop(),
     # which stops new messages, and wait(), which processes remaining
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark of the flush of the aggregator transformer.
+
+Aggregates samples of the given number of keys, whose first samples are
+spread over the retention time, then times the flushes done while the
+keys expire, for various numbers of expired keys.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_aggregator.py --keys 100000 --expired 10 1000 10000
+"""
+import argparse
+import datetime
+import time
+
+from oslo_utils import timeutils
+
+from ceilometer import sample
+from ceilometer.transformer import conversions
+
+
+RETENTION_TIME = 3600
+
+
+def make_samples(keys, start):
+    interval = float(RETENTION_TIME) / keys
+    return [sample.Sample(name='cpu_util', type=sample.TYPE_GAUGE,
+                          unit='%', volume=i % 100, user_id='user',
+                          project_id='project',
+                          resource_id='resource-%d' % i,
+                          timestamp=(start + datetime.timedelta(
+                              seconds=i * interval)).isoformat(),
+                          resource_metadata={})
+            for i in range(keys)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--keys', type=int, default=100000,
+                        help='Number of aggregated keys.')
+    parser.add_argument('--expired', type=int, nargs='+',
+                        default=[10, 1000, 10000],
+                        help='Number of keys expiring at each flush.')
+    args = parser.parse_args()
+
+    start = datetime.datetime(2015, 1, 1)
+    samples = make_samples(args.keys, start)
+    print('%10s %12s %16s %20s' % ('keys', 'expired', 'flush (ms)',
+                                   'us per expired key'))
+    for expired in args.expired:
+        aggregator = conversions.AggregatorTransformer(
+            size=args.keys * 2, retention_time=RETENTION_TIME)
+        timeutils.set_time_override(start)
+        for s in samples:
+            aggregator.handle_sample(None, s)
+
+        # flush once per expired batch of keys, over a whole retention time
+        step = float(RETENTION_TIME) * expired / args.keys
+        timeutils.advance_time_seconds(RETENTION_TIME)
+        flushes = 0
+        flushed = 0
+        elapsed = 0
+        while aggregator.samples:
+            timeutils.advance_time_seconds(step)
+            begin = time.time()
+            flushed += len(aggregator.flush(None))
+            elapsed += time.time() - begin
+            flushes += 1
+        timeutils.clear_time_override()
+        assert flushed == args.keys, flushed
+        print('%10d %12d %16.3f %20.2f' % (
+            args.keys, expired, elapsed * 1000 / flushes,
+            elapsed * 10 ** 6 / flushed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark of the event definition lookup of the event converter.
+
+Looks up the definition of event types derived from an event definitions
+file, with the former linear fnmatch scan, with the definition index and
+with the definition index and its cache.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_event_dispatch.py --definitions \
+    etc/ceilometer/event_definitions.yaml
+"""
+import argparse
+import fnmatch
+import timeit
+
+from stevedore import extension
+import yaml
+
+from ceilometer.event import converter
+
+
+def event_types(events_config):
+    types = set(['unknown.event.start', 'another.unknown.event'])
+    for definition in events_config:
+        event_type = definition['event_type']
+        if not isinstance(event_type, list):
+            event_type = [event_type]
+        for t in event_type:
+            types.add(t.lstrip('!').replace('*', 'sample.start'))
+    return sorted(types)
+
+
+def linear_match(definitions, event_type):
+    for d in definitions:
+        included = any(fnmatch.fnmatch(event_type, t)
+                       for t in d._included_types)
+        if included and not any(fnmatch.fnmatch(event_type, t)
+                                for t in d._excluded_types):
+            return d
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--definitions',
+                        default='etc/ceilometer/event_definitions.yaml',
+                        help='Event definitions file.')
+    parser.add_argument('--number', type=int, default=100,
+                        help='Number of lookups of every event type.')
+    args = parser.parse_args()
+
+    with open(args.definitions) as f:
+        events_config = yaml.safe_load(f)
+    plugin_manager = extension.ExtensionManager(
+        namespace='ceilometer.event.trait_plugin')
+    conv = converter.NotificationEventsConverter(events_config,
+                                                 plugin_manager)
+    types = event_types(events_config)
+    for t in types:
+        assert (linear_match(conv.definitions, t) is
+                conv.find_definition(t)), t
+
+    lookups = [
+        ('linear fnmatch', lambda t: linear_match(conv.definitions, t)),
+        ('index', conv._match_definition),
+        ('index and cache', conv.find_definition),
+    ]
+    print('%d definitions, %d event types' % (len(conv.definitions),
+                                              len(types)))
+    print('%16s %14s' % ('lookup', 'us per lookup'))
+    for name, lookup in lookups:
+        def run():
+            for t in types:
+                lookup(t)
+        elapsed = min(timeit.repeat(run, repeat=3, number=args.number))
+        print('%16s %14.2f' % (name, elapsed * 10 ** 6 /
+                               (args.number * len(types))))
+
+
+if __name__ == '__main__':
+    main()
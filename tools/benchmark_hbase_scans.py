@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark of the concurrent scans of the HBase storage driver.
+
+Records samples of the given number of resources, then times get_samples(),
+get_resources() and get_meters() with their scans split into the given
+numbers of row ranges. The in-memory HBase used by default scans in the
+calling process, only a real HBase shows the effect of the concurrency.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_hbase_scans.py --url hbase://localhost:9090 \
+    --resources 1000 --samples 100 --shards 1 4 16
+"""
+import argparse
+import datetime
+import hashlib
+import time
+
+from oslo_config import cfg
+
+from ceilometer.publisher import utils
+from ceilometer import sample
+from ceilometer import storage
+from ceilometer.storage import impl_hbase
+
+
+START = datetime.datetime(2015, 1, 1)
+
+
+def fill(conn, resources, samples):
+    for n in range(samples):
+        timestamp = START + datetime.timedelta(minutes=10 * n)
+        for i in range(resources):
+            resource_id = hashlib.md5(str(i).encode('utf-8')).hexdigest()
+            s = sample.Sample(name='cpu_util', type=sample.TYPE_GAUGE,
+                              unit='%', volume=(n + i) % 100,
+                              user_id='user-%d' % (i % 10),
+                              project_id='project', resource_id=resource_id,
+                              timestamp=timestamp.isoformat(),
+                              resource_metadata={})
+            data = utils.meter_message_from_counter(
+                s, cfg.CONF.publisher.telemetry_secret)
+            # as done by the database dispatcher
+            data['timestamp'] = timestamp
+            conn.record_metering_data(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='hbase://__test__',
+                        help='HBase URL, an in-memory HBase by default.')
+    parser.add_argument('--resources', type=int, default=100,
+                        help='Number of resources.')
+    parser.add_argument('--samples', type=int, default=100,
+                        help='Number of samples per resource, ten minutes '
+                             'apart.')
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 4, 16],
+                        help='Numbers of row ranges the scans are split '
+                             'into.')
+    args = parser.parse_args()
+
+    conn = impl_hbase.Connection(args.url)
+    conn.clear()
+    conn.upgrade()
+    start = time.time()
+    fill(conn, args.resources, args.samples)
+    print('%d samples recorded in %.1f s' % (
+        args.resources * args.samples, time.time() - start))
+
+    sample_filter = storage.SampleFilter(
+        meter='cpu_util', start_timestamp=START,
+        end_timestamp=START + datetime.timedelta(minutes=10 * args.samples))
+    queries = (
+        ('samples', lambda: conn.get_samples(sample_filter)),
+        ('samples, limit 100', lambda: conn.get_samples(sample_filter,
+                                                        limit=100)),
+        ('resources', lambda: conn.get_resources()),
+        ('meters', lambda: conn.get_meters()),
+    )
+    print('%20s %10s %10s %10s' % ('', 'shards', 'results', 'time (s)'))
+    for name, query in queries:
+        for shards in args.shards:
+            conn._scan_shards = shards
+            start = time.time()
+            count = len(list(query()))
+            print('%20s %10d %10d %10.2f' % (name, shards, count,
+                                             time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark of the statistics of the HBase storage driver.
+
+Records samples of the given number of resources, then times a few
+get_meter_statistics() queries, along with the number of rows scanned and
+of bytes fetched from the meter table. The in-memory HBase used by default
+returns whole rows, the effect of the column pruning only shows against a
+real HBase.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_hbase_statistics.py --url hbase://localhost:9090 \
+    --resources 100 --samples 1000
+"""
+import argparse
+import datetime
+import time
+
+from oslo_config import cfg
+
+from ceilometer.api.controllers.v2 import meters
+from ceilometer.publisher import utils
+from ceilometer import sample
+from ceilometer import storage
+from ceilometer.storage import impl_hbase
+
+
+QUERIES = (
+    ('all', {}),
+    ('hourly', {'period': 3600}),
+    ('by resource', {'groupby': ['resource_id']}),
+    ('hourly by user', {'period': 3600, 'groupby': ['user_id']}),
+    ('stddev, cardinality', {'aggregate': [
+        meters.Aggregate(func='stddev'),
+        meters.Aggregate(func='cardinality', param='resource_id')]}),
+)
+
+
+def fill(conn, resources, samples):
+    start = datetime.datetime(2015, 1, 1)
+    metadata = {'display_name': 'instance', 'host': 'compute',
+                'image_ref_url': 'http://glance/images/image',
+                'properties': dict(('key-%d' % i, 'value' * 10)
+                                   for i in range(10))}
+    for n in range(samples):
+        timestamp = start + datetime.timedelta(minutes=n)
+        for i in range(resources):
+            s = sample.Sample(name='cpu_util', type=sample.TYPE_GAUGE,
+                              unit='%', volume=(n + i) % 100,
+                              user_id='user-%d' % (i % 10),
+                              project_id='project', resource_id='resource-%d'
+                              % i, timestamp=timestamp.isoformat(),
+                              resource_metadata=metadata)
+            data = utils.meter_message_from_counter(
+                s, cfg.CONF.publisher.telemetry_secret)
+            # as done by the database dispatcher
+            data['timestamp'] = timestamp
+            conn.record_metering_data(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='hbase://__test__',
+                        help='HBase URL, an in-memory HBase by default.')
+    parser.add_argument('--resources', type=int, default=100,
+                        help='Number of resources.')
+    parser.add_argument('--samples', type=int, default=100,
+                        help='Number of samples per resource.')
+    args = parser.parse_args()
+
+    conn = impl_hbase.Connection(args.url)
+    conn.clear()
+    conn.upgrade()
+    start = time.time()
+    fill(conn, args.resources, args.samples)
+    print('%d samples recorded in %.1f s' % (
+        args.resources * args.samples, time.time() - start))
+
+    scanned = {'rows': 0, 'bytes': 0}
+    with conn.conn_pool.connection() as hbase:
+        table = hbase.table(conn.METER_TABLE)
+        table_class = type(table)
+    scan = table_class.scan
+
+    def counting_scan(self, *args, **kwargs):
+        for row, data in scan(self, *args, **kwargs):
+            scanned['rows'] += 1
+            scanned['bytes'] += sum(len(k) + len(v) for k, v in data.items())
+            yield row, data
+    table_class.scan = counting_scan
+
+    print('%20s %10s %10s %12s %10s' % ('', 'results', 'rows', 'bytes',
+                                        'time (s)'))
+    sample_filter = storage.SampleFilter(meter='cpu_util')
+    for name, kwargs in QUERIES:
+        scanned.update(rows=0, bytes=0)
+        start = time.time()
+        count = len(list(conn.get_meter_statistics(sample_filter, **kwargs)))
+        print('%20s %10d %10d %12d %10.2f' % (name, count, scanned['rows'],
+                                              scanned['bytes'],
+                                              time.time() - start))
+    table_class.scan = scan
+
+
+if __name__ == '__main__':
+    main()
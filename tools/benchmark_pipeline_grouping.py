@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark of the grouping hash routing datapoints to pipeline queues.
+
+Compares the stable grouping hash with the former builtin hash() of the
+concatenated key values, and shows how evenly each spreads the datapoints
+over the pipeline processing queues.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_pipeline_grouping.py --datapoints 100000 --queues 10
+"""
+import argparse
+import timeit
+
+from ceilometer import pipeline
+
+
+def legacy_hash_grouping(datapoint, grouping_keys):
+    value = ''
+    for key in grouping_keys or []:
+        value += datapoint.get(key) if datapoint.get(key) else ''
+    return hash(value)
+
+
+def make_datapoints(count):
+    return [{'resource_id': 'b8c6a4e2-%012d' % i,
+             'project_id': 'project-%d' % (i % 50),
+             'counter_name': 'cpu'}
+            for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--datapoints', type=int, default=100000,
+                        help='Number of datapoints to route.')
+    parser.add_argument('--queues', type=int, default=10,
+                        help='Number of pipeline processing queues.')
+    parser.add_argument('--keys', nargs='+',
+                        default=['resource_id', 'project_id'],
+                        help='Grouping keys.')
+    args = parser.parse_args()
+
+    datapoints = make_datapoints(args.datapoints)
+    keys = tuple(args.keys)
+    print('%8s %16s %14s %14s' % ('hash', 'us per datapoint',
+                                  'fullest queue', 'emptiest queue'))
+    for name, hash_grouping in (
+            ('builtin', legacy_hash_grouping),
+            ('stable',
+             pipeline.SamplePipelineTransportManager.hash_grouping)):
+        def run():
+            for d in datapoints:
+                hash_grouping(d, keys)
+        elapsed = min(timeit.repeat(run, repeat=3, number=1))
+        loads = [0] * args.queues
+        for d in datapoints:
+            loads[hash_grouping(d, keys) % args.queues] += 1
+        print('%8s %16.2f %14d %14d' % (name,
+                                        elapsed * 10 ** 6 / len(datapoints),
+                                        max(loads), min(loads)))
+
+
+if __name__ == '__main__':
+    main()
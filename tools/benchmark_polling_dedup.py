@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark of the resource filtering done by a polling cycle.
+
+Times PollingTask.poll_and_notify with a discovery returning the given
+number of neutron-like resources, part of them duplicated and part of
+them blacklisted, and compares it with the former list based filtering.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_polling_dedup.py --resources 10000 50000 100000
+"""
+import argparse
+import time
+
+from ceilometer.agent import manager
+from ceilometer.agent import plugin_base
+
+
+class FakeDiscovery(plugin_base.DiscoveryBase):
+    def __init__(self, resources):
+        self.resources = resources
+
+    def discover(self, manager, param=None):
+        return self.resources
+
+    @staticmethod
+    def resource_identity(resource):
+        return resource['id']
+
+
+class FakeManager(object):
+    def __init__(self, discovery):
+        self.discovery = discovery
+
+    def discover(self, discovery=None, discovery_cache=None, identities=None):
+        resources = self.discovery.discover(self)
+        if identities is not None:
+            for resource in resources:
+                identities[id(resource)] = (
+                    self.discovery.resource_identity(resource))
+        return resources
+
+
+class FakePollster(plugin_base.PollsterBase):
+    @property
+    def default_discovery(self):
+        return 'fake'
+
+    def get_samples(self, manager, cache, resources):
+        return []
+
+
+class FakeExtension(object):
+    def __init__(self, name, obj):
+        self.name = name
+        self.obj = obj
+
+
+class FakeSource(object):
+    name = 'benchmark'
+    resources = []
+    discovery = ['fake']
+
+
+def make_resources(count):
+    # one resource out of ten is reported twice
+    resources = [{'id': 'resource-%d' % i, 'status': 'ACTIVE',
+                  'tenant_id': 'tenant-%d' % (i % 100)}
+                 for i in range(count)]
+    return resources + resources[::10]
+
+
+def legacy_filter(candidate_res, black_res):
+    polling_resources = []
+    history = []
+    for x in candidate_res:
+        if x not in history:
+            history.append(x)
+            if x not in black_res:
+                polling_resources.append(x)
+    return polling_resources
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--resources', type=int, nargs='+',
+                        default=[10000, 50000, 100000],
+                        help='Number of discovered resources.')
+    parser.add_argument('--legacy-max', type=int, default=10000,
+                        help='Largest number of resources to time with the '
+                             'former quadratic filtering.')
+    args = parser.parse_args()
+
+    print('%10s %12s %12s' % ('resources', 'sets (s)', 'lists (s)'))
+    for count in args.resources:
+        resources = make_resources(count)
+        blacklist = resources[:count // 100]
+        discovery = FakeDiscovery(resources)
+        task = manager.PollingTask(FakeManager(discovery))
+        task.add(FakeExtension('benchmark', FakePollster()), FakeSource())
+        key = manager.Resources.key(FakeSource.name,
+                                    FakeExtension('benchmark', None))
+        task.resources[key].blacklist.update(
+            discovery.resource_identity(r) for r in blacklist)
+
+        start = time.time()
+        task.poll_and_notify()
+        elapsed = time.time() - start
+
+        legacy = '-'
+        if count <= args.legacy_max:
+            start = time.time()
+            legacy_filter(resources, blacklist)
+            legacy = '%.3f' % (time.time() - start)
+        print('%10d %12.3f %12s' % (count, elapsed, legacy))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark of the queue policy of the messaging publishers.
+
+Publishes batches of samples while the messaging bus is down, then once it
+is back, with the in-memory local queue and with the on-disk spool, and
+reports the throughput of both phases.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_publisher_queue.py --batches 10000 --samples 10
+"""
+import argparse
+import datetime
+import logging
+import shutil
+import tempfile
+import time
+
+from oslo_context import context
+
+from ceilometer.publisher import messaging
+from ceilometer import sample
+
+
+class FakePublisher(messaging.MessagingPublisher):
+    bus_down = False
+
+    def _send(self, context, topic, meters):
+        if self.bus_down:
+            raise messaging.DeliveryFailure()
+
+
+def make_samples(count):
+    return [sample.Sample(name='cpu', type=sample.TYPE_CUMULATIVE,
+                          unit='ns', volume=i, user_id='user',
+                          project_id='project', resource_id='resource-%d' % i,
+                          timestamp=datetime.datetime.utcnow().isoformat(),
+                          resource_metadata={'name': 'instance-%d' % i,
+                                             'flavor': 'm1.tiny'})
+            for i in range(count)]
+
+
+def run(publisher, batches, samples):
+    ctxt = context.RequestContext('admin', 'admin', is_admin=True)
+    publisher.bus_down = True
+    start = time.time()
+    for i in range(batches):
+        publisher.publish_samples(ctxt, samples)
+    outage = time.time() - start
+    publisher.bus_down = False
+    start = time.time()
+    publisher.flush()
+    recovery = time.time() - start
+    return outage, recovery
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batches', type=int, default=10000,
+                        help='Number of batches published during the outage.')
+    parser.add_argument('--samples', type=int, default=10,
+                        help='Number of samples per batch.')
+    args = parser.parse_args()
+
+    # one warning per failed publication would be timed otherwise
+    logging.disable(logging.WARNING)
+    samples = make_samples(args.samples)
+    spool_dir = tempfile.mkdtemp()
+    try:
+        print('%8s %20s %20s' % ('queue', 'outage (batches/s)',
+                                 'replay (batches/s)'))
+        for name, url in (
+                ('list', 'fake://?policy=queue&max_queue_length=%d'
+                 % args.batches),
+                ('spool', 'fake://?policy=queue&spool_dir=%s&'
+                 'max_spool_size=0' % spool_dir)):
+            publisher = FakePublisher(messaging.urlparse.urlsplit(url))
+            outage, recovery = run(publisher, args.batches, samples)
+            print('%8s %20d %20d' % (name, args.batches / outage,
+                                     args.batches / recovery))
+    finally:
+        shutil.rmtree(spool_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Micro-benchmark of the message signature versions.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_signature.py --metadata-keys 10 50 200
+"""
+import argparse
+import timeit
+
+from ceilometer.publisher import utils
+from ceilometer import sample
+
+
+def make_message(metadata_keys):
+    metadata = dict(('key-%d' % i, {'value': 'value-%d' % i,
+                                    'list': ['a', 'b', i],
+                                    'float': i / 3.0})
+                    for i in range(metadata_keys))
+    s = sample.Sample(name='cpu', type=sample.TYPE_CUMULATIVE, unit='ns',
+                      volume=123456789, user_id='user', project_id='project',
+                      resource_id='resource',
+                      timestamp='2015-07-02T10:39:00.000000',
+                      resource_metadata=metadata, source='benchmark')
+    return utils.meter_message_from_counter(s, '')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--metadata-keys', type=int, nargs='+',
+                        default=[0, 10, 50, 200],
+                        help='Number of resource metadata entries.')
+    parser.add_argument('--number', type=int, default=2000,
+                        help='Number of sign and verify rounds.')
+    args = parser.parse_args()
+
+    secret = 'benchmark-secret'
+    print('%8s %12s %12s %8s' % ('metadata', 'v1 (us)', 'v2 (us)', 'speedup'))
+    for keys in args.metadata_keys:
+        msg = make_message(keys)
+        results = []
+        for version in (1, 2):
+            def sign_and_verify():
+                msg['message_signature'] = utils.compute_signature(
+                    msg, secret, version)
+                assert utils.verify_signature(msg, secret)
+            elapsed = min(timeit.repeat(sign_and_verify, repeat=3,
+                                        number=args.number))
+            results.append(elapsed * 10 ** 6 / args.number)
+        print('%8d %12.1f %12.1f %7.1fx' % (keys, results[0], results[1],
+                                            results[0] / results[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark of the event recording of the SQL storage driver.
+
+Records batches of events with traits of every type, at once and one event
+at a time as done before, and reports the time and SQL statements taken
+per event.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_sql_events.py --url mysql+pymysql://root@localhost/db \
+    --events 10000 --batch 100
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+from oslo_config import cfg
+import sqlalchemy as sa
+
+from ceilometer.event.storage import impl_sqlalchemy
+from ceilometer.event.storage import models
+
+
+def make_events(count, start):
+    now = datetime.datetime(2015, 1, 1)
+    return [models.Event(
+        'message-%d' % i, 'compute.instance.update', now,
+        [models.Trait('tenant_id', models.Trait.TEXT_TYPE, 'project'),
+         models.Trait('instance_id', models.Trait.TEXT_TYPE, 'resource-%d' %
+                      (i % 100)),
+         models.Trait('memory_mb', models.Trait.INT_TYPE, 512),
+         models.Trait('vcpus', models.Trait.INT_TYPE, 1),
+         models.Trait('progress', models.Trait.FLOAT_TYPE, 0.5),
+         models.Trait('launched_at', models.Trait.DATETIME_TYPE, now)],
+        {'payload': 'x' * 1000})
+        for i in range(start, start + count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url',
+                        help='Database URL, a temporary sqlite database '
+                             'by default.')
+    parser.add_argument('--events', type=int, default=10000,
+                        help='Number of events recorded by each method.')
+    parser.add_argument('--batch', type=int, default=100,
+                        help='Number of events per batch.')
+    args = parser.parse_args()
+
+    path = None
+    url = args.url
+    if not url:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        url = 'sqlite:///%s' % path
+        # the temporary database does not need to survive a crash
+        cfg.CONF.set_override('sqlite_synchronous', False, group='database')
+    try:
+        conn = impl_sqlalchemy.Connection(url)
+        conn.upgrade()
+        conn.clear()
+
+        queries = []
+        sa.event.listen(conn._engine_facade.get_engine(),
+                        'before_cursor_execute',
+                        lambda *args: queries.append(1))
+        print('%12s %10s %16s %18s' % ('', 'events', 'us per event',
+                                       'queries per event'))
+        start = 0
+        for name, record in (('batch', conn.record_events),
+                             ('one by one', conn._record_events_one_by_one)):
+            del queries[:]
+            elapsed = 0
+            for n in range(0, args.events, args.batch):
+                events = make_events(min(args.batch, args.events - n),
+                                     start + n)
+                begin = time.time()
+                record(events)
+                elapsed += time.time() - begin
+            start += args.events
+            print('%12s %10d %16.1f %18.2f' % (
+                name, args.events, elapsed * 10 ** 6 / args.events,
+                float(len(queries)) / args.events))
+    finally:
+        if path:
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
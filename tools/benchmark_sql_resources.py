@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark of the resource listing of the SQL storage driver.
+
+Fills a database with the given number of resources and of samples per
+resource, then times get_resources() and counts its SQL queries, along
+with the former implementation running one query per resource.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_sql_resources.py --url mysql+pymysql://root@localhost/bench \
+    --resources 10000 --samples 100
+"""
+import argparse
+import datetime
+import hashlib
+import os
+import tempfile
+import time
+
+from oslo_config import cfg
+from oslo_serialization import jsonutils
+import sqlalchemy as sa
+from sqlalchemy import distinct
+from sqlalchemy import func
+
+from ceilometer import storage
+from ceilometer.storage import impl_sqlalchemy
+from ceilometer.storage import models as api_models
+from ceilometer.storage.sqlalchemy import models
+
+
+def fill(conn, resources, samples):
+    engine = conn._engine_facade.get_engine()
+    engine.execute(models.Meter.__table__.insert(),
+                   [{'id': 1, 'name': 'cpu', 'type': 'cumulative',
+                     'unit': 'ns'}])
+    rows = []
+    for i in range(resources):
+        metadata = {'display_name': 'instance-%d' % i, 'sequence': i}
+        rows.append({
+            'internal_id': i + 1, 'user_id': 'user-%d' % (i % 100),
+            'project_id': 'project-%d' % (i % 10), 'source_id': 'openstack',
+            'resource_id': 'resource-%d' % i,
+            'resource_metadata': metadata,
+            'metadata_hash': hashlib.md5(
+                jsonutils.dumps(metadata, sort_keys=True).encode(
+                    'utf-8')).hexdigest()})
+    engine.execute(models.Resource.__table__.insert(), rows)
+
+    start = datetime.datetime(2015, 1, 1)
+    rows = []
+    for n in range(samples):
+        for i in range(resources):
+            # samples of a polling cycle are a few milliseconds apart
+            timestamp = start + datetime.timedelta(minutes=10 * n,
+                                                   milliseconds=i)
+            rows.append({'meter_id': 1, 'resource_id': i + 1,
+                         'volume': n, 'timestamp': timestamp,
+                         'recorded_at': timestamp,
+                         'message_signature': '',
+                         'message_id': '%d-%d' % (i, n)})
+            if len(rows) == 10000:
+                engine.execute(models.Sample.__table__.insert(), rows)
+                rows = []
+    if rows:
+        engine.execute(models.Sample.__table__.insert(), rows)
+
+
+def legacy_get_resources(conn, limit=None):
+    """The former implementation, with two queries per resource."""
+    s_filter = storage.SampleFilter()
+    session = conn._engine_facade.get_session()
+    res_q = session.query(distinct(models.Resource.resource_id)).join(
+        models.Sample,
+        models.Sample.resource_id == models.Resource.internal_id)
+    res_q = impl_sqlalchemy.make_query_from_filter(session, res_q, s_filter,
+                                                   require_meter=False)
+    res_q = res_q.limit(limit) if limit else res_q
+    for res_id in res_q.all():
+        min_max_q = (session.query(func.max(models.Sample.timestamp)
+                                   .label('max_timestamp'),
+                                   func.min(models.Sample.timestamp)
+                                   .label('min_timestamp'))
+                     .join(models.Resource,
+                           models.Resource.internal_id ==
+                           models.Sample.resource_id)
+                     .filter(models.Resource.resource_id == res_id[0]))
+        min_max = min_max_q.first()
+        res = (session.query(models.Resource.resource_id,
+                             models.Resource.user_id,
+                             models.Resource.project_id,
+                             models.Resource.source_id,
+                             models.Resource.resource_metadata)
+               .join(models.Sample,
+                     models.Sample.resource_id ==
+                     models.Resource.internal_id)
+               .filter(models.Sample.timestamp == min_max.max_timestamp)
+               .filter(models.Resource.resource_id == res_id[0])
+               .order_by(models.Sample.id.desc()).limit(1)).first()
+        yield api_models.Resource(
+            resource_id=res.resource_id,
+            project_id=res.project_id,
+            first_sample_timestamp=min_max.min_timestamp,
+            last_sample_timestamp=min_max.max_timestamp,
+            source=res.source_id,
+            user_id=res.user_id,
+            metadata=res.resource_metadata)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url',
+                        help='Database URL, a temporary sqlite database '
+                             'by default.')
+    parser.add_argument('--resources', type=int, default=10000,
+                        help='Number of resources.')
+    parser.add_argument('--samples', type=int, default=100,
+                        help='Number of samples per resource.')
+    parser.add_argument('--legacy-limit', type=int, default=1000,
+                        help='Number of resources listed with the former '
+                             'implementation, 0 for all of them.')
+    args = parser.parse_args()
+
+    path = None
+    url = args.url
+    if not url:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        url = 'sqlite:///%s' % path
+        # the temporary database does not need to survive a crash
+        cfg.CONF.set_override('sqlite_synchronous', False, group='database')
+    try:
+        conn = impl_sqlalchemy.Connection(url)
+        conn.upgrade()
+        conn.clear()
+        start = time.time()
+        fill(conn, args.resources, args.samples)
+        print('%d resources and %d samples loaded in %.1f s' % (
+            args.resources, args.resources * args.samples,
+            time.time() - start))
+
+        queries = []
+        sa.event.listen(conn._engine_facade.get_engine(),
+                        'before_cursor_execute',
+                        lambda *args: queries.append(1))
+        print('%12s %10s %10s %10s' % ('', 'resources', 'queries',
+                                       'time (s)'))
+        for name, get_resources in (
+                ('grouped', lambda: conn.get_resources()),
+                ('legacy', lambda: legacy_get_resources(
+                    conn, args.legacy_limit or None))):
+            del queries[:]
+            start = time.time()
+            count = len(list(get_resources()))
+            print('%12s %10d %10d %10.2f' % (name, count, len(queries),
+                                             time.time() - start))
+    finally:
+        if path:
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark of the statistics rollups of the SQL storage driver.
+
+Records samples of the given number of resources every ten minutes over the
+given number of days with the rollups enabled, then times hourly and daily
+statistics over the whole time range, answered from the rollups and from the
+samples.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_sql_statistics.py --url mysql+pymysql://root@localhost/db \
+    --resources 100 --days 30
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+from oslo_config import cfg
+from oslo_utils import timeutils
+
+from ceilometer import storage
+from ceilometer.storage import impl_sqlalchemy
+
+
+START = datetime.datetime(2015, 1, 1)
+
+
+def fill(conn, resources, days):
+    for n in range(days * 24 * 6):
+        timestamp = START + datetime.timedelta(minutes=10 * n)
+        conn.record_metering_data_batch([{
+            'counter_name': 'cpu_util', 'counter_type': 'gauge',
+            'counter_unit': '%', 'counter_volume': (n + i) % 100,
+            'user_id': 'user-%d' % (i % 10), 'project_id': 'project',
+            'resource_id': 'resource-%d' % i, 'source': 'openstack',
+            'timestamp': timestamp, 'resource_metadata': {},
+            'message_signature': '', 'message_id': '%d-%d' % (i, n)}
+            for i in range(resources)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url',
+                        help='Database URL, a temporary sqlite database '
+                             'by default.')
+    parser.add_argument('--resources', type=int, default=100,
+                        help='Number of resources.')
+    parser.add_argument('--days', type=int, default=30,
+                        help='Number of days of samples.')
+    args = parser.parse_args()
+
+    path = None
+    url = args.url
+    if not url:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        url = 'sqlite:///%s' % path
+        # the temporary database does not need to survive a crash
+        cfg.CONF.set_override('sqlite_synchronous', False, group='database')
+    cfg.CONF.set_override('sql_rollup_periods', ['300', '3600', '86400'],
+                          group='database')
+    try:
+        conn = impl_sqlalchemy.Connection(url)
+        conn.upgrade()
+        conn.clear()
+        # start the rollups with the samples
+        timeutils.set_time_override(START - datetime.timedelta(seconds=1))
+        start = time.time()
+        fill(conn, args.resources, args.days)
+        timeutils.clear_time_override()
+        print('%d samples recorded in %.1f s' % (
+            args.resources * args.days * 24 * 6, time.time() - start))
+
+        sample_filter = storage.SampleFilter(meter='cpu_util',
+                                             start_timestamp=START)
+        print('%10s %10s %14s %14s' % ('period', 'results', 'rollups (s)',
+                                       'samples (s)'))
+        rollup_periods = conn._rollup_periods
+        for period in (3600, 86400):
+            timings = []
+            # without rollup periods, the samples are queried
+            for periods in (rollup_periods, []):
+                conn._rollup_periods = periods
+                start = time.time()
+                count = len(list(conn.get_meter_statistics(
+                    sample_filter, period=period)))
+                timings.append(time.time() - start)
+            conn._rollup_periods = rollup_periods
+            print('%10d %10d %14.2f %14.2f' % (period, count, timings[0],
+                                               timings[1]))
+    finally:
+        if path:
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()